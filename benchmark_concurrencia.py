@@ -0,0 +1,181 @@
+# Benchmark de concurrencia lectura/escritura sobre erp_autobuses.db
+# Compara los perfiles de almacenamiento de prueba.py ejecutando al mismo tiempo:
+# - un hilo que vende boletos (mismas sentencias que SistemaERP.vender_boletos)
+# - varios hilos que cargan transacciones (misma consulta que SistemaERP.cargar_transacciones)
+#
+# Uso:
+#   python benchmark_concurrencia.py [--ventas 500] [--lectores 3] [--perfiles defecto rendimiento]
+#                                    [--vendedores 4] [--escritor]
+#
+# Con --escritor las ventas se encolan en EscritorLibro (un solo hilo escribe
+# boletos y finanzas) en lugar de que cada vendedor abra su propia transacción.
+
+import argparse
+import datetime
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from prueba import (SistemaERP, GestorConexiones, EscritorLibro, PERFILES_ALMACENAMIENTO,
+                    perfil_almacenamiento, registrar_movimiento, reservar_asientos)
+
+
+def preparar_bd(ruta, perfil):
+    """Crea el esquema completo en una base vacía y agrega una ruta con horario"""
+    db = GestorConexiones(ruta, perfil_almacenamiento(perfil))
+    erp = SistemaERP.__new__(SistemaERP)  # Sin ventana Tk: solo se usa el esquema
+    erp.db = db
+    erp.crear_base_datos()
+
+    with db.transaccion() as conn:
+        conn.execute("""
+            INSERT INTO autobuses (modelo, marca, año, capacidad, estado)
+            VALUES ('9800', 'Volvo', 2024, 10000, 'Nuevo')
+        """)
+        conn.execute("""
+            INSERT INTO rutas (origen, destino, distancia, tiempo_estimado, precio_boleto)
+            VALUES ('CDMX', 'Guadalajara', 540, '7h', 850)
+        """)
+        conn.execute("""
+            INSERT INTO horarios (ruta_id, autobus_id, hora_salida, hora_llegada, dias_semana)
+            VALUES (1, 1, '08:00', '15:00', 'L-D')
+        """)
+    return db
+
+
+def vender(db, ventas, asientos_por_venta, resultado, libro=None, vendedor=0):
+    """Replica las sentencias de vender_boletos en un bucle"""
+    latencias = []
+    errores = 0
+    # Cada vendedor usa su propia fecha de viaje para no chocar en los asientos
+    fecha_viaje = (datetime.date.today() + datetime.timedelta(days=vendedor)).strftime("%Y-%m-%d")
+    asiento = 0
+    for _ in range(ventas):
+        inicio = time.perf_counter()
+        conn = db.conectar()
+        try:
+            cursor = conn.cursor()
+            numeros = list(range(asiento + 1, asiento + asientos_por_venta + 1))
+            asiento += asientos_por_venta
+            fecha_compra = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+            def insertar_boletos(cursor_escritura):
+                reservar_asientos(cursor_escritura, 1, fecha_viaje, numeros,
+                                  "Cliente", "Benchmark", fecha_compra, 850.0)
+
+            ingreso = 850.0 * len(numeros)
+            if libro is not None:
+                libro.enviar(fecha_compra, "Venta benchmark", ingreso=ingreso,
+                             operacion=insertar_boletos).result()
+            else:
+                insertar_boletos(cursor)
+                registrar_movimiento(cursor, fecha_compra, "Venta benchmark", ingreso=ingreso)
+                conn.commit()
+            latencias.append(time.perf_counter() - inicio)
+        except sqlite3.OperationalError:
+            conn.rollback()
+            errores += 1
+        finally:
+            conn.close()
+    resultado.setdefault('ventas', []).extend(latencias)
+    resultado['errores_venta'] = resultado.get('errores_venta', 0) + errores
+
+
+def leer(db, detener, resultado):
+    """Replica la consulta de cargar_transacciones hasta que termine la venta"""
+    latencias = []
+    errores = 0
+    while not detener.is_set():
+        inicio = time.perf_counter()
+        conn = db.conectar()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, fecha, concepto, ingreso, egreso, saldo_actual
+                FROM finanzas
+                ORDER BY id DESC LIMIT 200
+            """)
+            cursor.fetchall()
+            latencias.append(time.perf_counter() - inicio)
+        except sqlite3.OperationalError:
+            errores += 1
+        finally:
+            conn.close()
+    resultado.setdefault('lecturas', []).extend(latencias)
+    resultado['errores_lectura'] = resultado.get('errores_lectura', 0) + errores
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+def ejecutar(perfil, ventas, lectores, asientos_por_venta, vendedores=1, escritor=False):
+    with tempfile.TemporaryDirectory() as directorio:
+        db = preparar_bd(os.path.join(directorio, 'benchmark.db'), perfil)
+        libro = EscritorLibro(db) if escritor else None
+        resultado = {}
+        detener = threading.Event()
+        resultado_lectura = {}
+        hilos_lectura = [
+            threading.Thread(target=leer, args=(db, detener, resultado_lectura))
+            for _ in range(lectores)
+        ]
+        hilos_venta = [
+            threading.Thread(target=vender, args=(db, ventas // vendedores, asientos_por_venta,
+                                                  resultado, libro, n))
+            for n in range(vendedores)
+        ]
+        inicio = time.perf_counter()
+        for hilo in hilos_lectura + hilos_venta:
+            hilo.start()
+        for hilo in hilos_venta:
+            hilo.join()
+        duracion = time.perf_counter() - inicio
+        detener.set()
+        for hilo in hilos_lectura:
+            hilo.join()
+        if libro is not None:
+            libro.detener()
+        db.cerrar_todas()
+
+    lecturas = resultado_lectura.get('lecturas', [])
+    return {
+        'perfil': perfil + (' +libro' if escritor else ''),
+        'duracion_s': duracion,
+        'ventas_por_s': len(resultado['ventas']) / duracion if duracion else 0.0,
+        'venta_p50_ms': statistics.median(resultado['ventas']) * 1000 if resultado['ventas'] else 0.0,
+        'venta_p95_ms': percentil(resultado['ventas'], 95) * 1000,
+        'lecturas_por_s': len(lecturas) / duracion if duracion else 0.0,
+        'lectura_p95_ms': percentil(lecturas, 95) * 1000,
+        'errores': resultado.get('errores_venta', 0) + resultado_lectura.get('errores_lectura', 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de concurrencia venta/lectura por perfil de almacenamiento")
+    parser.add_argument('--ventas', type=int, default=500, help="Número de ventas a ejecutar")
+    parser.add_argument('--asientos', type=int, default=2, help="Asientos por venta")
+    parser.add_argument('--lectores', type=int, default=3, help="Hilos leyendo transacciones en paralelo")
+    parser.add_argument('--vendedores', type=int, default=1, help="Hilos vendiendo en paralelo")
+    parser.add_argument('--escritor', action='store_true',
+                        help="Encolar las ventas en EscritorLibro en lugar de escribir desde cada hilo")
+    parser.add_argument('--perfiles', nargs='+', default=list(PERFILES_ALMACENAMIENTO),
+                        choices=list(PERFILES_ALMACENAMIENTO))
+    args = parser.parse_args()
+
+    print(f"{'Perfil':<18} {'Ventas/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'Lect/s':>10} {'Lect p95':>9} {'Errores':>8}")
+    for perfil in args.perfiles:
+        r = ejecutar(perfil, args.ventas, args.lectores, args.asientos, args.vendedores, args.escritor)
+        print(f"{r['perfil']:<18} {r['ventas_por_s']:>10.1f} {r['venta_p50_ms']:>8.2f} {r['venta_p95_ms']:>8.2f} "
+              f"{r['lecturas_por_s']:>10.1f} {r['lectura_p95_ms']:>9.2f} {r['errores']:>8}")
+
+
+if __name__ == "__main__":
+    main()
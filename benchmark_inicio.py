@@ -0,0 +1,76 @@
+# Benchmark del tiempo de inicio de prueba.py con `python -X importtime`
+# Importa el módulo en procesos nuevos (como al encender una taquilla) y mide
+# el tiempo acumulado de importación. Comprueba además que matplotlib,
+# tkcalendar y PIL no se carguen al iniciar: se importan la primera vez que
+# se muestra un gráfico, un calendario o el logo.
+# Termina con código 1 si alguna de ellas se importa al inicio o si la
+# mediana supera --limite-ms.
+#
+# Uso:
+#   python benchmark_inicio.py [--repeticiones 5] [--limite-ms 400] [--mostrar 10]
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Bibliotecas que la pantalla de login no necesita
+DIFERIDAS = ('matplotlib', 'tkcalendar', 'PIL')
+
+
+def medir_importacion(modulo='prueba'):
+    """Importa `modulo` en un proceso nuevo y devuelve {paquete: (propio_us, acumulado_us)}"""
+    proceso = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True)
+    tiempos = {}
+    for linea in proceso.stderr.splitlines():
+        if not linea.startswith('import time:') or 'self [us]' in linea:
+            continue
+        propio, acumulado, nombre = linea[len('import time:'):].split('|')
+        tiempos[nombre.strip()] = (int(propio), int(acumulado))
+    return tiempos
+
+
+def cargadas_al_inicio(tiempos):
+    """Paquetes de DIFERIDAS que aparecen en la importación"""
+    return sorted({nombre.split('.')[0] for nombre in tiempos
+                   if nombre.split('.')[0] in DIFERIDAS})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de importación de prueba.py al iniciar")
+    parser.add_argument('--repeticiones', type=int, default=5, help="Procesos a medir")
+    parser.add_argument('--limite-ms', type=float, default=None,
+                        help="Falla si la mediana del tiempo de importación supera este valor")
+    parser.add_argument('--mostrar', type=int, default=10, help="Importaciones más lentas a listar")
+    args = parser.parse_args()
+
+    # La primera importación compila el .pyc; no se cuenta
+    medir_importacion()
+    mediciones = [medir_importacion() for _ in range(args.repeticiones)]
+    totales_ms = [m['prueba'][1] / 1000 for m in mediciones]
+    mediana = statistics.median(totales_ms)
+
+    print(f"Importación de prueba: mediana {mediana:.1f} ms "
+          f"(mín {min(totales_ms):.1f}, máx {max(totales_ms):.1f}, {args.repeticiones} procesos)")
+    ultima = mediciones[-1]
+    print(f"\n{'Acumulado ms':>12} {'Propio ms':>10}  Módulo")
+    for nombre, (propio, acumulado) in sorted(ultima.items(), key=lambda e: -e[1][1])[:args.mostrar]:
+        print(f"{acumulado / 1000:>12.1f} {propio / 1000:>10.1f}  {nombre}")
+
+    fallas = []
+    cargadas = cargadas_al_inicio(ultima)
+    if cargadas:
+        fallas.append(f"se importan al inicio: {', '.join(cargadas)}")
+    if args.limite_ms is not None and mediana > args.limite_ms:
+        fallas.append(f"la mediana {mediana:.1f} ms supera el límite de {args.limite_ms:.1f} ms")
+    for falla in fallas:
+        print(f"\nFALLA: {falla}")
+    sys.exit(1 if fallas else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+# Benchmark de carga de la venta de boletos (disponibilidad -> venta)
+# Crea una base temporal con N rutas, autobuses y horarios y lanza agentes
+# concurrentes que repiten el flujo de la pantalla de ventas:
+# - actualizar_asientos_disponibles: asientos libres menos los retenidos por otras terminales
+# - (con --retener) apartar los asientos elegidos, como al seleccionarlos en la lista
+# - vender_boletos: VentasService.vender_boletos con los asientos elegidos
+# Reporta latencias p50/p95/p99, boletos por segundo, tasa de conflictos
+# (asientos vendidos o apartados por otro agente entre la consulta y la venta)
+# y la consistencia final del libro de finanzas, y guarda todo en JSON para
+# comparar corridas entre cambios.
+#
+# Modos:
+#   directo  cada agente es una taquilla con su propio MotorAsientos y EscritorLibro
+#            sobre el mismo archivo (como varias instancias de prueba.py)
+#   api      los agentes son clientes (ClienteAPI) de servidor_api.py levantado en este proceso
+#
+# Uso:
+#   python benchmark_ventas.py [--modo directo|api] [--agentes 8] [--ventas 2000] [--rutas 5]
+#                              [--horarios-por-ruta 2] [--capacidad 40] [--dias 3]
+#                              [--asientos-max 3] [--retener] [--perfil rendimiento]
+#                              [--semilla 1] [--salida resultados_ventas.json]
+#
+# Termina con código 1 si el libro de finanzas no cuadra al final.
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+
+from benchmark_concurrencia import percentil
+from prueba import (SistemaERP, GestorConexiones, EscritorLibro, MotorAsientos, RetencionesAsientos,
+                    VentasService, ClienteAPI, AsientosOcupados, PERFILES_ALMACENAMIENTO,
+                    perfil_almacenamiento, leer_saldo, verificar_acumulados, verificar_totales_pasajeros)
+
+
+def sembrar(db, rutas, horarios_por_ruta, capacidad, rng):
+    """Agrega rutas, autobuses y horarios; devuelve {horario_id: precio del boleto}"""
+    precios = {}
+    with db.transaccion() as conn:
+        for n in range(rutas):
+            precio = float(rng.randrange(300, 1500, 50))
+            ruta_id = conn.execute("""
+                INSERT INTO rutas (origen, destino, distancia, tiempo_estimado, precio_boleto)
+                VALUES (?, ?, ?, ?, ?)
+            """, (f"Origen {n}", f"Destino {n}", rng.randint(100, 900), "6h", precio)).lastrowid
+            for h in range(horarios_por_ruta):
+                autobus_id = conn.execute("""
+                    INSERT INTO autobuses (modelo, marca, año, capacidad, estado)
+                    VALUES ('9800', 'Volvo', 2024, ?, 'Nuevo')
+                """, (capacidad,)).lastrowid
+                horario_id = conn.execute("""
+                    INSERT INTO horarios (ruta_id, autobus_id, hora_salida, hora_llegada, dias_semana)
+                    VALUES (?, ?, ?, ?, 'L-D')
+                """, (ruta_id, autobus_id, f"{6 + h:02d}:00", f"{12 + h:02d}:00")).lastrowid
+                precios[horario_id] = precio
+    return precios
+
+
+class Taquilla:
+    """Lo que una instancia de prueba.py usa para vender (modo directo)"""
+
+    def __init__(self, db):
+        self.libro = EscritorLibro(db)
+        self.asientos = MotorAsientos(db)
+        self.retenciones = RetencionesAsientos(db)
+        self.ventas = VentasService(db, self.libro, self.asientos, self.retenciones)
+
+    def retenidos_por_otros(self, horario_id, fecha_viaje):
+        return self.retenciones.retenidos_por_otros(horario_id, fecha_viaje)
+
+    def cerrar(self):
+        self.libro.detener()
+
+
+class TaquillaRemota:
+    """Taquilla que consulta y vende a través del servidor de ventas (modo api)"""
+
+    def __init__(self, url):
+        self.asientos = self.retenciones = self.ventas = ClienteAPI(url)
+
+    def retenidos_por_otros(self, horario_id, fecha_viaje):
+        return self.retenciones.retenidos_por_otros(horario_id, fecha_viaje)
+
+    def cerrar(self):
+        self.retenciones.detener()
+
+
+def agente(taquilla, intentos, viajes, precios, asientos_max, retener, rng, resultado):
+    """Repite disponibilidad -> (retención) -> venta y acumula métricas en `resultado`"""
+    latencias, latencias_venta = [], []
+    ventas = boletos = conflictos = agotados = errores = 0
+    for _ in range(intentos):
+        horario_id, fecha_viaje = rng.choice(viajes)
+        inicio = time.perf_counter()
+        try:
+            retenidos = taquilla.retenidos_por_otros(horario_id, fecha_viaje)
+            libres = [a for a in taquilla.asientos.libres(horario_id, fecha_viaje) if a not in retenidos]
+            cantidad = rng.randint(1, asientos_max)
+            if len(libres) < cantidad:
+                agotados += 1
+                continue
+            elegidos = rng.sample(libres, cantidad)
+            if retener and taquilla.retenciones.retener(horario_id, fecha_viaje, elegidos):
+                conflictos += 1
+                continue
+            inicio_venta = time.perf_counter()
+            venta = taquilla.ventas.vender_boletos("Agente", f"Benchmark {rng.randint(1, 500)}",
+                                                   horario_id, fecha_viaje, elegidos, precios[horario_id])
+            fin = time.perf_counter()
+            latencias.append(fin - inicio)
+            latencias_venta.append(fin - inicio_venta)
+            ventas += 1
+            boletos += len(venta.asientos)
+        except AsientosOcupados:
+            conflictos += 1
+            if retener:
+                taquilla.retenciones.soltar(horario_id, fecha_viaje)
+        except Exception:
+            errores += 1
+    with resultado['lock']:
+        resultado['latencias'].extend(latencias)
+        resultado['latencias_venta'].extend(latencias_venta)
+        for clave, valor in (('ventas', ventas), ('boletos', boletos), ('conflictos', conflictos),
+                             ('agotados', agotados), ('errores', errores)):
+            resultado[clave] += valor
+
+
+def verificar_libro(conn, boletos_vendidos):
+    """Comprueba que saldo, movimientos, boletos y acumulados cuadren; devuelve la lista de fallas"""
+    fallas = []
+    saldo = leer_saldo(conn)
+    ultimo = conn.execute("SELECT saldo_actual FROM finanzas ORDER BY id DESC LIMIT 1").fetchone()
+    ingresos, egresos = conn.execute("SELECT COALESCE(SUM(ingreso), 0), COALESCE(SUM(egreso), 0) FROM finanzas").fetchone()
+    boletos, total_boletos = conn.execute("SELECT COUNT(*), COALESCE(SUM(precio), 0) FROM boletos").fetchone()
+    ventas = conn.execute("SELECT COALESCE(SUM(ingreso), 0) FROM finanzas WHERE concepto LIKE 'Venta de %'").fetchone()[0]
+    if ultimo is not None and round(ultimo[0], 2) != round(saldo, 2):
+        fallas.append(f"saldo_finanzas {saldo:.2f} != último saldo_actual {ultimo[0]:.2f}")
+    if round(ingresos - egresos, 2) != round(saldo, 2):
+        fallas.append(f"saldo {saldo:.2f} != ingresos - egresos {ingresos - egresos:.2f}")
+    if round(total_boletos, 2) != round(ventas, 2):
+        fallas.append(f"boletos ${total_boletos:.2f} != ingresos por venta ${ventas:.2f}")
+    if boletos != boletos_vendidos:
+        fallas.append(f"{boletos} boletos en la base != {boletos_vendidos} vendidos por los agentes")
+    fallas.extend(f"acumulado {d[0]} {d[1]} no cuadra" for d in verificar_acumulados(conn))
+    fallas.extend(f"totales del pasajero {d[0]} no cuadran" for d in verificar_totales_pasajeros(conn))
+    return fallas
+
+
+def levantar_servidor(db):
+    """Inicia servidor_api en un hilo con su propio bucle; devuelve (url, detener)"""
+    import servidor_api
+
+    servidor = servidor_api.ServidorVentas(db)
+    loop = asyncio.new_event_loop()
+    puerto = []
+    listo = threading.Event()
+
+    def correr():
+        asyncio.set_event_loop(loop)
+        tarea = loop.create_task(servidor_api.servir(servidor, '127.0.0.1', 0,
+                                                     lambda p: (puerto.append(p), listo.set())))
+        try:
+            loop.run_until_complete(tarea)
+        except asyncio.CancelledError:
+            pass
+
+    hilo = threading.Thread(target=correr, name="servidor_api", daemon=True)
+    hilo.start()
+    listo.wait()
+
+    def detener():
+        loop.call_soon_threadsafe(lambda: [t.cancel() for t in asyncio.all_tasks(loop)])
+        hilo.join()
+        servidor.grupo.shutdown(wait=True)
+        servidor.libro.detener()
+
+    return f"http://127.0.0.1:{puerto[0]}", detener
+
+
+def version_codigo():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def ejecutar(args):
+    rng = random.Random(args.semilla)
+    with tempfile.TemporaryDirectory() as directorio:
+        db = GestorConexiones(os.path.join(directorio, 'ventas.db'), perfil_almacenamiento(args.perfil))
+        erp = SistemaERP.__new__(SistemaERP)  # Sin ventana Tk: solo se usa el esquema
+        erp.db = db
+        erp.crear_base_datos()
+        precios = sembrar(db, args.rutas, args.horarios_por_ruta, args.capacidad, rng)
+        hoy = datetime.date.today()
+        viajes = [(h, (hoy + datetime.timedelta(days=d)).strftime("%Y-%m-%d"))
+                  for h in precios for d in range(1, args.dias + 1)]
+
+        detener_servidor = None
+        if args.modo == 'api':
+            url, detener_servidor = levantar_servidor(db)
+            taquillas = [TaquillaRemota(url) for _ in range(args.agentes)]
+        else:
+            taquillas = [Taquilla(db) for _ in range(args.agentes)]
+
+        resultado = {'lock': threading.Lock(), 'latencias': [], 'latencias_venta': [],
+                     'ventas': 0, 'boletos': 0, 'conflictos': 0, 'agotados': 0, 'errores': 0}
+        hilos = [
+            threading.Thread(target=agente, args=(taquilla, args.ventas // args.agentes, viajes, precios,
+                                                  args.asientos_max, args.retener,
+                                                  random.Random(rng.random()), resultado))
+            for taquilla in taquillas
+        ]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.perf_counter() - inicio
+
+        for taquilla in taquillas:
+            taquilla.cerrar()
+        if detener_servidor is not None:
+            detener_servidor()
+        fallas = verificar_libro(db.obtener(), resultado['boletos'])
+        db.cerrar_todas()
+
+    intentos = resultado['ventas'] + resultado['conflictos']
+    latencias = resultado['latencias']
+    ms = lambda valores, p: round(percentil(valores, p) * 1000, 3)
+    return {
+        'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+        'version': version_codigo(),
+        'configuracion': {clave: valor for clave, valor in vars(args).items() if clave != 'salida'},
+        'duracion_s': round(duracion, 3),
+        'ventas': resultado['ventas'],
+        'boletos': resultado['boletos'],
+        'ventas_por_s': round(resultado['ventas'] / duracion, 1) if duracion else 0.0,
+        'boletos_por_s': round(resultado['boletos'] / duracion, 1) if duracion else 0.0,
+        'flujo_ms': {'p50': ms(latencias, 50), 'p95': ms(latencias, 95), 'p99': ms(latencias, 99),
+                     'media': round(statistics.fmean(latencias) * 1000, 3) if latencias else 0.0},
+        'venta_ms': {'p50': ms(resultado['latencias_venta'], 50), 'p95': ms(resultado['latencias_venta'], 95),
+                     'p99': ms(resultado['latencias_venta'], 99)},
+        'conflictos': resultado['conflictos'],
+        'tasa_conflictos': round(resultado['conflictos'] / intentos, 4) if intentos else 0.0,
+        'agotados': resultado['agotados'],
+        'errores': resultado['errores'],
+        'libro_consistente': not fallas,
+        'fallas_libro': fallas,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga del flujo disponibilidad -> venta")
+    parser.add_argument('--modo', choices=['directo', 'api'], default='directo')
+    parser.add_argument('--agentes', type=int, default=8, help="Agentes vendiendo en paralelo")
+    parser.add_argument('--ventas', type=int, default=2000, help="Intentos de venta en total")
+    parser.add_argument('--rutas', type=int, default=5)
+    parser.add_argument('--horarios-por-ruta', type=int, default=2)
+    parser.add_argument('--capacidad', type=int, default=40, help="Asientos por autobús")
+    parser.add_argument('--dias', type=int, default=3, help="Fechas de viaje distintas por horario")
+    parser.add_argument('--asientos-max', type=int, default=3, help="Máximo de asientos por venta")
+    parser.add_argument('--retener', action='store_true',
+                        help="Apartar los asientos elegidos antes de vender, como la pantalla de ventas")
+    parser.add_argument('--perfil', choices=list(PERFILES_ALMACENAMIENTO), default=None)
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--salida', default='resultados_ventas.json',
+                        help="Archivo JSON al que se agrega el resultado de la corrida")
+    args = parser.parse_args()
+
+    r = ejecutar(args)
+    print(f"Modo {args.modo}, {args.agentes} agentes: {r['ventas']} ventas / {r['boletos']} boletos "
+          f"en {r['duracion_s']:.2f} s")
+    print(f"  {r['ventas_por_s']:.1f} ventas/s, {r['boletos_por_s']:.1f} boletos/s")
+    print(f"  flujo p50 {r['flujo_ms']['p50']:.2f} ms, p95 {r['flujo_ms']['p95']:.2f} ms, "
+          f"p99 {r['flujo_ms']['p99']:.2f} ms")
+    print(f"  conflictos {r['conflictos']} ({r['tasa_conflictos']:.1%}), agotados {r['agotados']}, "
+          f"errores {r['errores']}")
+    print(f"  libro de finanzas: {'consistente' if r['libro_consistente'] else 'NO CUADRA'}")
+    for falla in r['fallas_libro']:
+        print(f"    {falla}")
+
+    # Las corridas se acumulan en una lista para compararlas
+    corridas = []
+    if os.path.exists(args.salida):
+        with open(args.salida, encoding='utf-8') as archivo:
+            corridas = json.load(archivo)
+    corridas.append(r)
+    with open(args.salida, 'w', encoding='utf-8') as archivo:
+        json.dump(corridas, archivo, ensure_ascii=False, indent=2)
+    print(f"Resultado agregado a {args.salida}")
+    raise SystemExit(0 if r['libro_consistente'] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,778 @@
+# Generador de datos sintéticos con el esquema de prueba.py
+# Llena todas las tablas de crear_base_datos (rutas, horarios, autobuses,
+# empleados, usuarios, computadoras, proveedores, compras, salidas e
+# inventario, boletos, pagos y finanzas) con varios años de operación:
+# ventas por día con temporadas y fines de semana, compras y salidas de
+# almacén, nómina mensual y movimientos varios. Las tablas materializadas
+# (saldo, existencias, pasajeros, acumulados diarios) quedan cuadradas con
+# el historial, igual que si cada operación se hubiera hecho en la taquilla.
+#
+# Con la misma --semilla, escala y --hasta el archivo generado es idéntico.
+# Escribe con executemany en transacciones grandes y quita los índices
+# secundarios durante la carga (se vuelven a crear al final, una sola vez).
+# Con --nueva escribe directo a un archivo nuevo sin journal ni fsync; sin
+# --nueva agrega los datos a --bd (la aplicación no debe estar abierta).
+#
+# Uso:
+#   python generar_datos.py --bd erp_sintetica.db --nueva [--escala pequeña]
+#                           [--semilla 7] [--años 3] [--hasta 2025-12-31]
+#                           [--rutas 500] [--horarios 20000] [--boletos 50000000]
+#                           [--empleados 2000] [--compras 50000] [--salidas 30000]
+#                           [--lote 200000] [--transaccion 2000000] [--verificar]
+
+import argparse
+import datetime
+import hashlib
+import math
+import os
+import random
+import re
+import sys
+import time
+
+from prueba import (SistemaERP, GestorConexiones, DB_PATH, perfil_almacenamiento, leer_saldo,
+                    plegar_texto, incrementar_version, reconstruir_existencias,
+                    verificar_acumulados, verificar_totales_pasajeros, verificar_existencias)
+
+# Tamaños predefinidos; cualquier opción de escala indicada aparte tiene prioridad
+ESCALAS = {
+    'pequeña': dict(rutas=20, horarios=200, autobuses=80, boletos=50_000, pasajeros=5_000,
+                    empleados=60, proveedores=12, compras=600, salidas=400, movimientos=300, años=1),
+    'mediana': dict(rutas=120, horarios=3_000, autobuses=1_000, boletos=3_000_000, pasajeros=200_000,
+                    empleados=400, proveedores=40, compras=8_000, salidas=5_000, movimientos=3_000, años=2),
+    'produccion': dict(rutas=500, horarios=20_000, autobuses=6_500, boletos=50_000_000,
+                       pasajeros=600_000, empleados=2_000, proveedores=120, compras=50_000,
+                       salidas=30_000, movimientos=20_000, años=3),
+}
+
+# (ciudad, latitud, longitud)
+CIUDADES = [
+    ("Ciudad de México", 19.43, -99.13), ("Guadalajara", 20.67, -103.35), ("Monterrey", 25.69, -100.32),
+    ("Puebla", 19.04, -98.21), ("Querétaro", 20.59, -100.39), ("León", 21.12, -101.68),
+    ("San Luis Potosí", 22.15, -100.98), ("Aguascalientes", 21.88, -102.29), ("Morelia", 19.70, -101.19),
+    ("Toluca", 19.29, -99.66), ("Pachuca", 20.10, -98.76), ("Cuernavaca", 18.92, -99.23),
+    ("Acapulco", 16.85, -99.88), ("Oaxaca", 17.07, -96.73), ("Veracruz", 19.17, -96.13),
+    ("Xalapa", 19.54, -96.91), ("Villahermosa", 17.99, -92.93), ("Mérida", 20.97, -89.62),
+    ("Cancún", 21.16, -86.85), ("Campeche", 19.85, -90.53), ("Tuxtla Gutiérrez", 16.75, -93.12),
+    ("San Cristóbal de las Casas", 16.74, -92.64), ("Zacatecas", 22.77, -102.58), ("Durango", 24.02, -104.67),
+    ("Torreón", 25.54, -103.41), ("Saltillo", 25.42, -101.00), ("Chihuahua", 28.63, -106.07),
+    ("Ciudad Juárez", 31.69, -106.42), ("Hermosillo", 29.07, -110.96), ("Culiacán", 24.81, -107.39),
+    ("Mazatlán", 23.25, -106.41), ("Tepic", 21.50, -104.89), ("Puerto Vallarta", 20.65, -105.23),
+    ("Colima", 19.24, -103.72), ("Manzanillo", 19.05, -104.32), ("Tampico", 22.23, -97.86),
+    ("Ciudad Victoria", 23.74, -99.15), ("Reynosa", 26.09, -98.28), ("Nuevo Laredo", 27.48, -99.52),
+    ("Matamoros", 25.87, -97.50), ("Celaya", 20.52, -100.81), ("Irapuato", 20.68, -101.35),
+    ("Guanajuato", 21.02, -101.26), ("San Miguel de Allende", 20.91, -100.74), ("Tlaxcala", 19.32, -98.24),
+]
+
+NOMBRES = [
+    "José", "Juan", "Luis", "Carlos", "Jorge", "Miguel", "Alejandro", "Francisco", "Fernando", "Ricardo",
+    "Eduardo", "Roberto", "Javier", "Daniel", "Sergio", "Arturo", "Raúl", "Manuel", "Antonio", "Héctor",
+    "Óscar", "Andrés", "Diego", "Emilio", "Rodrigo", "Pablo", "Iván", "Ángel", "Tomás", "Rubén",
+    "María", "Guadalupe", "Ana", "Laura", "Patricia", "Verónica", "Gabriela", "Mónica", "Claudia", "Adriana",
+    "Alejandra", "Leticia", "Rosa", "Elena", "Sofía", "Valeria", "Fernanda", "Daniela", "Mariana", "Lucía",
+    "Carmen", "Silvia", "Beatriz", "Norma", "Irene", "Ximena", "Paola", "Regina", "Renata", "Itzel",
+    "Juan Carlos", "José Luis", "Luis Fernando", "Miguel Ángel", "Juan Pablo", "José Antonio",
+    "María José", "Ana Laura", "María Fernanda", "Rosa María", "Ana Sofía", "María Elena",
+]
+
+APELLIDOS = [
+    "Hernández", "García", "Martínez", "López", "González", "Pérez", "Rodríguez", "Sánchez", "Ramírez",
+    "Cruz", "Flores", "Gómez", "Morales", "Vázquez", "Reyes", "Jiménez", "Torres", "Díaz", "Gutiérrez",
+    "Ruiz", "Mendoza", "Aguilar", "Ortiz", "Moreno", "Castillo", "Romero", "Álvarez", "Méndez", "Chávez",
+    "Rivera", "Juárez", "Ramos", "Domínguez", "Herrera", "Medina", "Castro", "Vargas", "Guzmán",
+    "Velázquez", "Muñoz", "Rojas", "Contreras", "Salazar", "Luna", "Ortega", "Santiago", "Guerrero",
+    "Estrada", "Bautista", "Cortés", "Soto", "Alvarado", "Espinoza", "Lara", "Ávila", "Ríos", "Cervantes",
+    "Silva", "Delgado", "Vega", "Márquez", "Sandoval", "Fernández", "León", "Carrillo", "Mejía", "Solís",
+    "Núñez", "Rosas", "Valdez", "Ibarra", "Campos", "Navarro", "Cabrera", "Pacheco", "Paredes", "Zúñiga",
+]
+
+# (marca, modelo, capacidad, precio)
+MODELOS_AUTOBUS = [
+    ("Volvo", "9700", 44, 4_300_000), ("Volvo", "9800", 50, 5_100_000),
+    ("Mercedes-Benz", "Irizar-i6", 44, 4_100_000), ("Mercedes-Benz", "Irizar-i8", 47, 4_700_000),
+    ("Scania", "Marcopolo-G7", 42, 3_900_000), ("Mercedes-Benz", "Boxer-OF", 40, 2_600_000),
+]
+
+# Catálogo de compras: tipo de producto -> (tipo de proveedor, peso, [(descripción, precio, cantidad máx.)])
+CATALOGO_COMPRAS = {
+    "Autobús": ("Autobuses", 1, [(f"{marca} {modelo}", precio, 2)
+                                 for marca, modelo, _, precio in MODELOS_AUTOBUS]),
+    "Computadora": ("Computadoras", 8, [
+        ("HP ProBook 450 G10", 21_500, 10), ("HP EliteDesk 800 G6", 17_900, 10),
+        ("Dell Latitude 5440", 24_800, 8), ("Dell OptiPlex 7010", 16_400, 12),
+        ("Lenovo ThinkPad E14", 19_900, 6),
+    ]),
+    "Productos de limpieza": ("Productos de limpieza", 50, [
+        ("Detergente industrial 20 L", 640, 60), ("Cloro concentrado 20 L", 310, 80),
+        ("Desengrasante para motor 19 L", 890, 40), ("Toallas de papel (caja de 6 rollos)", 420, 120),
+        ("Bolsas para basura (paquete de 100)", 180, 200), ("Aromatizante para cabina 4 L", 260, 50),
+    ]),
+    "Otros": ("Otros", 41, [
+        ("Llanta Michelin X Multi Z 295/80R22.5", 9_400, 24), ("Aceite para motor 15W40 (tambor 208 L)", 8_900, 6),
+        ("Filtro de aire Donaldson", 1_350, 30), ("Balatas traseras (juego)", 2_700, 20),
+        ("Batería 31H 1000 CCA", 3_900, 12), ("Uniforme de conductor", 850, 60),
+    ]),
+}
+
+# (puesto, peso, salario mínimo, salario máximo)
+PUESTOS = [
+    ("Conductor", 55, 14_000, 22_000), ("Agente Ventas", 18, 9_000, 14_000),
+    ("Agente Logística", 6, 10_000, 16_000), ("Agente Inventario", 5, 9_000, 13_000),
+    ("Agente Finanzas", 5, 12_000, 19_000), ("Agente Compras", 4, 11_000, 16_000),
+    ("Agente RH", 4, 11_000, 16_000), ("Agente Proveedores", 3, 10_000, 15_000),
+]
+
+# Días de operación -> días de la semana válidos (0 = lunes)
+DIAS_OPERACION = [
+    ("Lunes-Domingo", 50, (0, 1, 2, 3, 4, 5, 6)), ("Lunes-Viernes", 30, (0, 1, 2, 3, 4)),
+    ("Viernes-Domingo", 15, (4, 5, 6)), ("Sábado-Domingo", 5, (5, 6)),
+]
+
+# (concepto, es ingreso, monto mínimo, monto máximo)
+MOVIMIENTOS_VARIOS = [
+    ("Renta de local comercial en terminal", True, 8_000, 35_000),
+    ("Servicio de paquetería", True, 1_500, 20_000),
+    ("Publicidad en autobuses", True, 10_000, 60_000),
+    ("Pago de luz", False, 6_000, 40_000), ("Pago de agua", False, 1_500, 9_000),
+    ("Diésel", False, 40_000, 250_000), ("Casetas de peaje", False, 5_000, 60_000),
+    ("Mantenimiento de terminal", False, 3_000, 45_000),
+]
+
+DESTINOS_SALIDA = ["Taller Central", "Terminal Norte", "Terminal Sur", "Terminal Poniente",
+                   "Oficinas administrativas", "Patio de encierro"]
+NOTAS_SALIDA = ["", "", "Mantenimiento preventivo", "Reposición", "Limpieza de unidades"]
+
+SQL_INSERCION = {
+    'finanzas': "INSERT INTO finanzas (fecha, concepto, ingreso, egreso, saldo_actual) VALUES (?, ?, ?, ?, ?)",
+    'boletos': """INSERT INTO boletos (nombre_pasajero, apellidos_pasajero, horario_id, numero_asiento,
+                                      fecha_viaje, fecha_compra, precio, pasajero_id)
+                  VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+    'compras': """INSERT INTO compras (id, fecha, proveedor_id, tipo_producto, descripcion, cantidad,
+                                      precio_unitario, total)
+                  VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+    'salidas_inventario': """INSERT INTO salidas_inventario (producto_id, fecha, tipo_producto, descripcion,
+                                                            cantidad, destino, responsable, notas)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+    'pagos_empleados': "INSERT INTO pagos_empleados (empleado_id, fecha, monto, concepto) VALUES (?, ?, ?, ?)",
+    'autobuses': "INSERT INTO autobuses (id, modelo, marca, año, capacidad, estado) VALUES (?, ?, ?, ?, ?, ?)",
+    'computadoras': """INSERT INTO computadoras (marca, modelo, asignado_a, departamento, estado)
+                       VALUES (?, ?, ?, ?, ?)""",
+}
+
+
+def siguiente_id(conn, tabla):
+    """Primer id libre de una tabla AUTOINCREMENT (también tras borrados)"""
+    maximo = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {tabla}").fetchone()[0]
+    secuencia = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (tabla,)).fetchone()
+    return max(maximo, secuencia[0] if secuencia else 0) + 1
+
+
+def quitar_indices(conn):
+    """Borra los índices secundarios y devuelve su SQL para volver a crearlos"""
+    indices = conn.execute("""
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND sql IS NOT NULL
+        ORDER BY name
+    """).fetchall()
+    for nombre, _ in indices:
+        conn.execute(f"DROP INDEX {nombre}")
+    return [sql for _, sql in indices]
+
+
+def repartir(total, pesos):
+    """Reparte `total` en enteros proporcionales a `pesos` (mayores residuos)"""
+    suma = sum(pesos)
+    exactos = [total * p / suma for p in pesos]
+    partes = [int(e) for e in exactos]
+    faltan = total - sum(partes)
+    for i in sorted(range(len(pesos)), key=lambda i: partes[i] - exactos[i])[:faltan]:
+        partes[i] += 1
+    return partes
+
+
+def distancia_km(a, b):
+    """Distancia por carretera aproximada (gran círculo + 25 %)"""
+    _, lat1, lon1 = a
+    _, lat2, lon2 = b
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    h = (math.sin((p2 - p1) / 2) ** 2
+         + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return round(2 * 6371 * math.asin(math.sqrt(h)) * 1.25)
+
+
+class GeneradorDatos:
+    """Genera el catálogo y la historia día por día sobre una conexión abierta"""
+
+    def __init__(self, conn, escala, semilla, inicio, fin, lote, transaccion):
+        self.conn = conn
+        self.escala = escala
+        self.rng = random.Random(semilla)
+        self.inicio = inicio
+        self.fin = fin
+        self.lote = lote
+        self.transaccion = transaccion
+        self.pendientes = {tabla: [] for tabla in SQL_INSERCION}
+        self.sin_confirmar = 0
+        self.contadores = dict.fromkeys(SQL_INSERCION, 0)
+        self.saldo = leer_saldo(conn)
+        # Acumulados diarios, se suman al final a las tablas de reportes
+        self.ventas_dia = {}
+        self.movimientos_dia = {}
+        self.compras_dia = {}
+        # Horas del día ya formateadas
+        self.horas = [f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in range(86400)]
+
+    # ---------- escritura por lotes ----------
+    def agregar(self, tabla, fila):
+        pendientes = self.pendientes[tabla]
+        pendientes.append(fila)
+        if len(pendientes) >= self.lote:
+            self.vaciar(tabla)
+
+    def vaciar(self, tabla):
+        pendientes = self.pendientes[tabla]
+        if pendientes:
+            self.conn.executemany(SQL_INSERCION[tabla], pendientes)
+            self.contadores[tabla] += len(pendientes)
+            self.sin_confirmar += len(pendientes)
+            pendientes.clear()
+
+    def confirmar(self, forzar=False):
+        """Escribe lo pendiente y confirma cuando la transacción llegó a su tamaño"""
+        if not forzar and self.sin_confirmar + sum(map(len, self.pendientes.values())) < self.transaccion:
+            return
+        for tabla in SQL_INSERCION:
+            self.vaciar(tabla)
+        self.conn.commit()
+        self.conn.execute("BEGIN")
+        self.sin_confirmar = 0
+
+    def movimiento(self, fecha, concepto, ingreso=0.0, egreso=0.0):
+        """Igual que registrar_movimiento, pero en lote y con el saldo en memoria"""
+        self.saldo = round(self.saldo + ingreso - egreso, 2)
+        self.agregar('finanzas', (fecha, concepto, ingreso, egreso, self.saldo))
+        acumulado = self.movimientos_dia.setdefault(fecha[:10], [0, 0.0, 0.0])
+        acumulado[0] += 1
+        acumulado[1] += ingreso
+        acumulado[2] += egreso
+
+    # ---------- catálogo ----------
+    def generar_catalogo(self):
+        rng = self.rng
+        e = self.escala
+        conn = self.conn
+
+        # Proveedores: al menos uno de cada tipo de producto
+        tipos = [tipo for tipo, _, _ in CATALOGO_COMPRAS.values()]
+        proveedores = []
+        for n in range(e['proveedores']):
+            tipo = tipos[n % len(tipos)]
+            apellido = rng.choice(APELLIDOS)
+            giro = {"Autobuses": "Autotransportes", "Computadoras": "Sistemas",
+                    "Productos de limpieza": "Limpieza", "Otros": "Refacciones"}[tipo]
+            nombre = f"{giro} {apellido} {n + 1}"
+            dominio = re.sub(r'[^a-z]', '', plegar_texto(f"{giro}{apellido}")) + str(n + 1)
+            proveedores.append((nombre, tipo, f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}",
+                                f"55-{rng.randrange(1000, 9999)}-{rng.randrange(1000, 9999)}",
+                                f"ventas@{dominio}.com.mx"))
+        conn.executemany("INSERT INTO proveedores (nombre, tipo, contacto, telefono, email) VALUES (?, ?, ?, ?, ?)",
+                         proveedores)
+        self.proveedores_por_tipo = {}
+        for proveedor_id, tipo in conn.execute("SELECT id, tipo FROM proveedores"):
+            self.proveedores_por_tipo.setdefault(tipo, []).append(proveedor_id)
+
+        # Rutas entre pares de ciudades distintos
+        pares = [(a, b) for a in CIUDADES for b in CIUDADES if a is not b]
+        if e['rutas'] > len(pares):
+            raise SystemExit(f"Solo hay {len(pares)} pares de ciudades; use --rutas {len(pares)} o menos")
+        primera_ruta = siguiente_id(conn, 'rutas')
+        rutas = []
+        self.precio_ruta = {}
+        for n, (origen, destino) in enumerate(rng.sample(pares, e['rutas'])):
+            distancia = distancia_km(origen, destino)
+            minutos = round(distancia / 72 * 60 / 5) * 5
+            precio = float(max(120, round(distancia * rng.uniform(1.5, 2.3) / 5) * 5))
+            ruta_id = primera_ruta + n
+            self.precio_ruta[ruta_id] = precio
+            rutas.append((ruta_id, origen[0], destino[0], float(distancia), str(minutos), precio))
+        conn.executemany("""
+            INSERT INTO rutas (id, origen, destino, distancia, tiempo_estimado, precio_boleto)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rutas)
+
+        # Flota inicial
+        primer_autobus = siguiente_id(conn, 'autobuses')
+        self.siguiente_autobus = primer_autobus
+        capacidades = []
+        for _ in range(e['autobuses']):
+            marca, modelo, capacidad, _ = rng.choice(MODELOS_AUTOBUS)
+            estado = rng.choices(["En servicio", "Nuevo", "En mantenimiento"], [80, 12, 8])[0]
+            self.agregar('autobuses', (self.siguiente_autobus, modelo, marca,
+                                       rng.randint(self.inicio.year - 10, self.inicio.year), capacidad, estado))
+            capacidades.append(capacidad)
+            self.siguiente_autobus += 1
+        self.vaciar('autobuses')
+
+        # Horarios: cada ruta tiene una popularidad; los horarios se reparten según ella
+        popularidad = [rng.paretovariate(1.3) for _ in rutas]
+        por_ruta = repartir(e['horarios'] - len(rutas), popularidad) if e['horarios'] >= len(rutas) \
+            else [0] * len(rutas)
+        primer_horario = siguiente_id(conn, 'horarios')
+        horarios = []
+        self.horarios = []       # (horario_id, ruta_id, precio, capacidad, días válidos)
+        pesos = []
+        for indice, (ruta, extra) in enumerate(zip(rutas, por_ruta)):
+            for _ in range(1 + extra):
+                if len(horarios) >= e['horarios']:
+                    break
+                horario_id = primer_horario + len(horarios)
+                autobus = rng.randrange(len(capacidades))
+                salida = rng.randrange(0, 24 * 60, 15)
+                llegada = (salida + int(ruta[4])) % (24 * 60)
+                dias, _, validos = rng.choices(DIAS_OPERACION, [d[1] for d in DIAS_OPERACION])[0]
+                horarios.append((horario_id, ruta[0], primer_autobus + autobus,
+                                 f"{salida // 60:02d}:{salida % 60:02d}",
+                                 f"{llegada // 60:02d}:{llegada % 60:02d}", dias))
+                self.horarios.append((horario_id, ruta[0], ruta[5], capacidades[autobus], validos))
+                # Más demanda de día que de madrugada
+                pesos.append(popularidad[indice] * (1.0 if 6 * 60 <= salida <= 22 * 60 else 0.4))
+        conn.executemany("""
+            INSERT INTO horarios (id, ruta_id, autobus_id, hora_salida, hora_llegada, dias_semana)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, horarios)
+        self.pesos_horarios = []
+        acumulado = 0.0
+        for peso in pesos:
+            acumulado += peso
+            self.pesos_horarios.append(acumulado)
+        # Días que hay que recorrer desde cada día de la semana hasta uno en que opere el horario
+        self.ajuste_dia = {validos: [min((d - w) % 7 for d in validos) for w in range(7)]
+                           for _, _, validos in DIAS_OPERACION}
+        # Pasos coprimos con la capacidad: el k-ésimo asiento vendido de un viaje
+        # es (inicio + k * paso) % capacidad, distinto para cada k sin guardar el mapa
+        self.pasos = {c: [p for p in range(1, c) if math.gcd(p, c) == 1]
+                      for c in {capacidad for _, _, capacidad, _ in MODELOS_AUTOBUS}}
+
+        self._generar_empleados()
+        self._generar_pasajeros()
+
+    def _generar_empleados(self):
+        rng = self.rng
+        conn = self.conn
+        usados = {fila[0] for fila in conn.execute("SELECT username FROM usuarios")}
+        primer_empleado = siguiente_id(conn, 'empleados')
+        antes = self.inicio - datetime.timedelta(days=5 * 365)
+        empleados, usuarios = [], []
+        self.empleados = []      # (empleado_id, nombre completo, salario, contratación, baja)
+        for n in range(self.escala['empleados']):
+            nombre = rng.choice(NOMBRES)
+            apellidos = f"{rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)}"
+            puesto, _, minimo, maximo = rng.choices(PUESTOS, [p[1] for p in PUESTOS])[0]
+            salario = float(round(rng.uniform(minimo, maximo) / 100) * 100)
+            if rng.random() < 0.4:
+                contratacion = antes + datetime.timedelta(days=rng.randrange((self.inicio - antes).days))
+            else:
+                contratacion = self.inicio + datetime.timedelta(days=rng.randrange((self.fin - self.inicio).days))
+            baja = None
+            if rng.random() < 0.12:
+                baja = contratacion + datetime.timedelta(days=rng.randint(90, 3 * 365))
+            empleado_id = primer_empleado + n
+            empleados.append((empleado_id, nombre, apellidos, rng.randint(21, 62), puesto,
+                              contratacion.isoformat(), salario, 0 if baja and baja <= self.fin else 1))
+            self.empleados.append((empleado_id, f"{nombre} {apellidos}", salario, contratacion, baja))
+
+            if puesto != "Conductor":
+                departamento = puesto.replace("Agente ", "")
+                base = re.sub(r'[^a-z]', '', plegar_texto(nombre))[:3] + \
+                    re.sub(r'[^a-z]', '', plegar_texto(apellidos.split()[0]))[:3]
+                username, sufijo = base, 1
+                while username in usados:
+                    sufijo += 1
+                    username = f"{base}{sufijo}"
+                usados.add(username)
+                contraseña = "".join(rng.choice("abcdefghjkmnpqrstuvwxyz23456789") for _ in range(8))
+                usuarios.append((nombre, apellidos, username, hashlib.sha256(contraseña.encode()).hexdigest(),
+                                 "Empleado", departamento))
+                self.agregar('computadoras', (*rng.choice(CATALOGO_COMPRAS["Computadora"][2])[0].split()[:2],
+                                              f"{nombre} {apellidos}", departamento,
+                                              rng.choices(["En uso", "Nuevo", "En reparación"], [85, 10, 5])[0]))
+        self.conn.executemany("""
+            INSERT INTO empleados (id, nombre, apellidos, edad, puesto, fecha_contratacion, salario, activo)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, empleados)
+        self.conn.executemany("""
+            INSERT INTO usuarios (nombre, apellidos, username, password, rol, departamento)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, usuarios)
+        self.vaciar('computadoras')
+        self.responsables = [nombre for _, nombre, _, _, _ in self.empleados] or ["Almacén"]
+
+    def _generar_pasajeros(self):
+        """Nombres distintos de pasajeros; conservan su id si ya existen en la base"""
+        rng = self.rng
+        posibles = len(NOMBRES) * len(APELLIDOS) ** 2
+        cantidad = min(self.escala['pasajeros'], posibles)
+        if cantidad < self.escala['pasajeros']:
+            print(f"Aviso: solo hay {posibles:,} nombres distintos; se usan {cantidad:,} pasajeros")
+        existentes = {(n, a): i for i, n, a in self.conn.execute("SELECT id, nombre, apellidos FROM pasajeros")}
+        siguiente = siguiente_id(self.conn, 'pasajeros')
+        self.pasajeros = []      # (id, nombre, apellidos)
+        for codigo in rng.sample(range(posibles), cantidad):
+            codigo, a2 = divmod(codigo, len(APELLIDOS))
+            n, a1 = divmod(codigo, len(APELLIDOS))
+            nombre, apellidos = NOMBRES[n], f"{APELLIDOS[a1]} {APELLIDOS[a2]}"
+            pasajero_id = existentes.get((nombre, apellidos))
+            if pasajero_id is None:
+                pasajero_id, siguiente = siguiente, siguiente + 1
+            self.pasajeros.append((pasajero_id, nombre, apellidos))
+        # Totales de esta carga: boletos, última compra y gasto por posición en self.pasajeros
+        self.boletos_pasajero = [0] * cantidad
+        self.ultima_compra = [None] * cantidad
+        self.gasto_pasajero = [0.0] * cantidad
+
+    # ---------- historia ----------
+    def pesos_dias(self, dias):
+        """Demanda relativa de cada día: fines de semana, temporadas y crecimiento anual"""
+        temporada = {1: 0.85, 2: 0.8, 3: 1.05, 4: 1.2, 5: 0.95, 6: 1.0,
+                     7: 1.3, 8: 1.25, 9: 0.85, 10: 0.9, 11: 1.0, 12: 1.4}
+        pesos = []
+        for n, dia in enumerate(dias):
+            semana = 1.35 if dia.weekday() in (4, 6) else (1.1 if dia.weekday() == 5 else 1.0)
+            pesos.append(semana * temporada[dia.month] * (1 + 0.12 * n / 365))
+        return pesos
+
+    def generar_historia(self, progreso=True):
+        rng = self.rng
+        e = self.escala
+        dias = [self.inicio + datetime.timedelta(days=n) for n in range((self.fin - self.inicio).days)]
+        # Cuota de boletos por día; compras, salidas y movimientos caen en días al azar
+        cuotas = repartir(e['boletos'], self.pesos_dias(dias))
+        compras_dia = [0] * len(dias)
+        salidas_dia = [0] * len(dias)
+        varios_dia = [0] * len(dias)
+        for cuenta, total in ((compras_dia, e['compras']), (salidas_dia, e['salidas']),
+                              (varios_dia, e['movimientos'])):
+            for n in rng.choices(range(len(dias)), k=total):
+                cuenta[n] += 1
+
+        self.siguiente_compra = siguiente_id(self.conn, 'compras')
+        # Existencias vigentes por producto: [producto_id, disponible]
+        self.existencias = {(t, d): [p, c] for t, d, p, c in self.conn.execute("""
+            SELECT tipo_producto, descripcion, producto_id, cantidad_comprada - cantidad_salida
+            FROM existencias
+        """)}
+        self.inventario = {}
+        self.ocupacion = {}      # día de viaje -> {horario: asientos vendidos}
+        self.no_vendidos = 0
+        inicio_reloj = time.perf_counter()
+        mes_anterior = None
+        for n, dia in enumerate(dias):
+            if progreso and dia.month != mes_anterior and mes_anterior is not None:
+                self._informar(dias[n - 1], inicio_reloj)
+            mes_anterior = dia.month
+            self._generar_dia(dia, cuotas[n], compras_dia[n], salidas_dia[n], varios_dia[n])
+            self.confirmar()
+        if progreso and dias:
+            self._informar(dias[-1], inicio_reloj)
+        self.confirmar(forzar=True)
+
+    def _informar(self, dia, inicio_reloj):
+        filas = sum(self.contadores.values()) + sum(map(len, self.pendientes.values()))
+        transcurrido = time.perf_counter() - inicio_reloj
+        boletos = self.contadores['boletos'] + len(self.pendientes['boletos'])
+        print(f"  {dia:%Y-%m}: {boletos:>12,} boletos, saldo {self.saldo:>18,.2f} "
+              f"({filas / transcurrido if transcurrido else 0:,.0f} filas/s)", flush=True)
+
+    def _generar_dia(self, dia, cuota, compras, salidas, varios):
+        rng = self.rng
+        fecha = dia.isoformat()
+        ordinal = dia.toordinal()
+        # Los viajes de días pasados ya no reciben ventas
+        for viejo in [d for d in self.ocupacion if d < ordinal]:
+            del self.ocupacion[viejo]
+
+        # Eventos del día ordenados por hora: (segundo, orden, tipo, dato)
+        eventos = []
+        tamaños = rng.choices((1, 2, 3, 4), cum_weights=(60, 85, 95, 100), k=max(cuota, 1))
+        ventas, restantes = [], cuota
+        for tamaño in tamaños:
+            if restantes <= 0:
+                break
+            ventas.append(min(tamaño, restantes))
+            restantes -= ventas[-1]
+        horarios = rng.choices(range(len(self.horarios)), cum_weights=self.pesos_horarios, k=len(ventas))
+        for tamaño, horario in zip(ventas, horarios):
+            eventos.append((int(rng.triangular(5 * 3600, 86399, 13 * 3600)), 0, 'venta', (tamaño, horario)))
+        for _ in range(compras):
+            eventos.append((rng.randrange(8 * 3600, 18 * 3600), 1, 'compra', None))
+        for _ in range(salidas):
+            eventos.append((rng.randrange(7 * 3600, 20 * 3600), 2, 'salida', None))
+        for _ in range(varios):
+            eventos.append((rng.randrange(8 * 3600, 19 * 3600), 3, 'varios', None))
+        # Nómina el último día del mes, al cierre
+        if (dia + datetime.timedelta(days=1)).month != dia.month:
+            eventos.append((19 * 3600, 4, 'nomina', None))
+        eventos.sort(key=lambda evento: evento[:2])
+
+        for segundo, _, tipo, dato in eventos:
+            momento = f"{fecha} {self.horas[segundo]}"
+            if tipo == 'venta':
+                self._venta(ordinal, momento, *dato)
+            elif tipo == 'compra':
+                self._compra(momento, dia.year)
+            elif tipo == 'salida':
+                self._salida(momento)
+            elif tipo == 'varios':
+                concepto, es_ingreso, minimo, maximo = rng.choice(MOVIMIENTOS_VARIOS)
+                monto = float(round(rng.uniform(minimo, maximo), 2))
+                self.movimiento(momento, concepto, ingreso=monto if es_ingreso else 0.0,
+                                egreso=0.0 if es_ingreso else monto)
+            else:
+                self._nomina(momento, dia)
+
+    def _venta(self, ordinal, fecha_compra, tamaño, horario):
+        rng = self.rng
+        for intento in range(8):
+            if intento:
+                horario = rng.choices(range(len(self.horarios)), cum_weights=self.pesos_horarios)[0]
+            horario_id, ruta_id, precio, capacidad, validos = self.horarios[horario]
+            # La mayoría compra con pocos días de anticipación; el viaje cae en un día que opera el horario
+            viaje = ordinal + min(30, int(rng.expovariate(1 / 4)))
+            viaje += self.ajuste_dia[validos][(viaje - 1) % 7]
+            ocupados = self.ocupacion.setdefault(viaje, {})
+            vendidos = ocupados.get(horario_id, 0)
+            if vendidos + tamaño <= capacidad:
+                break
+        else:
+            self.no_vendidos += tamaño
+            return
+        ocupados[horario_id] = vendidos + tamaño
+
+        indice = min(int(len(self.pasajeros) * rng.random() ** 2.5), len(self.pasajeros) - 1)
+        pasajero_id, nombre, apellidos = self.pasajeros[indice]
+        fecha_viaje = datetime.date.fromordinal(viaje).isoformat()
+        pasos = self.pasos[capacidad]
+        paso = pasos[(horario_id + viaje) % len(pasos)]
+        desfase = (horario_id * 7919 + viaje * 104729) % capacidad
+        for k in range(vendidos, vendidos + tamaño):
+            asiento = (desfase + k * paso) % capacidad + 1
+            self.agregar('boletos', (nombre, apellidos, horario_id, asiento, fecha_viaje,
+                                     fecha_compra, precio, pasajero_id))
+        total = precio * tamaño
+        self.movimiento(fecha_compra, f"Venta de {tamaño} boletos a {nombre} {apellidos}", ingreso=total)
+        self.boletos_pasajero[indice] += tamaño
+        self.ultima_compra[indice] = fecha_compra
+        self.gasto_pasajero[indice] += total
+        acumulado = self.ventas_dia.setdefault((fecha_compra[:10], ruta_id), [0, 0.0])
+        acumulado[0] += tamaño
+        acumulado[1] += total
+
+    def _compra(self, fecha, año):
+        rng = self.rng
+        tipos = list(CATALOGO_COMPRAS)
+        tipo_producto = rng.choices(tipos, [CATALOGO_COMPRAS[t][1] for t in tipos])[0]
+        tipo_proveedor, _, productos = CATALOGO_COMPRAS[tipo_producto]
+        descripcion, precio_base, maximo = rng.choice(productos)
+        cantidad = rng.randint(1, maximo)
+        precio_unitario = float(round(precio_base * rng.uniform(0.9, 1.15), 2))
+        total = round(cantidad * precio_unitario, 2)
+        proveedor_id = rng.choice(self.proveedores_por_tipo[tipo_proveedor])
+        compra_id = self.siguiente_compra
+        self.siguiente_compra += 1
+        self.agregar('compras', (compra_id, fecha, proveedor_id, tipo_producto, descripcion,
+                                 cantidad, precio_unitario, total))
+        self.movimiento(fecha, f"Compra de {tipo_producto}: {descripcion}", egreso=total)
+        self.existencias.setdefault((tipo_producto, descripcion), [compra_id, 0])[1] += cantidad
+        acumulado = self.compras_dia.setdefault((fecha[:10], tipo_producto), [0, 0.0])
+        acumulado[0] += 1
+        acumulado[1] += total
+        # Igual que InventarioService.registrar_compra: un registro por compra
+        marca, modelo = descripcion.split()[:2]
+        if tipo_producto == "Autobús":
+            capacidad = next(c for m, mo, c, _ in MODELOS_AUTOBUS if (m, mo) == (marca, modelo))
+            self.agregar('autobuses', (self.siguiente_autobus, modelo, marca, año, capacidad, "Nuevo"))
+            self.siguiente_autobus += 1
+        elif tipo_producto == "Computadora":
+            self.agregar('computadoras', (marca, modelo, "", "", "Nuevo"))
+
+    def _salida(self, fecha):
+        """Salida de consumibles del almacén; solo de productos con existencia"""
+        rng = self.rng
+        disponibles = [llave for llave, (_, cantidad) in self.existencias.items()
+                       if cantidad > 0 and llave[0] in ("Productos de limpieza", "Otros")]
+        if not disponibles:
+            return
+        tipo_producto, descripcion = llave = rng.choice(disponibles)
+        producto_id, existencia = self.existencias[llave]
+        cantidad = rng.randint(1, max(1, min(existencia, existencia // 3 + 1, 40)))
+        self.existencias[llave][1] -= cantidad
+        self.agregar('salidas_inventario', (producto_id, fecha, tipo_producto, descripcion, cantidad,
+                                            rng.choice(DESTINOS_SALIDA), rng.choice(self.responsables),
+                                            rng.choice(NOTAS_SALIDA)))
+        self.inventario[llave] = (producto_id, tipo_producto, descripcion, existencia - cantidad, fecha)
+
+    def _nomina(self, fecha, dia):
+        """Pago mensual; como RHService.realizar_pago, no se paga si el saldo no alcanza"""
+        for empleado_id, nombre, salario, contratacion, baja in self.empleados:
+            if contratacion > dia or (baja is not None and baja <= dia) or self.saldo < salario:
+                continue
+            concepto = f"Pago de salario a {nombre}"
+            self.agregar('pagos_empleados', (empleado_id, fecha, salario, concepto))
+            self.movimiento(fecha, concepto, egreso=salario)
+
+    # ---------- cierre ----------
+    def guardar_materializados(self):
+        """Pasajeros, acumulados, saldo, existencias e inventario, cuadrados con lo insertado"""
+        conn = self.conn
+        cursor = conn.cursor()
+        cursor.executemany("""
+            INSERT INTO pasajeros (id, nombre, apellidos, boletos_comprados, ultima_compra, total_gastado)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET
+                boletos_comprados = boletos_comprados + excluded.boletos_comprados,
+                ultima_compra = MAX(COALESCE(ultima_compra, ''), excluded.ultima_compra),
+                total_gastado = total_gastado + excluded.total_gastado
+        """, ((*pasajero, boletos, ultima, gasto)
+              for pasajero, boletos, ultima, gasto in zip(self.pasajeros, self.boletos_pasajero,
+                                                          self.ultima_compra, self.gasto_pasajero)
+              if boletos))
+        cursor.execute("INSERT INTO pasajeros_fts (pasajeros_fts) VALUES ('rebuild')")
+
+        cursor.executemany("""
+            INSERT INTO ventas_diarias_ruta (dia, ruta_id, boletos, total) VALUES (?, ?, ?, ?)
+            ON CONFLICT (dia, ruta_id) DO UPDATE SET
+                boletos = boletos + excluded.boletos,
+                total = total + excluded.total
+        """, ((*llave, *valores) for llave, valores in self.ventas_dia.items()))
+        cursor.executemany("""
+            INSERT INTO movimientos_diarios (dia, movimientos, ingresos, egresos) VALUES (?, ?, ?, ?)
+            ON CONFLICT (dia) DO UPDATE SET
+                movimientos = movimientos + excluded.movimientos,
+                ingresos = ingresos + excluded.ingresos,
+                egresos = egresos + excluded.egresos
+        """, ((dia, *valores) for dia, valores in self.movimientos_dia.items()))
+        cursor.executemany("""
+            INSERT INTO compras_diarias_categoria (dia, tipo_producto, compras, total) VALUES (?, ?, ?, ?)
+            ON CONFLICT (dia, tipo_producto) DO UPDATE SET
+                compras = compras + excluded.compras,
+                total = total + excluded.total
+        """, ((*llave, *valores) for llave, valores in self.compras_dia.items()))
+        for tabla in ("ventas_diarias_ruta", "movimientos_diarios", "compras_diarias_categoria", "rutas",
+                      "boletos"):
+            incrementar_version(cursor, tabla)
+
+        cursor.execute("UPDATE saldo_finanzas SET saldo = ? WHERE id = 1", (self.saldo,))
+        reconstruir_existencias(cursor)
+        # Última existencia registrada de cada producto con salidas (tabla inventario)
+        cursor.executemany("""
+            INSERT INTO inventario (producto_id, tipo_producto, descripcion, cantidad, fecha_actualizacion)
+            VALUES (?, ?, ?, ?, ?)
+        """, self.inventario.values())
+        conn.commit()
+
+
+def abrir(ruta, nueva, perfil):
+    """Crea o abre la base con el esquema completo y devuelve el gestor de conexiones"""
+    if nueva:
+        if os.path.abspath(ruta) == os.path.abspath(DB_PATH):
+            raise SystemExit(f"--nueva no reemplaza {DB_PATH}; indique otro archivo con --bd")
+        for sufijo in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(ruta + sufijo):
+                os.remove(ruta + sufijo)
+        # Archivo recién creado: si la carga falla se descarta, así que no hace falta journal ni fsync
+        pragmas = perfil_almacenamiento('defecto', journal_mode='OFF', synchronous='OFF',
+                                        locking_mode='EXCLUSIVE', temp_store='MEMORY', cache_size=-262144)
+    else:
+        pragmas = perfil_almacenamiento(perfil, cache_size=-262144)
+    db = GestorConexiones(ruta, pragmas)
+    erp = SistemaERP.__new__(SistemaERP)  # Sin ventana Tk: solo se usa el esquema
+    erp.db = db
+    erp.crear_base_datos()
+    erp.crear_usuarios_predefinidos()
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera datos sintéticos de varios años con el esquema del ERP")
+    parser.add_argument('--bd', default='erp_sintetica.db', help="Archivo de base de datos a llenar")
+    parser.add_argument('--nueva', action='store_true',
+                        help="Reemplazar --bd por un archivo nuevo (sin journal ni fsync durante la carga)")
+    parser.add_argument('--perfil', default='rendimiento', choices=['defecto', 'rendimiento'],
+                        help="Perfil de almacenamiento al agregar a una base existente")
+    parser.add_argument('--escala', default='pequeña', choices=list(ESCALAS))
+    parser.add_argument('--semilla', type=int, default=7)
+    parser.add_argument('--hasta', type=datetime.date.fromisoformat, default=datetime.date.today(),
+                        help="Último día de la historia (AAAA-MM-DD, por omisión hoy)")
+    for opcion in ESCALAS['pequeña']:
+        parser.add_argument(f'--{opcion}', type=int, default=None,
+                            help=f"Sobrescribe '{opcion}' de la escala")
+    parser.add_argument('--lote', type=int, default=200_000, help="Filas por executemany")
+    parser.add_argument('--transaccion', type=int, default=2_000_000, help="Filas por transacción")
+    parser.add_argument('--verificar', action='store_true',
+                        help="Comparar las tablas materializadas con el recálculo desde el historial")
+    args = parser.parse_args()
+
+    escala = dict(ESCALAS[args.escala])
+    for opcion in escala:
+        if getattr(args, opcion) is not None:
+            escala[opcion] = getattr(args, opcion)
+    fin = args.hasta + datetime.timedelta(days=1)
+    inicio = fin - datetime.timedelta(days=365 * escala['años'])
+
+    inicio_reloj = time.perf_counter()
+    db = abrir(args.bd, args.nueva, args.perfil)
+    conn = db.obtener()
+    if args.nueva:
+        # El saldo inicial de crear_base_datos abre la historia
+        conn.execute("UPDATE finanzas SET fecha = ? WHERE concepto = 'Saldo inicial'", (f"{inicio} 00:00:00",))
+        conn.execute("UPDATE movimientos_diarios SET dia = ?", (inicio.isoformat(),))
+    conn.commit()
+
+    print(f"Generando {args.bd} ({args.escala}, semilla {args.semilla}): {inicio} a {args.hasta}")
+    conn.execute("BEGIN")
+    indices = quitar_indices(conn)
+    generador = GeneradorDatos(conn, escala, args.semilla, inicio, fin, args.lote, args.transaccion)
+    generador.generar_catalogo()
+    generador.generar_historia()
+
+    print(f"Creando {len(indices)} índices...", flush=True)
+    reloj_indices = time.perf_counter()
+    for sql in indices:
+        conn.execute(sql)
+    conn.commit()
+    generador.guardar_materializados()
+    conn.execute("ANALYZE")
+    conn.commit()
+    print(f"  índices, materializados y ANALYZE en {time.perf_counter() - reloj_indices:.1f} s")
+
+    print(f"\n{'Tabla':<28} {'Filas':>14}")
+    tablas = [fila[0] for fila in conn.execute("""
+        SELECT name FROM sqlite_master
+        WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND name NOT LIKE 'pasajeros_fts_%'
+        ORDER BY name
+    """)]
+    for tabla in tablas:
+        if tabla in ('pasajeros_fts', 'pasajeros_vocab'):
+            continue
+        print(f"{tabla:<28} {conn.execute(f'SELECT COUNT(*) FROM {tabla}').fetchone()[0]:>14,}")
+    if generador.no_vendidos:
+        print(f"\n{generador.no_vendidos:,} boletos no se vendieron por viajes llenos")
+    print(f"\nSaldo final: {generador.saldo:,.2f}; total {time.perf_counter() - inicio_reloj:.1f} s")
+
+    diferencias = []
+    if args.verificar:
+        print("Verificando tablas materializadas...", flush=True)
+        diferencias = (verificar_acumulados(conn) + verificar_totales_pasajeros(conn)
+                       + verificar_existencias(conn))
+        ultimo = conn.execute("SELECT saldo_actual FROM finanzas ORDER BY id DESC LIMIT 1").fetchone()[0]
+        if round(ultimo, 2) != round(leer_saldo(conn), 2):
+            diferencias.append(("saldo_finanzas", ultimo, leer_saldo(conn)))
+        for diferencia in diferencias[:20]:
+            print(f"  DIFERENCIA: {diferencia}")
+        print("  todo cuadra" if not diferencias else f"  {len(diferencias)} diferencias")
+    db.cerrar_todas()
+    sys.exit(1 if diferencias else 0)
+
+
+if __name__ == "__main__":
+    main()
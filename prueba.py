@@ -16,33 +16,3081 @@ import hashlib
 import random
 import string
 import datetime
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import re
-from tkcalendar import DateEntry
-from PIL import Image, ImageTk
+import os
+import unicodedata
+import json
+import threading
+import queue
+import time
+import uuid
+import math
+import sys
+import bisect
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import Counter, OrderedDict, deque, namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
+
+
+# Ruta de la base de datos principal
+DB_PATH = 'erp_autobuses.db'
+
+# Carpeta donde se guardan las imágenes ya redimensionadas (logo)
+DIRECTORIO_CACHE_IMAGENES = '.cache_imagenes'
+
+# Perfiles de almacenamiento (PRAGMA aplicados a cada conexión al iniciar)
+# - defecto: valores de fábrica de SQLite (journal de rollback, synchronous=FULL)
+# - rendimiento: WAL para que las lecturas no bloqueen a las ventas y viceversa
+PERFILES_ALMACENAMIENTO = {
+    'defecto': {},
+    'rendimiento': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -20000,        # ~20 MB de caché de páginas
+        'mmap_size': 268435456,      # 256 MB mapeados en memoria
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,        # ms de espera ante bloqueos antes de fallar
+    },
+}
+
+# Perfil activo; se puede cambiar con la variable de entorno ERP_PERFIL_BD
+PERFIL_ALMACENAMIENTO = os.environ.get('ERP_PERFIL_BD', 'rendimiento')
+
+# Servidor de ventas (servidor_api.py), p. ej. http://127.0.0.1:8765; con él la
+# taquilla consulta asientos y vende a través del servidor y no sobre el archivo
+API_URL = os.environ.get('ERP_API_URL')
+
+# Medición de las sentencias SQL (pantalla "Consultas SQL" del administrador).
+# Cuesta en cada sentencia, así que solo se activa con ERP_INSTRUMENTAR_SQL=1; ERP_SQL_LENTA_MS fija desde cuántos ms una
+# sentencia entra al registro de lentas; con ERP_SQL_VOLCADO=ruta.json las
+# estadísticas se guardan en ese archivo al cerrar la aplicación
+INSTRUMENTAR_SQL = os.environ.get('ERP_INSTRUMENTAR_SQL', '0') == '1'
+UMBRAL_SQL_LENTA_MS = float(os.environ.get('ERP_SQL_LENTA_MS', '100'))
+VOLCADO_SQL = os.environ.get('ERP_SQL_VOLCADO')
+ARCHIVO_ESTADISTICAS_SQL = 'estadisticas_sql.json'  # "Exportar JSON" sin ERP_SQL_VOLCADO
+
+
+def perfil_almacenamiento(nombre=None, **ajustes):
+    """Devuelve los PRAGMA del perfil indicado, con ajustes opcionales encima"""
+    nombre = nombre or PERFIL_ALMACENAMIENTO
+    if nombre not in PERFILES_ALMACENAMIENTO:
+        raise ValueError(f"Perfil de almacenamiento desconocido: {nombre}")
+    pragmas = dict(PERFILES_ALMACENAMIENTO[nombre])
+    pragmas.update(ajustes)
+    return pragmas
+
+
+# =================== VERSIONES DEL ESQUEMA ============================
+# Cada migración se aplica una sola vez; la versión aplicada se guarda en
+# PRAGMA user_version. Para cambiar el esquema se agrega una entrada nueva
+# al final con el siguiente número de versión (nunca se editan las previas).
+MIGRACIONES_ESQUEMA = [
+    (1, "Índices secundarios para las consultas frecuentes", [
+        # Asientos por horario y fecha; impide vender dos veces el mismo asiento
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_boletos_asiento "
+        "ON boletos (horario_id, fecha_viaje, numero_asiento)",
+        # Búsqueda y detalle de clientes por pasajero
+        "CREATE INDEX IF NOT EXISTS idx_boletos_pasajero "
+        "ON boletos (nombre_pasajero, apellidos_pasajero)",
+        # Reportes de ventas por rango de fechas
+        "CREATE INDEX IF NOT EXISTS idx_boletos_fecha_compra ON boletos (fecha_compra)",
+        # Informes de finanzas por rango de fechas
+        "CREATE INDEX IF NOT EXISTS idx_finanzas_fecha ON finanzas (fecha)",
+        # Compras por rango de fechas y agrupadas por producto (inventario)
+        "CREATE INDEX IF NOT EXISTS idx_compras_fecha ON compras (fecha)",
+        "CREATE INDEX IF NOT EXISTS idx_compras_producto ON compras (tipo_producto, descripcion)",
+        "CREATE INDEX IF NOT EXISTS idx_compras_proveedor ON compras (proveedor_id)",
+        # Salidas agrupadas por producto y filtradas por fecha
+        "CREATE INDEX IF NOT EXISTS idx_salidas_producto "
+        "ON salidas_inventario (tipo_producto, descripcion)",
+        "CREATE INDEX IF NOT EXISTS idx_salidas_fecha ON salidas_inventario (fecha)",
+        # Horarios por ruta y autobús
+        "CREATE INDEX IF NOT EXISTS idx_horarios_ruta ON horarios (ruta_id)",
+        "CREATE INDEX IF NOT EXISTS idx_horarios_autobus ON horarios (autobus_id)",
+        # Últimos pagos a empleados
+        "CREATE INDEX IF NOT EXISTS idx_pagos_fecha ON pagos_empleados (fecha)",
+    ]),
+    (2, "Saldo materializado de finanzas", [
+        # Una sola fila con el saldo vigente; se actualiza en la misma
+        # transacción que cada movimiento insertado en finanzas
+        """CREATE TABLE IF NOT EXISTS saldo_finanzas (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            saldo REAL NOT NULL
+        )""",
+        """INSERT OR IGNORE INTO saldo_finanzas (id, saldo)
+           VALUES (1, COALESCE((SELECT saldo_actual FROM finanzas ORDER BY id DESC LIMIT 1), 0))""",
+    ]),
+    (3, "Retenciones temporales de asientos", [
+        # Asientos apartados por una terminal mientras el agente confirma la venta
+        """CREATE TABLE IF NOT EXISTS retenciones_asientos (
+            horario_id INTEGER NOT NULL,
+            fecha_viaje TEXT NOT NULL,
+            numero_asiento INTEGER NOT NULL,
+            terminal TEXT NOT NULL,
+            expira REAL NOT NULL,
+            PRIMARY KEY (horario_id, fecha_viaje, numero_asiento)
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_retenciones_expira ON retenciones_asientos (expira)",
+    ]),
+    (4, "Existencias materializadas por producto", [
+        # Stock por (tipo_producto, descripcion); lo mantienen registrar_compra y
+        # registrar_salida_inventario en la misma transacción que el movimiento
+        """CREATE TABLE IF NOT EXISTS existencias (
+            tipo_producto TEXT NOT NULL,
+            descripcion TEXT NOT NULL,
+            producto_id INTEGER NOT NULL,
+            proveedor_id INTEGER NOT NULL,
+            cantidad_comprada INTEGER NOT NULL DEFAULT 0,
+            cantidad_salida INTEGER NOT NULL DEFAULT 0,
+            suma_precios REAL NOT NULL DEFAULT 0,
+            num_compras INTEGER NOT NULL DEFAULT 0,
+            ultimo_movimiento TEXT,
+            PRIMARY KEY (tipo_producto, descripcion)
+        )""",
+        lambda cursor: reconstruir_existencias(cursor),
+    ]),
+    (5, "Índice del historial de compras por tipo y fecha", [
+        # Paginación por (fecha, id) del historial filtrado por tipo de producto
+        "CREATE INDEX IF NOT EXISTS idx_compras_tipo_fecha ON compras (tipo_producto, fecha)",
+    ]),
+    (6, "Búsqueda de pasajeros por texto completo", [
+        # Un renglón por pasajero distinto; lo mantiene reservar_asientos con
+        # registrar_pasajero en la misma transacción que los boletos
+        """CREATE TABLE IF NOT EXISTS pasajeros (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            apellidos TEXT NOT NULL,
+            UNIQUE (nombre, apellidos)
+        )""",
+        # Índice FTS5 sin acentos ni mayúsculas, con prefijos de 2 y 3 letras precalculados
+        """CREATE VIRTUAL TABLE IF NOT EXISTS pasajeros_fts USING fts5 (
+            nombre, apellidos,
+            content = 'pasajeros', content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )""",
+        # Vocabulario del índice, para sugerir términos parecidos cuando hay errores de dedo
+        "CREATE VIRTUAL TABLE IF NOT EXISTS pasajeros_vocab USING fts5vocab (pasajeros_fts, 'row')",
+        lambda cursor: reconstruir_pasajeros(cursor),
+    ]),
+    (7, "Totales por pasajero y boletos ligados a su pasajero", [
+        # Los mantienen reservar_asientos (venta) y descontar_boletos_horario (baja de horario)
+        "ALTER TABLE pasajeros ADD COLUMN boletos_comprados INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE pasajeros ADD COLUMN ultima_compra TEXT",
+        "ALTER TABLE pasajeros ADD COLUMN total_gastado REAL NOT NULL DEFAULT 0",
+        "ALTER TABLE boletos ADD COLUMN pasajero_id INTEGER REFERENCES pasajeros (id)",
+        "CREATE INDEX IF NOT EXISTS idx_boletos_pasajero_id ON boletos (pasajero_id, fecha_compra)",
+        "CREATE INDEX IF NOT EXISTS idx_pasajeros_ultima_compra ON pasajeros (ultima_compra)",
+        lambda cursor: reconstruir_totales_pasajeros(cursor),
+    ]),
+    (8, "Acumulados diarios para reportes", [
+        # Los mantienen reservar_asientos, registrar_movimiento y registrar_compra
+        # en la misma transacción que el movimiento; los reportes leen de aquí
+        """CREATE TABLE IF NOT EXISTS ventas_diarias_ruta (
+            dia TEXT NOT NULL,
+            ruta_id INTEGER NOT NULL,
+            boletos INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, ruta_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS movimientos_diarios (
+            dia TEXT PRIMARY KEY,
+            movimientos INTEGER NOT NULL DEFAULT 0,
+            ingresos REAL NOT NULL DEFAULT 0,
+            egresos REAL NOT NULL DEFAULT 0
+        )""",
+        """CREATE TABLE IF NOT EXISTS compras_diarias_categoria (
+            dia TEXT NOT NULL,
+            tipo_producto TEXT NOT NULL,
+            compras INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, tipo_producto)
+        )""",
+        lambda cursor: reconstruir_acumulados(cursor),
+    ]),
+    (9, "Versiones de datos para la caché de reportes", [
+        # Contador por tabla; lo incrementa cada escritura sobre los acumulados
+        """CREATE TABLE IF NOT EXISTS versiones_datos (
+            tabla TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )""",
+    ]),
+]
+
+
+def migrar_esquema(conn):
+    """Aplica las migraciones pendientes y devuelve la versión final del esquema"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for numero, descripcion, pasos in MIGRACIONES_ESQUEMA:
+        if numero <= version:
+            continue
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN")
+        try:
+            cursor = conn.cursor()
+            for paso in pasos:
+                if callable(paso):
+                    paso(cursor)
+                else:
+                    cursor.execute(paso)
+            cursor.execute(f"PRAGMA user_version = {numero}")
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            raise RuntimeError(f"No se pudo aplicar la migración {numero} ({descripcion}): {e}") from e
+        version = numero
+    return version
+
+
+# =================== INSTRUMENTACIÓN DE CONSULTAS =====================
+# Las conexiones de GestorConexiones pueden crearse como ConexionInstrumentada:
+# cada sentencia se mide desde execute() hasta que se leyó su última fila y se
+# acumula por forma (SQL sin literales), con histograma de latencias, filas y
+# el método que la lanzó. Las que pasan del umbral quedan en el registro de
+# lentas con su EXPLAIN QUERY PLAN. El trace callback de sqlite3 aporta la
+# sentencia con sus valores y cuenta las que no pasan por execute() (BEGIN
+# implícitos, executescript).
+
+# Límites de los cubos del histograma en ms; el último cubo es "más de 1 s"
+LIMITES_HISTOGRAMA_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+_LITERALES_SQL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTAS_SQL = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_ESPACIOS_SQL = re.compile(r"\s+")
+
+# Funciones de la capa de conexión: no cuentan como origen de una sentencia
+_INFRAESTRUCTURA_SQL = ('ConexionInstrumentada.', 'CursorInstrumentado.', '_ConexionPrestada.',
+                        'GestorConexiones.', 'EstadisticasSQL.')
+
+
+@lru_cache(maxsize=4096)
+def normalizar_sql(sql):
+    """Forma de una sentencia: literales como ?, listas de ? reducidas y espacios simples"""
+    forma = _LITERALES_SQL.sub("?", sql)
+    forma = _LISTAS_SQL.sub("(?, ...)", forma)
+    return _ESPACIOS_SQL.sub(" ", forma).strip()
+
+
+def _origen_consulta():
+    """Método de SistemaERP que lanzó la sentencia o, si no hay, la función más cercana"""
+    marco = sys._getframe(2)
+    cercana = None
+    while marco is not None:
+        codigo = marco.f_code
+        nombre = getattr(codigo, 'co_qualname', codigo.co_name)
+        if nombre.startswith('SistemaERP.'):
+            return nombre
+        if cercana is None and not nombre.startswith(_INFRAESTRUCTURA_SQL):
+            cercana = nombre
+        marco = marco.f_back
+    return cercana or "?"
+
+
+def plan_de_consulta(conn, sql, parametros=()):
+    """Líneas de EXPLAIN QUERY PLAN de una sentencia (vacío si no es una consulta de datos)"""
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')):
+        return []
+    try:
+        # Con el execute de sqlite3.Connection: el plan no se mide a sí mismo
+        filas = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, parametros).fetchall()
+    except (sqlite3.Error, ValueError) as e:
+        return [f"(sin plan: {e})"]
+    return [fila[3] for fila in filas]
+
+
+class EstadisticasSQL:
+    """Latencias por forma de sentencia y registro de lentas, compartidos por todas las conexiones"""
+
+    def __init__(self, umbral_lenta_ms=UMBRAL_SQL_LENTA_MS, max_lentas=200):
+        self.umbral_lenta_ms = umbral_lenta_ms
+        self._lock = threading.Lock()
+        self._formas = {}
+        self.lentas = deque(maxlen=max_lentas)
+        self.no_medidas = Counter()
+
+    def registrar(self, sql, segundos, filas, origen, conn=None, parametros=(), expandida=None):
+        forma = normalizar_sql(sql)
+        ms = segundos * 1000
+        with self._lock:
+            datos = self._formas.get(forma)
+            if datos is None:
+                datos = self._formas[forma] = {
+                    'llamadas': 0, 'filas': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                    'histograma': [0] * (len(LIMITES_HISTOGRAMA_MS) + 1), 'origenes': Counter(),
+                }
+            datos['llamadas'] += 1
+            datos['filas'] += filas
+            datos['total_ms'] += ms
+            datos['max_ms'] = max(datos['max_ms'], ms)
+            datos['histograma'][bisect.bisect_left(LIMITES_HISTOGRAMA_MS, ms)] += 1
+            datos['origenes'][origen] += 1
+        if ms >= self.umbral_lenta_ms:
+            plan = plan_de_consulta(conn, sql, parametros) if conn is not None and parametros is not None else []
+            with self._lock:
+                self.lentas.append({
+                    'fecha': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    'ms': round(ms, 3), 'filas': filas, 'origen': origen, 'forma': forma,
+                    'sentencia': expandida or sql, 'plan': plan,
+                })
+
+    def contar_no_medida(self, sentencia):
+        with self._lock:
+            self.no_medidas[normalizar_sql(sentencia)] += 1
+
+    @staticmethod
+    def _percentil(histograma, llamadas, maximo, p):
+        """Límite superior del cubo donde cae el percentil p (aproximado)"""
+        objetivo = llamadas * p / 100
+        acumulado = 0
+        for limite, cuenta in zip(LIMITES_HISTOGRAMA_MS, histograma):
+            acumulado += cuenta
+            if acumulado >= objetivo:
+                return min(limite, maximo)
+        return maximo
+
+    def resumen(self):
+        """Formas de sentencia de la que más tiempo acumula a la que menos"""
+        with self._lock:
+            formas = [(forma, dict(datos, histograma=list(datos['histograma']),
+                                   origenes=Counter(datos['origenes'])))
+                      for forma, datos in self._formas.items()]
+        filas = []
+        for forma, datos in formas:
+            llamadas = datos['llamadas']
+            filas.append({
+                'forma': forma,
+                'llamadas': llamadas,
+                'filas': datos['filas'],
+                'total_ms': round(datos['total_ms'], 3),
+                'promedio_ms': round(datos['total_ms'] / llamadas, 3),
+                'p50_ms': round(self._percentil(datos['histograma'], llamadas, datos['max_ms'], 50), 3),
+                'p95_ms': round(self._percentil(datos['histograma'], llamadas, datos['max_ms'], 95), 3),
+                'max_ms': round(datos['max_ms'], 3),
+                'histograma': datos['histograma'],
+                'origenes': dict(datos['origenes'].most_common()),
+            })
+        filas.sort(key=lambda fila: -fila['total_ms'])
+        return filas
+
+    def volcado(self):
+        """Todo lo medido, listo para json.dump"""
+        with self._lock:
+            lentas = list(self.lentas)
+            no_medidas = dict(self.no_medidas.most_common())
+        return {
+            'generado': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'umbral_lenta_ms': self.umbral_lenta_ms,
+            'limites_histograma_ms': list(LIMITES_HISTOGRAMA_MS),
+            'formas': self.resumen(),
+            'lentas': lentas,
+            'no_medidas': no_medidas,
+        }
+
+    def volcar(self, ruta):
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            json.dump(self.volcado(), archivo, ensure_ascii=False, indent=2)
+
+    def reiniciar(self):
+        with self._lock:
+            self._formas.clear()
+            self.lentas.clear()
+            self.no_medidas.clear()
+
+
+class CursorInstrumentado(sqlite3.Cursor):
+    """Cursor que mide cada sentencia desde execute() hasta su última fila"""
+
+    _medicion = None     # [sql, segundos, filas, origen, parámetros, sentencia con valores]
+
+    def execute(self, sql, parametros=()):
+        self._terminar()
+        conn = self.connection
+        conn.registrar_pendientes()
+        origen = _origen_consulta()
+        conn._midiendo += 1
+        conn._expandida = None
+        inicio = time.perf_counter()
+        try:
+            super().execute(sql, parametros)
+        except BaseException:
+            self._medicion = [sql, time.perf_counter() - inicio, 0, origen, parametros, conn._expandida]
+            self._terminar()
+            raise
+        finally:
+            conn._midiendo -= 1
+        self._medicion = [sql, time.perf_counter() - inicio, 0, origen, parametros, conn._expandida]
+        if self.description is None:
+            # INSERT/UPDATE/DELETE y DDL: no hay filas que leer
+            self._medicion[2] = max(self.rowcount, 0)
+            self._terminar()
+        return self
+
+    def executemany(self, sql, secuencia):
+        self._terminar()
+        conn = self.connection
+        conn.registrar_pendientes()
+        origen = _origen_consulta()
+        conn._midiendo += 1
+        conn._expandida = None
+        inicio = time.perf_counter()
+        try:
+            super().executemany(sql, secuencia)
+        finally:
+            conn._midiendo -= 1
+            # Los parámetros ya se consumieron: sin EXPLAIN para executemany
+            self._medicion = [sql, time.perf_counter() - inicio, max(self.rowcount, 0), origen, None,
+                              conn._expandida]
+            self._terminar()
+        return self
+
+    def _leer(self, funcion, *args):
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args)
+        finally:
+            if self._medicion is not None:
+                self._medicion[1] += time.perf_counter() - inicio
+
+    def fetchone(self):
+        fila = self._leer(super().fetchone)
+        if self._medicion is not None:
+            if fila is None:
+                self._terminar()
+            else:
+                self._medicion[2] += 1
+        return fila
+
+    def fetchmany(self, size=None):
+        tamaño = self.arraysize if size is None else size
+        filas = self._leer(super().fetchmany, tamaño)
+        if self._medicion is not None:
+            self._medicion[2] += len(filas)
+            if len(filas) < tamaño:
+                self._terminar()
+        return filas
+
+    def fetchall(self):
+        filas = self._leer(super().fetchall)
+        if self._medicion is not None:
+            self._medicion[2] += len(filas)
+            self._terminar()
+        return filas
+
+    def __next__(self):
+        try:
+            fila = self._leer(super().__next__)
+        except StopIteration:
+            self._terminar()
+            raise
+        if self._medicion is not None:
+            self._medicion[2] += 1
+        return fila
+
+    def close(self):
+        self._terminar()
+        super().close()
+
+    def __del__(self):
+        # Cursores descartados sin leer todas sus filas (p. ej. execute(...).fetchone()).
+        # El recolector puede correr en cualquier hilo y en medio de otra sentencia:
+        # aquí no se toman locks ni se lanza EXPLAIN, la medición queda pendiente
+        # y la registra la conexión en su próxima sentencia o al cerrarse
+        medicion, self._medicion = self._medicion, None
+        if medicion is not None:
+            try:
+                self.connection._pendientes.append(medicion)
+            except Exception:
+                pass
+
+    def _terminar(self):
+        medicion, self._medicion = self._medicion, None
+        if medicion is None:
+            return
+        conn = self.connection
+        conn.estadisticas.registrar(*medicion[:4], conn, *medicion[4:])
+
+
+class ConexionInstrumentada(sqlite3.Connection):
+    """Conexión de sqlite3 cuyos cursores, commit y rollback se miden en EstadisticasSQL"""
+
+    def instrumentar(self, estadisticas):
+        self.estadisticas = estadisticas
+        self._midiendo = 0
+        self._expandida = None
+        self._pendientes = deque()  # Mediciones de cursores descartados (ver CursorInstrumentado.__del__)
+        self.set_trace_callback(self._rastrear)
+
+    def registrar_pendientes(self):
+        """Registra, en el hilo dueño de la conexión, las mediciones de cursores ya descartados"""
+        while self._pendientes:
+            medicion = self._pendientes.popleft()
+            self.estadisticas.registrar(*medicion[:4], self, *medicion[4:])
+
+    def _rastrear(self, sentencia):
+        # SQLite avisa al empezar cada sentencia; la última es la que se está midiendo
+        # (los EXPLAIN del registro de lentas no se cuentan)
+        if self._midiendo:
+            self._expandida = sentencia
+        elif not sentencia.startswith("EXPLAIN QUERY PLAN "):
+            self.estadisticas.contar_no_medida(sentencia)
+
+    def cursor(self, factory=CursorInstrumentado):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, secuencia):
+        return self.cursor().executemany(sql, secuencia)
+
+    def _medir(self, sentencia, funcion):
+        self.registrar_pendientes()
+        if not self.in_transaction:
+            return funcion()
+        origen = _origen_consulta()
+        self._midiendo += 1
+        inicio = time.perf_counter()
+        try:
+            return funcion()
+        finally:
+            self._midiendo -= 1
+            self.estadisticas.registrar(sentencia, time.perf_counter() - inicio, 0, origen)
+
+    def commit(self):
+        return self._medir("COMMIT", super().commit)
+
+    def rollback(self):
+        return self._medir("ROLLBACK", super().rollback)
+
+    def close(self):
+        self.registrar_pendientes()
+        super().close()
+
+
+# =================== GESTOR DE CONEXIONES =============================
+class _ConexionPrestada:
+    """Envoltura de una conexión compartida: close() la devuelve en lugar de cerrarla"""
+
+    def __init__(self, gestor, conn):
+        self._gestor = gestor
+        self._conn = conn
+        self._devuelta = False
+
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
+
+    def close(self):
+        if not self._devuelta:
+            self._devuelta = True
+            self._gestor._devolver(self._conn)
+
+
+class GestorConexiones:
+    """Conexiones SQLite reutilizables por hilo, configuradas una sola vez.
+
+    Cada hilo obtiene siempre la misma conexión, de modo que las pantallas
+    ya no pagan el costo de abrir/cerrar el archivo en cada consulta y la
+    caché de páginas de SQLite se conserva entre clics.
+    """
+
+    def __init__(self, ruta=DB_PATH, pragmas=None, timeout=5.0, estadisticas=None):
+        self.ruta = ruta
+        self.pragmas = dict(pragmas or {})
+        self.timeout = timeout
+        # Con un EstadisticasSQL, cada conexión mide sus sentencias en él
+        self.estadisticas = estadisticas
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conexiones = []
+
+    def _configurar(self, conn):
+        # Los PRAGMA se aplican una sola vez, al crear la conexión del hilo
+        for nombre, valor in self.pragmas.items():
+            conn.execute(f"PRAGMA {nombre} = {valor}")
+
+    def obtener(self):
+        """Devuelve la conexión del hilo actual, creándola si hace falta"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self.estadisticas is not None:
+                conn = sqlite3.connect(self.ruta, timeout=self.timeout, check_same_thread=False,
+                                       factory=ConexionInstrumentada)
+                conn.instrumentar(self.estadisticas)
+            else:
+                conn = sqlite3.connect(self.ruta, timeout=self.timeout, check_same_thread=False)
+            self._configurar(conn)
+            self._local.conn = conn
+            self._local.prestamos = 0
+            with self._lock:
+                self._conexiones.append(conn)
+        return conn
+
+    def conectar(self):
+        """Presta la conexión del hilo con la interfaz de sqlite3.connect().
+
+        Al llamar close() sobre el préstamo más externo se descarta cualquier
+        transacción sin confirmar, igual que al cerrar una conexión propia.
+        """
+        conn = self.obtener()
+        self._local.prestamos += 1
+        return _ConexionPrestada(self, conn)
+
+    def _devolver(self, conn):
+        self._local.prestamos -= 1
+        if self._local.prestamos <= 0:
+            self._local.prestamos = 0
+            if conn.in_transaction:
+                conn.rollback()
+
+    @contextmanager
+    def transaccion(self, inmediata=False):
+        """Ejecuta un bloque en una transacción: commit al salir, rollback si hay error.
+
+        Las transacciones anidadas se integran en la transacción externa.
+        """
+        conn = self.obtener()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE" if inmediata else "BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+
+    def cerrar_todas(self):
+        """Cierra las conexiones de todos los hilos (al salir de la aplicación)"""
+        with self._lock:
+            conexiones, self._conexiones = self._conexiones, []
+        for conn in conexiones:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+
+# =================== SALDO DE FINANZAS ================================
+# Movimientos en el formato de la tabla de transacciones, con el filtro de la pantalla
+CONSULTA_TRANSACCIONES = """
+    SELECT 
+        id,
+        fecha,
+        concepto,
+        ingreso,
+        egreso,
+        saldo_actual
+    FROM finanzas
+"""
+
+FILTROS_TRANSACCIONES = {
+    "Ingresos": " WHERE ingreso > 0",
+    "Egresos": " WHERE egreso > 0",
+}
+
+
+class SaldoInsuficiente(Exception):
+    """El egreso solicitado deja el saldo de la empresa en negativo"""
+
+
+def leer_saldo(conn):
+    """Saldo vigente de la empresa (lectura de una sola fila)"""
+    fila = conn.execute("SELECT saldo FROM saldo_finanzas WHERE id = 1").fetchone()
+    return fila[0] if fila else 0.0
+
+
+def registrar_movimiento(cursor, fecha, concepto, ingreso=0.0, egreso=0.0, exigir_fondos=False):
+    """Inserta un movimiento en finanzas y actualiza el saldo en la misma transacción.
+
+    El saldo se incrementa con un único UPDATE ... RETURNING, que toma el bloqueo
+    de escritura antes de leerlo; así dos terminales nunca calculan el saldo sobre
+    el mismo valor anterior. Devuelve (id del movimiento, saldo resultante).
+    Con exigir_fondos=True lanza SaldoInsuficiente si el saldo quedaría negativo.
+    """
+    delta = ingreso - egreso
+    if exigir_fondos:
+        cursor.execute("""
+            UPDATE saldo_finanzas SET saldo = saldo + ?
+            WHERE id = 1 AND saldo + ? >= 0
+            RETURNING saldo
+        """, (delta, delta))
+    else:
+        cursor.execute("""
+            UPDATE saldo_finanzas SET saldo = saldo + ?
+            WHERE id = 1
+            RETURNING saldo
+        """, (delta,))
+    fila = cursor.fetchone()
+    if fila is None:
+        raise SaldoInsuficiente("Saldo insuficiente para realizar esta transacción")
+    nuevo_saldo = fila[0]
+
+    cursor.execute("""
+        INSERT INTO finanzas (fecha, concepto, ingreso, egreso, saldo_actual)
+        VALUES (?, ?, ?, ?, ?)
+    """, (fecha, concepto, ingreso, egreso, nuevo_saldo))
+    movimiento_id = cursor.lastrowid
+    sumar_movimiento_diario(cursor, fecha, ingreso, egreso)
+    return movimiento_id, nuevo_saldo
+
+
+class EscritorLibro:
+    """Hilo único que escribe los movimientos de finanzas en orden.
+
+    Los módulos encolan movimientos con enviar() y reciben un Future que se
+    resuelve con (id del movimiento, saldo resultante) una vez confirmado.
+    El hilo agrupa los movimientos pendientes en una sola transacción (group
+    commit) y asigna saldo_actual en el orden de llegada, por lo que los
+    módulos ya no compiten entre sí por el bloqueo de escritura.
+
+    Cada movimiento puede traer una operacion(cursor) con las escrituras que
+    lo acompañan (boletos, pagos, compras); se ejecuta en el mismo SAVEPOINT
+    que el movimiento, así que ambos se confirman o se descartan juntos sin
+    afectar al resto del lote.
+
+    No se debe esperar un Future mientras la conexión propia tiene una
+    transacción de escritura abierta: el escritor quedaría bloqueado.
+    """
+
+    def __init__(self, db, tam_lote=64, espera_lote=0.0):
+        self.db = db
+        self.tam_lote = tam_lote
+        self.espera_lote = espera_lote
+        self._cola = queue.Queue()
+        self._hilo = None
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._ejecutar, name="EscritorLibro", daemon=True)
+                self._hilo.start()
+
+    def enviar(self, fecha, concepto, ingreso=0.0, egreso=0.0, exigir_fondos=False,
+               operacion=None, callback=None):
+        """Encola un movimiento y devuelve un Future con (id, saldo).
+
+        El callback, si se indica, se ejecuta en el hilo escritor: desde Tk se
+        debe usar futuro.result() o reenviar el resultado con root.after().
+        """
+        futuro = Future()
+        if callback is not None:
+            futuro.add_done_callback(callback)
+        self.iniciar()
+        self._cola.put((futuro, fecha, concepto, ingreso, egreso, exigir_fondos, operacion))
+        return futuro
+
+    def detener(self, timeout=None):
+        """Procesa lo pendiente y termina el hilo escritor"""
+        if self._hilo is not None and self._hilo.is_alive():
+            self._cola.put(None)
+            self._hilo.join(timeout)
+
+    def _siguiente_lote(self):
+        lote = [self._cola.get()]
+        while lote[-1] is not None and len(lote) < self.tam_lote:
+            try:
+                if self.espera_lote:
+                    lote.append(self._cola.get(timeout=self.espera_lote))
+                else:
+                    lote.append(self._cola.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _ejecutar(self):
+        conn = self.db.obtener()
+        while True:
+            lote = self._siguiente_lote()
+            detener = lote[-1] is None
+            if detener:
+                lote.pop()
+            if lote:
+                self._escribir_lote(conn, lote)
+            if detener:
+                return
+
+    def _escribir_lote(self, conn, lote):
+        confirmados = []
+        try:
+            if conn.in_transaction:
+                conn.commit()
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.cursor()
+            for futuro, fecha, concepto, ingreso, egreso, exigir_fondos, operacion in lote:
+                if not futuro.set_running_or_notify_cancel():
+                    continue
+                cursor.execute("SAVEPOINT movimiento")
+                try:
+                    if operacion is not None:
+                        operacion(cursor)
+                    resultado = registrar_movimiento(cursor, fecha, concepto, ingreso, egreso, exigir_fondos)
+                    cursor.execute("RELEASE movimiento")
+                    confirmados.append((futuro, resultado))
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO movimiento")
+                    cursor.execute("RELEASE movimiento")
+                    futuro.set_exception(e)
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for futuro, _ in confirmados:
+                futuro.set_exception(e)
+            for futuro, *_ in lote:
+                if not futuro.done():
+                    futuro.set_exception(e)
+            return
+        for futuro, resultado in confirmados:
+            futuro.set_result(resultado)
+
+
+# =================== DISPONIBILIDAD DE ASIENTOS =======================
+# Asientos vendidos de un viaje (horario y fecha)
+CONSULTA_ASIENTOS_VENDIDOS = """
+    SELECT numero_asiento FROM boletos
+    WHERE horario_id = ? AND fecha_viaje = ?
+"""
+
+
+class MapaAsientos:
+    """Asientos de un viaje (horario_id, fecha_viaje) como mapa de bits.
+
+    El bit i vale 1 cuando el asiento i está ocupado; el bit 0 no se usa para
+    que el número de asiento coincida con la posición del bit.
+    """
+
+    def __init__(self, capacidad, ocupados=()):
+        self.capacidad = capacidad
+        self._todos = ((1 << capacidad) - 1) << 1
+        self._ocupados = 0
+        self.marcar(ocupados)
+
+    def marcar(self, asientos):
+        for numero in asientos:
+            self._ocupados |= 1 << numero
+        self._ocupados &= self._todos
+
+    def liberar(self, asientos):
+        for numero in asientos:
+            self._ocupados &= ~(1 << numero)
+
+    def ocupado(self, numero):
+        return bool(self._ocupados >> numero & 1)
+
+    def libres(self):
+        """Lista ordenada de asientos libres"""
+        bits = self._todos & ~self._ocupados
+        asientos = []
+        while bits:
+            menor = bits & -bits
+            asientos.append(menor.bit_length() - 1)
+            bits ^= menor
+        return asientos
+
+    def contiguos(self, cantidad):
+        """Primer bloque de `cantidad` asientos libres consecutivos, o None"""
+        if cantidad < 1:
+            return []
+        libres = self._todos & ~self._ocupados
+        bloque = libres
+        for desplazamiento in range(1, cantidad):
+            bloque &= libres >> desplazamiento
+            if not bloque:
+                return None
+        if not bloque:
+            return None
+        inicio = (bloque & -bloque).bit_length() - 1
+        return list(range(inicio, inicio + cantidad))
+
+    def ocupacion(self):
+        """Porcentaje de asientos vendidos"""
+        if not self.capacidad:
+            return 0.0
+        return bin(self._ocupados).count("1") * 100.0 / self.capacidad
+
+
+class MotorAsientos:
+    """Caché de MapaAsientos por (horario_id, fecha_viaje).
+
+    Cada mapa se carga de la base la primera vez que se consulta y después se
+    mantiene con marcar_vendidos() en cada venta, así que las consultas de
+    disponibilidad no vuelven a leer boletos.
+
+    Cada cambio de boletos sube la versión "boletos" de versiones_datos y las
+    ventas propias la informan a marcar_vendidos(). Antes de usar la caché se
+    revisa PRAGMA data_version en la conexión del hilo; si otra conexión
+    confirmó algo, se lee esa versión y solo se descartan los mapas si hay
+    cambios de boletos que no vinieron de ventas ya marcadas (otra taquilla,
+    una baja de horario). invalidar() descarta mapas explícitamente.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._mapas = {}
+        self._lock = threading.Lock()
+        self._generacion = 0  # Cambia con cada invalidar(); evita guardar mapas leídos antes
+        self._visto = threading.local()
+        self._version_boletos = None  # Versión de boletos que ya reflejan los mapas
+        self._versiones_marcadas = set()  # Ventas propias marcadas fuera de orden
+
+    def _revisar_cambios(self):
+        """Descarta los mapas si la base tiene boletos que no reflejan (cambios ajenos)"""
+        conn = self.db.obtener()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if getattr(self._visto, 'version', None) == version:
+            return
+        self._visto.version = version
+        boletos = leer_versiones(conn, ("boletos",))[0]
+        with self._lock:
+            if boletos != self._version_boletos:
+                self._generacion += 1
+                self._mapas.clear()
+                self._version_boletos = boletos
+                self._versiones_marcadas.clear()
+
+    def mapa(self, horario_id, fecha_viaje):
+        clave = (int(horario_id), fecha_viaje)
+        self._revisar_cambios()
+        with self._lock:
+            mapa = self._mapas.get(clave)
+            generacion = self._generacion
+        if mapa is not None:
+            return mapa
+
+        conn = self.db.conectar()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT a.capacidad
+                FROM horarios h
+                JOIN autobuses a ON h.autobus_id = a.id
+                WHERE h.id = ?
+            """, clave[:1])
+            fila = cursor.fetchone()
+            if fila is None:
+                raise ValueError(f"No existe el horario {horario_id}")
+            cursor.execute(CONSULTA_ASIENTOS_VENDIDOS, clave)
+            mapa = MapaAsientos(fila[0], (row[0] for row in cursor.fetchall()))
+        finally:
+            conn.close()
+
+        with self._lock:
+            if generacion != self._generacion:
+                return mapa  # Se invalidó mientras se leía: no se guarda una lectura quizá vieja
+            return self._mapas.setdefault(clave, mapa)
+
+    def cargar_varios(self, viajes, tam_lote=400):
+        """Mapas de varios viajes [(horario_id, fecha_viaje), ...] en un dict.
+
+        Los que no están en caché se leen con una sola consulta por cada
+        `tam_lote` viajes en lugar de dos consultas por viaje. Los horarios
+        inexistentes no aparecen en el resultado.
+        """
+        claves = list(dict.fromkeys((int(h), f) for h, f in viajes))
+        self._revisar_cambios()
+        with self._lock:
+            mapas = {clave: self._mapas[clave] for clave in claves if clave in self._mapas}
+            generacion = self._generacion
+        faltantes = [clave for clave in claves if clave not in mapas]
+        if not faltantes:
+            return mapas
+
+        conn = self.db.conectar()
+        try:
+            for inicio in range(0, len(faltantes), tam_lote):
+                lote = faltantes[inicio:inicio + tam_lote]
+                valores = ",".join("(?, ?)" for _ in lote)
+                cursor = conn.execute(f"""
+                    WITH viajes(horario_id, fecha_viaje) AS (VALUES {valores})
+                    SELECT v.horario_id, v.fecha_viaje, a.capacidad, b.numero_asiento
+                    FROM viajes v
+                    JOIN horarios h ON h.id = v.horario_id
+                    JOIN autobuses a ON h.autobus_id = a.id
+                    LEFT JOIN boletos b ON b.horario_id = v.horario_id AND b.fecha_viaje = v.fecha_viaje
+                """, [valor for clave in lote for valor in clave])
+                capacidades = {}
+                ocupados = {}
+                for horario_id, fecha_viaje, capacidad, numero in cursor:
+                    clave = (horario_id, fecha_viaje)
+                    capacidades[clave] = capacidad
+                    if numero is not None:
+                        ocupados.setdefault(clave, []).append(numero)
+                for clave, capacidad in capacidades.items():
+                    mapas[clave] = MapaAsientos(capacidad, ocupados.get(clave, ()))
+        finally:
+            conn.close()
+
+        with self._lock:
+            if generacion == self._generacion:
+                for clave in faltantes:
+                    if clave in mapas:
+                        mapas[clave] = self._mapas.setdefault(clave, mapas[clave])
+        return mapas
+
+    def libres(self, horario_id, fecha_viaje):
+        return self.mapa(horario_id, fecha_viaje).libres()
+
+    def contiguos(self, horario_id, fecha_viaje, cantidad):
+        return self.mapa(horario_id, fecha_viaje).contiguos(cantidad)
+
+    def ocupacion(self, horario_id, fecha_viaje):
+        return self.mapa(horario_id, fecha_viaje).ocupacion()
+
+    def marcar_vendidos(self, horario_id, fecha_viaje, asientos, version=None):
+        """Actualiza el mapa, si ya estaba cargado, tras confirmar una venta.
+
+        `version` es la versión de boletos que dejó la venta (reservar_asientos);
+        con ella la venta no cuenta como cambio ajeno en la siguiente revisión.
+        """
+        with self._lock:
+            mapa = self._mapas.get((int(horario_id), fecha_viaje))
+            if mapa is not None:
+                mapa.marcar(asientos)
+            if version is None or self._version_boletos is None or version <= self._version_boletos:
+                return
+            self._versiones_marcadas.add(version)
+            while self._version_boletos + 1 in self._versiones_marcadas:
+                self._version_boletos += 1
+                self._versiones_marcadas.discard(self._version_boletos)
+
+    def invalidar(self, horario_id=None, fecha_viaje=None):
+        with self._lock:
+            self._generacion += 1
+            if horario_id is None:
+                self._mapas.clear()
+                return
+            for clave in list(self._mapas):
+                if clave[0] == int(horario_id) and fecha_viaje in (None, clave[1]):
+                    del self._mapas[clave]
+
+
+# =================== RESERVA DE ASIENTOS ==============================
+# Cuáles de los asientos pedidos ya están vendidos; {} son los marcadores de la lista
+CONSULTA_ASIENTOS_EN_CONFLICTO = """
+    SELECT numero_asiento FROM boletos
+    WHERE horario_id = ? AND fecha_viaje = ? AND numero_asiento IN ({})
+"""
+
+
+class AsientosOcupados(Exception):
+    """Uno o más asientos del viaje ya estaban vendidos"""
+
+    def __init__(self, asientos):
+        self.asientos = sorted(asientos)
+        super().__init__("Asientos ya ocupados: " + ", ".join(str(a) for a in self.asientos))
+
+
+def reservar_asientos(cursor, horario_id, fecha_viaje, asientos, nombre, apellidos, fecha_compra, precio):
+    """Inserta todos los boletos de una venta con un solo executemany.
+
+    El índice único ux_boletos_asiento rechaza cualquier asiento ya vendido,
+    de modo que no hace falta consultar asiento por asiento antes de insertar.
+    Si alguno choca se deshace la venta completa y se lanza AsientosOcupados
+    con la lista de asientos en conflicto; cualquier otra violación de
+    integridad se propaga tal cual. Devuelve la versión de boletos
+    resultante (ver MotorAsientos.marcar_vendidos).
+    """
+    asientos = list(asientos)
+    if not cursor.connection.in_transaction:
+        # Sin transacción abierta, RELEASE confirmaría los boletos por separado
+        cursor.execute("BEGIN")
+    cursor.execute("SAVEPOINT reserva")
+    try:
+        pasajero_id = registrar_pasajero(cursor, nombre, apellidos)
+        cursor.executemany("""
+            INSERT INTO boletos (nombre_pasajero, apellidos_pasajero, horario_id,
+                                numero_asiento, fecha_viaje, fecha_compra, precio, pasajero_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(nombre, apellidos, horario_id, numero, fecha_viaje, fecha_compra, precio, pasajero_id)
+              for numero in asientos])
+    except sqlite3.IntegrityError as error:
+        cursor.execute("ROLLBACK TO reserva")
+        cursor.execute("RELEASE reserva")
+        marcadores = ",".join("?" * len(asientos))
+        cursor.execute(CONSULTA_ASIENTOS_EN_CONFLICTO.format(marcadores), [horario_id, fecha_viaje] + asientos)
+        ocupados = {row[0] for row in cursor.fetchall()}
+        # Asientos repetidos dentro de la misma venta
+        ocupados.update(a for a in asientos if asientos.count(a) > 1)
+        if not ocupados:
+            # Otra restricción (NOT NULL, CHECK...): no es un choque de asientos
+            raise
+        raise AsientosOcupados(ocupados) from error
+    sumar_compra_pasajero(cursor, pasajero_id, len(asientos), fecha_compra, precio * len(asientos))
+    sumar_venta_diaria(cursor, horario_id, fecha_compra, len(asientos), precio * len(asientos))
+    version = incrementar_version(cursor, "boletos")
+    cursor.execute("RELEASE reserva")
+    return version
+
+
+class RetencionesAsientos:
+    """Asientos apartados temporalmente durante el cobro.
+
+    Cada terminal (proceso) aparta los asientos que el agente selecciona por
+    `ttl` segundos. Las retenciones propias se guardan en memoria y todas se
+    registran en la tabla retenciones_asientos para que las vean las demás
+    terminales. Un hilo de fondo borra las vencidas cada `intervalo` segundos.
+    """
+
+    def __init__(self, db, ttl=300, intervalo=30):
+        self.db = db
+        self.ttl = ttl
+        self.intervalo = intervalo
+        self.terminal = uuid.uuid4().hex
+        self._propias = {}  # (horario_id, fecha_viaje, numero_asiento) -> expira
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def iniciar(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._limpiar_periodicamente,
+                                          name="RetencionesAsientos", daemon=True)
+            self._hilo.start()
+
+    def detener(self):
+        """Termina la limpieza de fondo y suelta las retenciones de esta terminal"""
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join()
+        self.soltar_terminal()
+
+    def soltar_terminal(self, terminal=None):
+        """Suelta todas las retenciones de una terminal (por omisión, esta)"""
+        with self.db.transaccion(inmediata=True) as conn:
+            conn.execute("DELETE FROM retenciones_asientos WHERE terminal = ?", (terminal or self.terminal,))
+        if terminal is None:
+            with self._lock:
+                self._propias.clear()
+
+    def retener(self, horario_id, fecha_viaje, asientos, terminal=None):
+        """Deja retenidos exactamente `asientos` para este viaje.
+
+        Suelta las retenciones propias del viaje que ya no están en la lista y
+        renueva o crea las demás. Devuelve los asientos que no se pudieron
+        retener porque otra terminal los tiene apartados. `terminal` es la
+        taquilla a cuyo nombre se retiene cuando no es esta (servidor de ventas).
+        Si esta terminal ya tiene exactamente esos asientos y les queda más de
+        la mitad del ttl, no se vuelve a escribir en la base.
+        """
+        self.iniciar()
+        horario_id = int(horario_id)
+        asientos = set(asientos)
+        propia = terminal is None
+        terminal = terminal or self.terminal
+        ahora = time.time()
+        expira = ahora + self.ttl
+        if propia:
+            with self._lock:
+                vigentes = {c[2]: e for c, e in self._propias.items() if c[:2] == (horario_id, fecha_viaje)}
+            if set(vigentes) == asientos and all(e - ahora > self.ttl / 2 for e in vigentes.values()):
+                return []
+        with self.db.transaccion(inmediata=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                DELETE FROM retenciones_asientos
+                WHERE horario_id = ? AND fecha_viaje = ? AND (terminal = ? OR expira <= ?)
+            """, (horario_id, fecha_viaje, terminal, ahora))
+            cursor.execute("""
+                SELECT numero_asiento FROM retenciones_asientos
+                WHERE horario_id = ? AND fecha_viaje = ?
+            """, (horario_id, fecha_viaje))
+            ajenos = {row[0] for row in cursor.fetchall()} & asientos
+            cursor.executemany("""
+                INSERT INTO retenciones_asientos (horario_id, fecha_viaje, numero_asiento, terminal, expira)
+                VALUES (?, ?, ?, ?, ?)
+            """, [(horario_id, fecha_viaje, numero, terminal, expira)
+                  for numero in sorted(asientos - ajenos)])
+
+        if not propia:
+            return sorted(ajenos)
+        with self._lock:
+            for clave in [c for c in self._propias if c[:2] == (horario_id, fecha_viaje)]:
+                del self._propias[clave]
+            for numero in asientos - ajenos:
+                self._propias[(horario_id, fecha_viaje, numero)] = expira
+        return sorted(ajenos)
+
+    def soltar(self, horario_id, fecha_viaje, terminal=None):
+        """Suelta todas las retenciones propias de un viaje"""
+        return self.retener(horario_id, fecha_viaje, (), terminal)
+
+    def retenidos_por_otros(self, horario_id, fecha_viaje, terminal=None):
+        """Asientos del viaje apartados por otras terminales y aún vigentes"""
+        conn = self.db.conectar()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT numero_asiento FROM retenciones_asientos
+                WHERE horario_id = ? AND fecha_viaje = ? AND terminal <> ? AND expira > ?
+            """, (int(horario_id), fecha_viaje, terminal or self.terminal, time.time()))
+            return {row[0] for row in cursor.fetchall()}
+        finally:
+            conn.close()
+
+    def verificar_y_consumir(self, cursor, horario_id, fecha_viaje, asientos, terminal=None):
+        """Dentro de la transacción de venta: rechaza asientos apartados por otra
+        terminal (AsientosOcupados) y borra las retenciones propias vendidas.
+
+        `terminal` indica a nombre de quién se vende cuando no es esta
+        terminal (el servidor de ventas vende por las taquillas).
+        """
+        horario_id = int(horario_id)
+        asientos = list(asientos)
+        marcadores = ",".join("?" * len(asientos))
+        cursor.execute(f"""
+            SELECT numero_asiento FROM retenciones_asientos
+            WHERE horario_id = ? AND fecha_viaje = ? AND numero_asiento IN ({marcadores})
+              AND terminal <> ? AND expira > ?
+        """, [horario_id, fecha_viaje] + asientos + [terminal or self.terminal, time.time()])
+        ajenos = {row[0] for row in cursor.fetchall()}
+        if ajenos:
+            raise AsientosOcupados(ajenos)
+        cursor.execute(f"""
+            DELETE FROM retenciones_asientos
+            WHERE horario_id = ? AND fecha_viaje = ? AND numero_asiento IN ({marcadores})
+        """, [horario_id, fecha_viaje] + asientos)
+
+    def olvidar(self, horario_id, fecha_viaje, asientos):
+        """Quita de memoria las retenciones consumidas por una venta confirmada"""
+        with self._lock:
+            for numero in asientos:
+                self._propias.pop((int(horario_id), fecha_viaje, numero), None)
+
+    def limpiar_vencidas(self):
+        ahora = time.time()
+        with self.db.transaccion(inmediata=True) as conn:
+            borradas = conn.execute("DELETE FROM retenciones_asientos WHERE expira <= ?", (ahora,)).rowcount
+        with self._lock:
+            for clave in [c for c, expira in self._propias.items() if expira <= ahora]:
+                del self._propias[clave]
+        return borradas
+
+    def _limpiar_periodicamente(self):
+        while not self._detener.wait(self.intervalo):
+            try:
+                self.limpiar_vencidas()
+            except sqlite3.Error:
+                pass  # Base ocupada: se reintenta en el siguiente ciclo
+
+
+# =================== EXISTENCIAS DE INVENTARIO ========================
+class ExistenciaInsuficiente(Exception):
+    """La salida solicitada supera la cantidad disponible del producto"""
+
+
+# Recalcula las existencias desde el historial completo de compras y salidas
+CONSULTA_EXISTENCIAS_HISTORIAL = """
+    WITH total_compras AS (
+        SELECT
+            tipo_producto,
+            descripcion,
+            MIN(id) AS producto_id,
+            SUM(cantidad) AS cantidad_comprada,
+            SUM(precio_unitario) AS suma_precios,
+            COUNT(*) AS num_compras,
+            MAX(fecha) AS ultimo_movimiento
+        FROM compras
+        GROUP BY tipo_producto, descripcion
+    ),
+    total_salidas AS (
+        SELECT tipo_producto, descripcion, SUM(cantidad) AS cantidad_salida
+        FROM salidas_inventario
+        GROUP BY tipo_producto, descripcion
+    )
+    SELECT
+        c.tipo_producto,
+        c.descripcion,
+        c.producto_id,
+        (SELECT proveedor_id FROM compras WHERE id = c.producto_id),
+        c.cantidad_comprada,
+        COALESCE(s.cantidad_salida, 0),
+        c.suma_precios,
+        c.num_compras,
+        c.ultimo_movimiento
+    FROM total_compras c
+    LEFT JOIN total_salidas s ON c.tipo_producto = s.tipo_producto AND c.descripcion = s.descripcion
+"""
+
+
+# Entradas (compras) y salidas en el formato de la tabla de movimientos
+CONSULTA_ENTRADAS_INVENTARIO = """
+    SELECT 
+        c.id, 
+        c.fecha, 
+        'Entrada' as tipo, 
+        c.tipo_producto, 
+        c.descripcion, 
+        c.cantidad, 
+        p.nombre,
+        '' as responsable,
+        '' as notas
+    FROM compras c
+    JOIN proveedores p ON c.proveedor_id = p.id
+"""
+
+CONSULTA_SALIDAS_INVENTARIO = """
+    SELECT 
+        s.id,
+        s.fecha,
+        'Salida' as tipo,
+        s.tipo_producto,
+        s.descripcion,
+        s.cantidad,
+        s.destino,
+        s.responsable,
+        s.notas
+    FROM salidas_inventario s
+"""
+
+# Salidas en el formato de la tabla de salidas
+CONSULTA_SALIDAS = """
+    SELECT 
+        id,
+        fecha,
+        tipo_producto,
+        descripcion,
+        cantidad,
+        destino,
+        responsable,
+        notas
+    FROM salidas_inventario
+"""
+
+# Compras con su proveedor, en el formato del historial de compras
+CONSULTA_HISTORIAL_COMPRAS = """
+    SELECT c.id, c.fecha, p.nombre, c.tipo_producto, c.descripcion, 
+           c.cantidad, c.precio_unitario, c.total 
+    FROM compras c 
+    JOIN proveedores p ON c.proveedor_id = p.id 
+"""
+
+# Productos con existencias disponibles, en el formato de la tabla de inventario
+CONSULTA_INVENTARIO = """
+    SELECT
+        e.producto_id,
+        e.tipo_producto,
+        e.descripcion,
+        e.cantidad_comprada - e.cantidad_salida AS cantidad_disponible,
+        e.suma_precios / e.num_compras AS precio_promedio,
+        e.ultimo_movimiento,
+        p.nombre AS proveedor,
+        e.proveedor_id
+    FROM existencias e
+    JOIN proveedores p ON e.proveedor_id = p.id
+    WHERE e.cantidad_comprada - e.cantidad_salida > 0
+"""
+
+
+def consulta_salidas(desde=None, hasta=None, tipo_producto=None):
+    """CONSULTA_SALIDAS entre dos fechas y de un tipo (None = todos); devuelve (sql, parámetros)"""
+    query = CONSULTA_SALIDAS
+    params = []
+    if desde is not None:
+        query += " WHERE fecha BETWEEN ? AND ?"
+        params += [desde, hasta]
+    if tipo_producto is not None:
+        query += (" AND" if params else " WHERE") + " tipo_producto = ?"
+        params.append(tipo_producto)
+    return query, params
+
+
+def consulta_historial_compras(tipo_producto=None):
+    """CONSULTA_HISTORIAL_COMPRAS de un tipo de producto (None = todos); devuelve (sql, parámetros)"""
+    if tipo_producto is None:
+        return CONSULTA_HISTORIAL_COMPRAS, []
+    return CONSULTA_HISTORIAL_COMPRAS + " WHERE c.tipo_producto = ?", [tipo_producto]
+
+
+def consulta_inventario(tipo_producto=None, proveedor=None):
+    """CONSULTA_INVENTARIO con los filtros indicados (None = todos); devuelve (sql, parámetros)"""
+    query = CONSULTA_INVENTARIO
+    params = []
+    if tipo_producto is not None:
+        query += " AND e.tipo_producto = ?"
+        params.append(tipo_producto)
+    if proveedor is not None:
+        query += " AND p.nombre = ?"
+        params.append(proveedor)
+    return query + " ORDER BY e.tipo_producto, e.descripcion", params
+
+
+def registrar_entrada_existencias(cursor, producto_id, fecha, proveedor_id, tipo_producto,
+                                  descripcion, cantidad, precio_unitario):
+    """Suma una compra a las existencias de su producto (misma transacción que la compra).
+
+    El producto conserva el id y el proveedor de su primera compra, igual que la
+    consulta agregada que reemplaza.
+    """
+    cursor.execute("""
+        INSERT INTO existencias (tipo_producto, descripcion, producto_id, proveedor_id,
+                                 cantidad_comprada, suma_precios, num_compras, ultimo_movimiento)
+        VALUES (?, ?, ?, ?, ?, ?, 1, ?)
+        ON CONFLICT (tipo_producto, descripcion) DO UPDATE SET
+            cantidad_comprada = cantidad_comprada + excluded.cantidad_comprada,
+            suma_precios = suma_precios + excluded.suma_precios,
+            num_compras = num_compras + 1,
+            ultimo_movimiento = MAX(ultimo_movimiento, excluded.ultimo_movimiento)
+    """, (tipo_producto, descripcion, producto_id, proveedor_id, cantidad, precio_unitario, fecha))
+
+
+def registrar_salida_existencias(cursor, tipo_producto, descripcion, cantidad):
+    """Descuenta una salida de las existencias y devuelve la cantidad restante.
+
+    La comprobación de disponibilidad va en el mismo UPDATE, así dos terminales
+    no pueden sacar a la vez las mismas unidades. Lanza ExistenciaInsuficiente
+    si no alcanza.
+    """
+    cursor.execute("""
+        UPDATE existencias SET cantidad_salida = cantidad_salida + ?
+        WHERE tipo_producto = ? AND descripcion = ?
+          AND cantidad_comprada - cantidad_salida >= ?
+        RETURNING cantidad_comprada - cantidad_salida
+    """, (cantidad, tipo_producto, descripcion, cantidad))
+    fila = cursor.fetchone()
+    if fila is None:
+        raise ExistenciaInsuficiente(f"No hay suficiente cantidad disponible de {tipo_producto} - {descripcion}")
+    return fila[0]
+
+
+def reconstruir_existencias(cursor):
+    """Reemplaza la tabla existencias con el recálculo desde el historial"""
+    cursor.execute("DELETE FROM existencias")
+    cursor.execute("""
+        INSERT INTO existencias (tipo_producto, descripcion, producto_id, proveedor_id,
+                                 cantidad_comprada, cantidad_salida, suma_precios,
+                                 num_compras, ultimo_movimiento)
+    """ + CONSULTA_EXISTENCIAS_HISTORIAL)
+    return cursor.rowcount
+
+
+def verificar_existencias(conn):
+    """Compara existencias con el recálculo desde el historial.
+
+    Devuelve una lista de (tipo_producto, descripcion, materializado, recalculado)
+    con las cantidades disponibles que no coinciden; vacía si todo cuadra.
+    """
+    materializado = {
+        (row[0], row[1]): row[2] for row in conn.execute("""
+            SELECT tipo_producto, descripcion, cantidad_comprada - cantidad_salida FROM existencias
+        """)
+    }
+    recalculado = {
+        (row[0], row[1]): row[4] - row[5] for row in conn.execute(CONSULTA_EXISTENCIAS_HISTORIAL)
+    }
+    diferencias = []
+    for clave in sorted(set(materializado) | set(recalculado)):
+        if materializado.get(clave) != recalculado.get(clave):
+            diferencias.append(clave + (materializado.get(clave), recalculado.get(clave)))
+    return diferencias
+
+
+# =================== ACUMULADOS PARA REPORTES =========================
+# (tabla, columnas que forman la llave, recálculo desde el historial completo)
+ACUMULADOS_REPORTES = [
+    ("ventas_diarias_ruta", 2, """
+        SELECT substr(b.fecha_compra, 1, 10) AS dia, h.ruta_id, COUNT(*), SUM(b.precio)
+        FROM boletos b
+        JOIN horarios h ON b.horario_id = h.id
+        GROUP BY dia, h.ruta_id
+    """),
+    ("movimientos_diarios", 1, """
+        SELECT substr(fecha, 1, 10) AS dia, COUNT(*), SUM(ingreso), SUM(egreso)
+        FROM finanzas
+        GROUP BY dia
+    """),
+    ("compras_diarias_categoria", 2, """
+        SELECT substr(fecha, 1, 10) AS dia, tipo_producto, COUNT(*), SUM(total)
+        FROM compras
+        GROUP BY dia, tipo_producto
+    """),
+]
+
+
+def sumar_venta_diaria(cursor, horario_id, fecha_compra, boletos, total):
+    """Suma una venta al acumulado del día de su ruta (misma transacción que los boletos)"""
+    cursor.execute("""
+        INSERT INTO ventas_diarias_ruta (dia, ruta_id, boletos, total)
+        SELECT substr(?, 1, 10), ruta_id, ?, ? FROM horarios WHERE id = ?
+        ON CONFLICT (dia, ruta_id) DO UPDATE SET
+            boletos = boletos + excluded.boletos,
+            total = total + excluded.total
+    """, (fecha_compra, boletos, total, horario_id))
+    incrementar_version(cursor, "ventas_diarias_ruta")
+
+
+def sumar_movimiento_diario(cursor, fecha, ingreso, egreso):
+    """Suma un movimiento de finanzas al acumulado de su día"""
+    cursor.execute("""
+        INSERT INTO movimientos_diarios (dia, movimientos, ingresos, egresos)
+        VALUES (substr(?, 1, 10), 1, ?, ?)
+        ON CONFLICT (dia) DO UPDATE SET
+            movimientos = movimientos + 1,
+            ingresos = ingresos + excluded.ingresos,
+            egresos = egresos + excluded.egresos
+    """, (fecha, ingreso, egreso))
+    incrementar_version(cursor, "movimientos_diarios")
+
+
+def sumar_compra_diaria(cursor, fecha, tipo_producto, total):
+    """Suma una compra al acumulado del día de su categoría"""
+    cursor.execute("""
+        INSERT INTO compras_diarias_categoria (dia, tipo_producto, compras, total)
+        VALUES (substr(?, 1, 10), ?, 1, ?)
+        ON CONFLICT (dia, tipo_producto) DO UPDATE SET
+            compras = compras + 1,
+            total = total + excluded.total
+    """, (fecha, tipo_producto, total))
+    incrementar_version(cursor, "compras_diarias_categoria")
+
+
+# Resta de ventas_diarias_ruta los boletos de un horario, por día de compra
+CONSULTA_DESCONTAR_VENTAS_HORARIO = """
+    UPDATE ventas_diarias_ruta SET
+        boletos = ventas_diarias_ruta.boletos - b.boletos,
+        total = ventas_diarias_ruta.total - b.total
+    FROM (
+        SELECT substr(fecha_compra, 1, 10) AS dia, COUNT(*) AS boletos, SUM(precio) AS total
+        FROM boletos WHERE horario_id = ?
+        GROUP BY dia
+    ) b
+    WHERE ventas_diarias_ruta.dia = b.dia
+      AND ventas_diarias_ruta.ruta_id = (SELECT ruta_id FROM horarios WHERE id = ?)
+"""
+
+
+def descontar_ventas_horario(cursor, horario_id):
+    """Quita de los acumulados de ventas los boletos de un horario que se va a borrar"""
+    cursor.execute(CONSULTA_DESCONTAR_VENTAS_HORARIO, (horario_id, horario_id))
+    cursor.execute("DELETE FROM ventas_diarias_ruta WHERE boletos <= 0")
+    incrementar_version(cursor, "ventas_diarias_ruta")
+
+
+def reconstruir_acumulados(cursor):
+    """Reemplaza las tablas de acumulados con el recálculo desde el historial"""
+    for tabla, _, consulta in ACUMULADOS_REPORTES:
+        cursor.execute(f"DELETE FROM {tabla}")
+        cursor.execute(f"INSERT INTO {tabla} " + consulta)
+
+
+def verificar_acumulados(conn):
+    """Compara cada tabla de acumulados con el recálculo desde el historial.
+
+    Devuelve una lista de (tabla, llave, guardado, recalculado) con los
+    valores que no coinciden; vacía si todo cuadra.
+    """
+    def por_llave(filas, columnas_llave):
+        return {
+            tuple(fila[:columnas_llave]): tuple(round(v, 2) for v in fila[columnas_llave:])
+            for fila in filas
+        }
+
+    diferencias = []
+    for tabla, columnas_llave, consulta in ACUMULADOS_REPORTES:
+        guardado = por_llave(conn.execute(f"SELECT * FROM {tabla}"), columnas_llave)
+        recalculado = por_llave(conn.execute(consulta), columnas_llave)
+        for llave in sorted(set(guardado) | set(recalculado)):
+            if guardado.get(llave) != recalculado.get(llave):
+                diferencias.append((tabla, llave, guardado.get(llave), recalculado.get(llave)))
+    return diferencias
+
+
+# Informes de un rango de fechas (desde, hasta) leídos de los acumulados diarios
+CONSULTA_INFORME_VENTAS_RUTA = """
+    SELECT r.origen || ' - ' || r.destino as ruta, 
+        SUM(v.boletos) as total_boletos, 
+        SUM(v.total) as total_ventas
+    FROM ventas_diarias_ruta v
+    JOIN rutas r ON v.ruta_id = r.id
+    WHERE v.dia BETWEEN substr(?, 1, 10) AND substr(?, 1, 10)
+    GROUP BY r.id
+    ORDER BY total_ventas DESC
+"""
+
+CONSULTA_INFORME_INGRESOS_EGRESOS = """
+    SELECT SUM(ingresos), SUM(egresos)
+    FROM movimientos_diarios
+    WHERE dia BETWEEN substr(?, 1, 10) AND substr(?, 1, 10)
+"""
+
+CONSULTA_INFORME_GASTOS_CATEGORIA = """
+    SELECT tipo_producto, SUM(total) as total
+    FROM compras_diarias_categoria
+    WHERE dia BETWEEN substr(?, 1, 10) AND substr(?, 1, 10)
+    GROUP BY tipo_producto
+    ORDER BY total DESC
+"""
+
+
+# =================== CACHÉ DE REPORTES ================================
+def incrementar_version(cursor, tabla):
+    """Marca que cambiaron los datos de una tabla (misma transacción que el cambio).
+
+    Devuelve la nueva versión.
+    """
+    cursor.execute("""
+        INSERT INTO versiones_datos (tabla, version) VALUES (?, 1)
+        ON CONFLICT (tabla) DO UPDATE SET version = version + 1
+        RETURNING version
+    """, (tabla,))
+    return cursor.fetchone()[0]
+
+
+def leer_versiones(conn, tablas):
+    """Versión actual de cada tabla, en el mismo orden (0 si nunca cambió)"""
+    marcadores = ",".join("?" * len(tablas))
+    versiones = dict(conn.execute(
+        f"SELECT tabla, version FROM versiones_datos WHERE tabla IN ({marcadores})", tablas))
+    return tuple(versiones.get(tabla, 0) for tabla in tablas)
+
+
+class CacheReportes:
+    """Resultados de reportes recientes, válidos mientras no cambien sus tablas.
+
+    La llave es (tipo de reporte, parámetros) y cada entrada guarda las
+    versiones de las tablas de las que depende; si alguna cambió desde
+    entonces se vuelve a consultar. Se conservan las `capacidad` entradas
+    usadas más recientemente. Se usa desde los hilos del EjecutorConsultas.
+    """
+
+    def __init__(self, capacidad=32):
+        self.capacidad = capacidad
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()  # llave -> (versiones, resultados)
+        self._lock = threading.Lock()
+
+    def consultar(self, conn, tipo, parametros, tablas, consulta):
+        """Resultados de consulta(conn), desde la caché si los datos no cambiaron"""
+        llave = (tipo, tuple(parametros))
+        # Se leen antes de consultar: si algo se escribe en medio, la entrada
+        # queda con versiones viejas y la siguiente vez simplemente se repite
+        versiones = leer_versiones(conn, tuple(tablas))
+        with self._lock:
+            entrada = self._entradas.get(llave)
+            if entrada is not None and entrada[0] == versiones:
+                self._entradas.move_to_end(llave)
+                self.aciertos += 1
+                return entrada[1]
+        resultados = consulta(conn)
+        with self._lock:
+            self.fallos += 1
+            self._entradas[llave] = (versiones, resultados)
+            self._entradas.move_to_end(llave)
+            while len(self._entradas) > self.capacidad:
+                self._entradas.popitem(last=False)
+        return resultados
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+
+# =================== BÚSQUEDA DE PASAJEROS ============================
+# Clientes con sus totales, en el formato de la tabla de clientes
+CONSULTA_CLIENTES = """
+    SELECT 
+        p.id,
+        p.nombre,
+        p.apellidos,
+        p.boletos_comprados,
+        p.ultima_compra,
+        p.total_gastado
+    FROM pasajeros p
+    WHERE p.boletos_comprados > 0
+"""
+
+# Boletos de un cliente, del más reciente al más antiguo
+CONSULTA_BOLETOS_CLIENTE = """
+    SELECT 
+        b.id,
+        r.origen || ' a ' || r.destino as ruta,
+        b.fecha_viaje,
+        h.hora_salida || ' a ' || h.hora_llegada as horario,
+        b.numero_asiento,
+        b.precio,
+        b.fecha_compra
+    FROM boletos b
+    JOIN horarios h ON b.horario_id = h.id
+    JOIN rutas r ON h.ruta_id = r.id
+    WHERE b.pasajero_id = ?
+    ORDER BY b.fecha_compra DESC
+"""
+
+# Coincidencias más relevantes que se muestran de una búsqueda de clientes
+MAXIMO_RESULTADOS_BUSQUEDA = 500
+
+# Clientes encontrados por el índice FTS5, del más relevante al menos relevante.
+# Solo se conservan las MAXIMO_RESULTADOS_BUSQUEDA de mejor rango.
+CONSULTA_BUSQUEDA_PASAJEROS = f"""
+    SELECT 
+        p.id,
+        p.nombre,
+        p.apellidos,
+        p.boletos_comprados,
+        p.ultima_compra,
+        p.total_gastado,
+        f.rango
+    FROM (
+        SELECT rowid, rank AS rango FROM pasajeros_fts
+        WHERE pasajeros_fts MATCH ?
+        ORDER BY rank LIMIT {MAXIMO_RESULTADOS_BUSQUEDA}
+    ) f
+    JOIN pasajeros p ON p.id = f.rowid
+    WHERE p.boletos_comprados > 0
+"""
+
+# Recalcula los totales de cada pasajero desde sus boletos
+CONSULTA_TOTALES_PASAJEROS = """
+    SELECT
+        pasajero_id,
+        COUNT(*) AS boletos_comprados,
+        MAX(fecha_compra) AS ultima_compra,
+        SUM(precio) AS total_gastado
+    FROM boletos
+    GROUP BY pasajero_id
+"""
+
+
+def registrar_pasajero(cursor, nombre, apellidos):
+    """Da de alta al pasajero (si es nuevo) en pasajeros y en su índice FTS5; devuelve su id"""
+    cursor.execute("""
+        INSERT INTO pasajeros (nombre, apellidos) VALUES (?, ?)
+        ON CONFLICT (nombre, apellidos) DO NOTHING
+        RETURNING id
+    """, (nombre, apellidos))
+    fila = cursor.fetchone()
+    if fila is None:
+        cursor.execute("SELECT id FROM pasajeros WHERE nombre = ? AND apellidos = ?", (nombre, apellidos))
+        return cursor.fetchone()[0]
+    cursor.execute("INSERT INTO pasajeros_fts (rowid, nombre, apellidos) VALUES (?, ?, ?)",
+                   (fila[0], nombre, apellidos))
+    return fila[0]
+
+
+def sumar_compra_pasajero(cursor, pasajero_id, boletos, fecha_compra, total):
+    """Suma una venta a los totales del pasajero (misma transacción que los boletos)"""
+    cursor.execute("""
+        UPDATE pasajeros SET
+            boletos_comprados = boletos_comprados + ?,
+            ultima_compra = MAX(COALESCE(ultima_compra, ''), ?),
+            total_gastado = total_gastado + ?
+        WHERE id = ?
+    """, (boletos, fecha_compra, total, pasajero_id))
+
+
+def descontar_boletos_horario(cursor, horario_id):
+    """Quita de los totales de cada pasajero los boletos de un horario que se va a borrar"""
+    cursor.execute("""
+        UPDATE pasajeros SET
+            boletos_comprados = boletos_comprados - b.boletos,
+            total_gastado = total_gastado - b.total,
+            ultima_compra = (
+                SELECT MAX(fecha_compra) FROM boletos
+                WHERE pasajero_id = pasajeros.id AND horario_id <> ?
+            )
+        FROM (
+            SELECT pasajero_id, COUNT(*) AS boletos, SUM(precio) AS total
+            FROM boletos WHERE horario_id = ?
+            GROUP BY pasajero_id
+        ) b
+        WHERE pasajeros.id = b.pasajero_id
+    """, (horario_id, horario_id))
+    incrementar_version(cursor, "boletos")
+
+
+def reconstruir_pasajeros(cursor):
+    """Agrega los pasajeros de boletos que falten y vuelve a generar el índice FTS5"""
+    cursor.execute("""
+        INSERT OR IGNORE INTO pasajeros (nombre, apellidos)
+        SELECT DISTINCT nombre_pasajero, apellidos_pasajero FROM boletos
+    """)
+    cursor.execute("INSERT INTO pasajeros_fts (pasajeros_fts) VALUES ('rebuild')")
+
+
+def reconstruir_totales_pasajeros(cursor):
+    """Liga cada boleto con su pasajero y recalcula los totales de todos los pasajeros"""
+    cursor.execute("""
+        UPDATE boletos SET pasajero_id = p.id
+        FROM pasajeros p
+        WHERE p.nombre = boletos.nombre_pasajero AND p.apellidos = boletos.apellidos_pasajero
+          AND boletos.pasajero_id IS NOT p.id
+    """)
+    cursor.execute("UPDATE pasajeros SET boletos_comprados = 0, ultima_compra = NULL, total_gastado = 0")
+    cursor.execute("""
+        UPDATE pasajeros SET
+            boletos_comprados = t.boletos_comprados,
+            ultima_compra = t.ultima_compra,
+            total_gastado = t.total_gastado
+        FROM (""" + CONSULTA_TOTALES_PASAJEROS + """) t
+        WHERE pasajeros.id = t.pasajero_id
+    """)
+
+
+def verificar_totales_pasajeros(conn):
+    """Compara los totales guardados de cada pasajero con el recálculo desde boletos.
+
+    Devuelve una lista de (pasajero_id, guardado, recalculado) con las tuplas
+    (boletos, última compra, total) que no coinciden; vacía si todo cuadra.
+    """
+    guardado = {
+        row[0]: (row[1], row[2], round(row[3], 2)) for row in conn.execute("""
+            SELECT id, boletos_comprados, ultima_compra, total_gastado
+            FROM pasajeros WHERE boletos_comprados > 0
+        """)
+    }
+    recalculado = {
+        row[0]: (row[1], row[2], round(row[3], 2)) for row in conn.execute(CONSULTA_TOTALES_PASAJEROS)
+    }
+    diferencias = []
+    for pasajero_id in sorted(set(guardado) | set(recalculado), key=lambda x: (x is None, x)):
+        if guardado.get(pasajero_id) != recalculado.get(pasajero_id):
+            diferencias.append((pasajero_id, guardado.get(pasajero_id), recalculado.get(pasajero_id)))
+    return diferencias
+
+
+def plegar_texto(texto):
+    """Minúsculas y sin acentos, igual que el tokenizador unicode61 del índice"""
+    descompuesto = unicodedata.normalize('NFKD', texto.lower())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def a_una_edicion(a, b):
+    """True si b sale de a con una sola edición: letra borrada, cambiada, agregada o dos vecinas intercambiadas"""
+    if len(a) == len(b):
+        distintas = [i for i in range(len(a)) if a[i] != b[i]]
+        if len(distintas) == 1:
+            return True
+        return (len(distintas) == 2 and distintas[1] == distintas[0] + 1
+                and a[distintas[0]] == b[distintas[1]] and a[distintas[1]] == b[distintas[0]])
+    if abs(len(a) - len(b)) != 1:
+        return False
+    corta, larga = (a, b) if len(a) < len(b) else (b, a)
+    i = 0
+    while i < len(corta) and corta[i] == larga[i]:
+        i += 1
+    return corta[i:] == larga[i + 1:]
+
+
+def _termino_fts(termino, prefijo=False):
+    return '"' + termino.replace('"', '""') + '"' + ("*" if prefijo else "")
+
+
+def expresion_busqueda_pasajeros(conn, busqueda, max_alternativas=20):
+    """Convierte lo que escribió el usuario en una expresión MATCH para pasajeros_fts.
+
+    Cada palabra se busca como prefijo ("gonz" encuentra "González") y, si
+    tiene 4 letras o más, también como cada prefijo de un término del
+    vocabulario que quede a una letra de distancia ("gonzales", "hernadez").
+    El vocabulario se lee una sola vez por búsqueda; las variantes de cada
+    palabra se ordenan por el número de pasajeros que las usan y solo se
+    conservan las `max_alternativas` más frecuentes.
+    Devuelve None si no hay palabras que buscar.
+    """
+    palabras = re.findall(r"\w+", plegar_texto(busqueda))
+    largas = [palabra for palabra in palabras if len(palabra) >= 4]
+    prefijos = []
+    if largas:
+        # Prefijos del vocabulario con su número de pasajeros, agrupados por SQLite;
+        # basta el largo de la palabra más larga más uno para sacar los más cortos
+        prefijos = conn.execute("""
+            SELECT substr(term, 1, ?) AS prefijo, sum(doc) FROM pasajeros_vocab
+            WHERE length(term) >= ? GROUP BY prefijo
+        """, (max(map(len, largas)) + 1, min(map(len, largas)) - 1)).fetchall()
+    grupos = []
+    for palabra in palabras:
+        alternativas = [_termino_fts(palabra, prefijo=True)]
+        if len(palabra) >= 4:
+            frecuencias = Counter()
+            for prefijo, documentos in prefijos:
+                # Con una sola edición, la primera o la segunda letra se conservan
+                if palabra[0] not in prefijo[:2] and palabra[1] not in prefijo[:2]:
+                    continue
+                for largo in (len(palabra) - 1, len(palabra), len(palabra) + 1):
+                    if len(prefijo) >= largo:
+                        frecuencias[prefijo[:largo]] += documentos
+            # Quitar o agregar letras al final solo acorta o repite el prefijo
+            variantes = [(variante, documentos) for variante, documentos in frecuencias.items()
+                         if not palabra.startswith(variante) and not variante.startswith(palabra)
+                         and a_una_edicion(palabra, variante)]
+            variantes.sort(key=lambda item: (-item[1], item[0]))
+            alternativas += [_termino_fts(variante, prefijo=True)
+                             for variante, _ in variantes[:max_alternativas]]
+        grupos.append("(" + " OR ".join(alternativas) + ")")
+    return " AND ".join(grupos) or None
+
+
+def buscar_pasajeros(conn, busqueda):
+    """Clientes más relevantes para `busqueda` ordenados por (rango, id), o None si no hay palabras.
+
+    FTS5 calcula el rango de todas las coincidencias en cada consulta, así que
+    se consulta una sola vez y las páginas se recorren en memoria (CursorLista).
+    """
+    expresion = expresion_busqueda_pasajeros(conn, busqueda)
+    if expresion is None:
+        return None
+    return conn.execute("SELECT * FROM (" + CONSULTA_BUSQUEDA_PASAJEROS + ") ORDER BY rango, id",
+                        (expresion,)).fetchall()
+
+
+# =================== SERVICIOS DE NEGOCIO =============================
+# Operaciones de los módulos sin Tk: reciben argumentos simples, devuelven
+# tuplas con nombre y avisan de los problemas con excepciones. Las pantallas
+# solo leen sus widgets, llaman al servicio y muestran el resultado; los
+# scripts de carga y las entradas sin interfaz usan los mismos servicios.
+class DatosInvalidos(Exception):
+    """Faltan datos de una operación o no tienen el formato esperado"""
+
+
+class RegistroNoEncontrado(Exception):
+    """El empleado, horario o producto indicado no existe"""
+
+
+VentaBoletos = namedtuple('VentaBoletos', 'movimiento_id saldo horario_id fecha_viaje asientos total')
+Movimiento = namedtuple('Movimiento', 'movimiento_id saldo')
+PagoEmpleado = namedtuple('PagoEmpleado', 'empleado_id nombre_completo monto movimiento_id saldo')
+Compra = namedtuple('Compra', 'compra_id total movimiento_id saldo')
+SalidaInventario = namedtuple('SalidaInventario', 'salida_id cantidad')
+
+FORMATO_HORA = re.compile(r'^[0-2][0-9]:[0-5][0-9]$')
+
+
+def _ahora():
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _requeridos(*valores):
+    if any(valor is None or not str(valor).strip() for valor in valores):
+        raise DatosInvalidos("Todos los campos son obligatorios")
+
+
+def _entero(valor, mensaje):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise DatosInvalidos(mensaje) from None
+
+
+def _numero(valor, mensaje):
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        raise DatosInvalidos(mensaje) from None
+    if not math.isfinite(numero):  # "nan" e "inf" también se convierten con float()
+        raise DatosInvalidos(mensaje)
+    return numero
+
+
+class VentasService:
+    """Venta de boletos: asientos, pasajero e ingreso en una sola escritura del libro"""
+
+    def __init__(self, db, libro, asientos=None, retenciones=None):
+        self.db = db
+        self.libro = libro
+        self.asientos = asientos
+        self.retenciones = retenciones
+
+    def precio_boleto(self, horario_id):
+        conn = self.db.conectar()
+        try:
+            fila = conn.execute("""
+                SELECT r.precio_boleto FROM horarios h
+                JOIN rutas r ON h.ruta_id = r.id
+                WHERE h.id = ?
+            """, (horario_id,)).fetchone()
+        finally:
+            conn.close()
+        if fila is None:
+            raise RegistroNoEncontrado(f"No existe el horario {horario_id}")
+        return float(fila[0])
+
+    def vender_boletos(self, nombre, apellidos, horario_id, fecha_viaje, asientos,
+                       precio_unitario=None, fecha_compra=None, terminal=None):
+        """Vende `asientos` del viaje; lanza AsientosOcupados si alguno ya no está libre.
+
+        Siempre se cobra el precio vigente de la ruta del horario; un
+        `precio_unitario` del que llama solo se valida. `terminal` es la
+        taquilla que apartó los asientos cuando no es esta.
+        """
+        if asientos is not None and not isinstance(asientos, (list, tuple, set, frozenset)):
+            raise DatosInvalidos("Los asientos deben ser una lista de números")
+        asientos = [_entero(a, "Número de asiento no válido") for a in asientos or ()]
+        _requeridos(nombre, apellidos, fecha_viaje)
+        if not asientos:
+            raise DatosInvalidos("Debe seleccionar al menos un asiento")
+        if len(set(asientos)) != len(asientos):
+            raise DatosInvalidos("Hay asientos repetidos en la venta")
+        horario_id = _entero(horario_id, "Horario no válido")
+        if precio_unitario is not None and _numero(precio_unitario, "Precio no válido") <= 0:
+            raise DatosInvalidos("El precio debe ser mayor a cero")
+        precio_unitario = self.precio_boleto(horario_id)
+        fecha_compra = fecha_compra or _ahora()
+        total = precio_unitario * len(asientos)
+
+        version_boletos = []
+
+        def insertar_boletos(cursor):
+            # Se valida dentro de la transacción para no escribir nada con asientos inexistentes
+            fila = cursor.execute("""
+                SELECT a.capacidad FROM horarios h
+                JOIN autobuses a ON h.autobus_id = a.id
+                WHERE h.id = ?
+            """, (horario_id,)).fetchone()
+            if fila is None:
+                raise RegistroNoEncontrado(f"No existe el horario {horario_id}")
+            fuera = [a for a in asientos if not 1 <= a <= fila[0]]
+            if fuera:
+                raise DatosInvalidos(
+                    f"Asientos fuera del autobús (1-{fila[0]}): {', '.join(map(str, fuera))}")
+            if self.retenciones is not None:
+                self.retenciones.verificar_y_consumir(cursor, horario_id, fecha_viaje, asientos, terminal)
+            version_boletos.append(reservar_asientos(cursor, horario_id, fecha_viaje, asientos,
+                                                     nombre, apellidos, fecha_compra, precio_unitario))
+
+        # Los boletos y el ingreso se escriben juntos en el escritor de finanzas
+        concepto = f"Venta de {len(asientos)} boletos a {nombre} {apellidos}"
+        try:
+            movimiento_id, saldo = self.libro.enviar(fecha_compra, concepto, ingreso=total,
+                                                     operacion=insertar_boletos).result()
+        except AsientosOcupados:
+            # Vendidos desde otra terminal: el mapa en memoria estaba desactualizado
+            if self.asientos is not None:
+                self.asientos.invalidar(horario_id, fecha_viaje)
+            raise
+        # La venta ya está confirmada: un fallo al actualizar la memoria no debe
+        # llegar al que vendió como si no se hubiera cobrado
+        try:
+            if self.asientos is not None:
+                self.asientos.marcar_vendidos(horario_id, fecha_viaje, asientos, version_boletos[-1])
+            if self.retenciones is not None and terminal is None:
+                self.retenciones.olvidar(horario_id, fecha_viaje, asientos)
+        except Exception:
+            if self.asientos is not None:
+                self.asientos.invalidar(horario_id, fecha_viaje)
+        return VentaBoletos(movimiento_id, saldo, horario_id, fecha_viaje, asientos, total)
+
+
+class FinanzasService:
+    """Ingresos y egresos capturados a mano en el módulo de finanzas"""
+
+    def __init__(self, db, libro):
+        self.db = db
+        self.libro = libro
+
+    def saldo(self):
+        conn = self.db.conectar()
+        try:
+            return leer_saldo(conn)
+        finally:
+            conn.close()
+
+    def registrar_transaccion(self, tipo, concepto, monto, fecha=None):
+        """Registra un "Ingreso" o "Egreso"; lanza SaldoInsuficiente si no alcanza el saldo"""
+        _requeridos(tipo, concepto, monto)
+        monto = _numero(monto, "El monto debe ser un número válido")
+        if monto <= 0:
+            raise DatosInvalidos("El monto debe ser mayor a cero")
+        if tipo not in ("Ingreso", "Egreso"):
+            raise DatosInvalidos("El tipo debe ser Ingreso o Egreso")
+        ingreso, egreso = (monto, 0.0) if tipo == "Ingreso" else (0.0, monto)
+        return Movimiento(*self.libro.enviar(fecha or _ahora(), concepto, ingreso=ingreso, egreso=egreso,
+                                             exigir_fondos=True).result())
+
+
+class RHService:
+    """Pagos de nómina: el pago y su egreso se confirman juntos"""
+
+    def __init__(self, db, libro):
+        self.db = db
+        self.libro = libro
+
+    def realizar_pago(self, empleado_id, fecha=None):
+        """Paga el salario del empleado; lanza SaldoInsuficiente si no alcanza el saldo"""
+        empleado_id = _entero(empleado_id, "Empleado no válido")
+        conn = self.db.conectar()
+        try:
+            empleado = conn.execute("""
+                SELECT nombre, apellidos, salario
+                FROM empleados
+                WHERE id = ?
+            """, (empleado_id,)).fetchone()
+        finally:
+            conn.close()
+        if not empleado:
+            raise RegistroNoEncontrado("Empleado no encontrado")
+
+        nombre_completo = f"{empleado[0]} {empleado[1]}"
+        monto = float(empleado[2])
+        concepto = f"Pago de salario a {nombre_completo}"
+        fecha = fecha or _ahora()
+
+        def insertar_pago(cursor):
+            cursor.execute("""
+                INSERT INTO pagos_empleados (empleado_id, fecha, monto, concepto)
+                VALUES (?, ?, ?, ?)
+            """, (empleado_id, fecha, monto, concepto))
+
+        movimiento_id, saldo = self.libro.enviar(fecha, concepto, egreso=monto, exigir_fondos=True,
+                                                 operacion=insertar_pago).result()
+        return PagoEmpleado(empleado_id, nombre_completo, monto, movimiento_id, saldo)
+
+
+class InventarioService:
+    """Compras a proveedores (entradas) y salidas de inventario"""
+
+    def __init__(self, db, libro):
+        self.db = db
+        self.libro = libro
+
+    def registrar_compra(self, proveedor_id, tipo_producto, descripcion, cantidad, precio_unitario, fecha=None):
+        """Registra la compra, su entrada de existencias y el egreso en finanzas"""
+        _requeridos(proveedor_id, tipo_producto, descripcion, cantidad, precio_unitario)
+        proveedor_id = _entero(proveedor_id, "Proveedor no válido")
+        cantidad = _entero(cantidad, "Cantidad y precio deben ser números válidos")
+        precio_unitario = _numero(precio_unitario, "Cantidad y precio deben ser números válidos")
+        total = cantidad * precio_unitario
+        fecha = fecha or _ahora()
+        compra = []
+
+        def insertar_compra(cursor):
+            cursor.execute("""
+                INSERT INTO compras (fecha, proveedor_id, tipo_producto, descripcion, cantidad, precio_unitario, total)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (fecha, proveedor_id, tipo_producto, descripcion, cantidad, precio_unitario, total))
+            compra.append(cursor.lastrowid)
+            registrar_entrada_existencias(cursor, cursor.lastrowid, fecha, proveedor_id, tipo_producto,
+                                          descripcion, cantidad, precio_unitario)
+            sumar_compra_diaria(cursor, fecha, tipo_producto, total)
+
+            # Si es autobús o computadora, agregar al inventario
+            # (marca y modelo se toman de las dos primeras palabras de la descripción)
+            partes = descripcion.split()
+            marca = partes[0] if len(partes) > 0 else "Desconocida"
+            modelo = partes[1] if len(partes) > 1 else "Desconocido"
+            if tipo_producto == "Autobús":
+                cursor.execute("""
+                    INSERT INTO autobuses (marca, modelo, año, capacidad, estado)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (marca, modelo, datetime.datetime.now().year, 24, "Nuevo"))
+            elif tipo_producto == "Computadora":
+                cursor.execute("""
+                    INSERT INTO computadoras (marca, modelo, asignado_a, departamento, estado)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (marca, modelo, "", "", "Nuevo"))
+
+        # Registrar en finanzas (egreso) junto con la compra
+        concepto = f"Compra de {tipo_producto}: {descripcion}"
+        movimiento_id, saldo = self.libro.enviar(fecha, concepto, egreso=total,
+                                                 operacion=insertar_compra).result()
+        return Compra(compra[0], total, movimiento_id, saldo)
+
+    def validar_salida(self, cantidad, destino, responsable):
+        """Valida los datos de una salida y devuelve la cantidad como entero"""
+        if not str(cantidad).strip():
+            raise DatosInvalidos("El campo Cantidad es obligatorio")
+        if not str(destino or "").strip():
+            raise DatosInvalidos("El campo Destino es obligatorio")
+        if not responsable:
+            raise DatosInvalidos("El campo Responsable es obligatorio")
+        cantidad = _entero(cantidad, "La cantidad debe ser un número entero")
+        if cantidad <= 0:
+            raise DatosInvalidos("La cantidad debe ser mayor a cero")
+        return cantidad
+
+    def registrar_salida(self, producto_id, tipo_producto, descripcion, cantidad, destino, responsable,
+                         notas="", fecha=None):
+        """Registra la salida y la descuenta de existencias; lanza ExistenciaInsuficiente si no alcanza"""
+        cantidad = self.validar_salida(cantidad, destino, responsable)
+        with self.db.transaccion(inmediata=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO salidas_inventario (producto_id, fecha, tipo_producto, descripcion, cantidad, destino, responsable, notas)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (producto_id, fecha or _ahora(), tipo_producto, descripcion, cantidad, destino, responsable, notas))
+            salida_id = cursor.lastrowid
+            # Descontar de las existencias materializadas
+            registrar_salida_existencias(cursor, tipo_producto, descripcion, cantidad)
+        return SalidaInventario(salida_id, cantidad)
+
+
+class LogisticaService:
+    """Alta de horarios de las rutas"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def guardar_horario(self, ruta_id, autobus_id, hora_salida, hora_llegada, dias):
+        """Agrega un horario y devuelve su id"""
+        _requeridos(ruta_id, autobus_id, hora_salida, hora_llegada, dias)
+        # Validar formato de horas (HH:MM)
+        if not (FORMATO_HORA.match(hora_salida) and FORMATO_HORA.match(hora_llegada)):
+            raise DatosInvalidos("Formato de hora debe ser HH:MM (24 horas)")
+        ruta_id = _entero(ruta_id, "Selección de ruta o autobús no válida")
+        autobus_id = _entero(autobus_id, "Selección de ruta o autobús no válida")
+
+        with self.db.transaccion() as conn:
+            cursor = conn.execute("""
+                INSERT INTO horarios (ruta_id, autobus_id, hora_salida, hora_llegada, dias_semana)
+                VALUES (?, ?, ?, ?, ?)
+            """, (ruta_id, autobus_id, hora_salida, hora_llegada, dias))
+            return cursor.lastrowid
+
+
+# =================== CLIENTE DE LA API DE VENTAS =======================
+class ClienteAPI:
+    """Cliente HTTP/JSON del servidor de ventas (servidor_api.py).
+
+    Ofrece los mismos métodos que VentasService, MotorAsientos y
+    RetencionesAsientos para la pantalla de ventas, así que la taquilla los
+    sustituye por este cliente cuando hay API_URL. Los errores del servidor se
+    vuelven a lanzar con su tipo (AsientosOcupados, DatosInvalidos, ...).
+    `terminal` es el id con el que el servidor aparta los asientos de esta taquilla.
+    """
+
+    ERRORES = {
+        'DatosInvalidos': DatosInvalidos,
+        'RegistroNoEncontrado': RegistroNoEncontrado,
+        'SaldoInsuficiente': SaldoInsuficiente,
+    }
+
+    def __init__(self, url, terminal=None, timeout=10):
+        self.url = url.rstrip('/')
+        self.terminal = terminal or uuid.uuid4().hex
+        self.timeout = timeout
+
+    def _pedir(self, metodo, ruta, datos=None, **parametros):
+        # urllib.request carga http.client y ssl: solo se importa si se usa la API
+        import urllib.error
+        import urllib.parse
+        import urllib.request
+
+        url = self.url + ruta
+        if parametros:
+            url += '?' + urllib.parse.urlencode(parametros)
+        cuerpo = json.dumps(datos).encode('utf-8') if datos is not None else None
+        peticion = urllib.request.Request(url, data=cuerpo, method=metodo,
+                                          headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(peticion, timeout=self.timeout) as respuesta:
+                return json.loads(respuesta.read())
+        except urllib.error.HTTPError as e:
+            try:
+                error = json.loads(e.read())
+            except ValueError:
+                raise RuntimeError(f"Error del servidor de ventas ({e.code})") from None
+        if error.get('tipo') == 'AsientosOcupados':
+            raise AsientosOcupados(error.get('asientos', ()))
+        raise self.ERRORES.get(error.get('tipo'), RuntimeError)(error.get('error'))
+
+    # Lo que la pantalla de ventas usa de MotorAsientos
+    def mapa(self, horario_id, fecha_viaje):
+        datos = self._pedir('GET', '/asientos', horario_id=horario_id, fecha_viaje=fecha_viaje)
+        libres = set(datos['libres'])
+        return MapaAsientos(datos['capacidad'],
+                            (n for n in range(1, datos['capacidad'] + 1) if n not in libres))
+
+    def libres(self, horario_id, fecha_viaje):
+        return self._pedir('GET', '/asientos', horario_id=horario_id, fecha_viaje=fecha_viaje)['libres']
+
+    def contiguos(self, horario_id, fecha_viaje, cantidad):
+        return self.mapa(horario_id, fecha_viaje).contiguos(cantidad)
+
+    def ocupacion(self, horario_id, fecha_viaje):
+        return self.mapa(horario_id, fecha_viaje).ocupacion()
+
+    def marcar_vendidos(self, horario_id, fecha_viaje, asientos, version=None):
+        pass  # El servidor mantiene sus mapas
+
+    def invalidar(self, horario_id=None, fecha_viaje=None):
+        """Descarta los mapas del servidor tras editar o borrar un horario"""
+        try:
+            self._pedir('POST', '/asientos/invalidar', {'horario_id': horario_id, 'fecha_viaje': fecha_viaje})
+        except (OSError, RuntimeError):
+            pass  # El cambio ya está guardado; descartar los mapas del servidor es solo una ayuda
+
+    # Lo que la pantalla de ventas usa de RetencionesAsientos
+    def retener(self, horario_id, fecha_viaje, asientos):
+        return self._pedir('POST', '/retenciones', {
+            'horario_id': horario_id, 'fecha_viaje': fecha_viaje,
+            'asientos': list(asientos), 'terminal': self.terminal,
+        })['ajenos']
+
+    def soltar(self, horario_id, fecha_viaje):
+        return self.retener(horario_id, fecha_viaje, ())
+
+    def retenidos_por_otros(self, horario_id, fecha_viaje):
+        return set(self._pedir('GET', '/retenciones', horario_id=horario_id, fecha_viaje=fecha_viaje,
+                               terminal=self.terminal)['retenidos'])
+
+    def detener(self):
+        """Suelta las retenciones de esta taquilla al cerrar"""
+        try:
+            self._pedir('DELETE', '/retenciones', terminal=self.terminal)
+        except (OSError, RuntimeError):
+            pass  # Servidor caído: las retenciones vencen solas
+
+    # Lo que la pantalla de ventas usa de VentasService
+    def precio_boleto(self, horario_id):
+        return self._pedir('GET', '/precio', horario_id=horario_id)['precio']
+
+    def vender_boletos(self, nombre, apellidos, horario_id, fecha_viaje, asientos,
+                       precio_unitario=None, fecha_compra=None, terminal=None):
+        # El servidor cobra el precio de la ruta y fecha la venta: precio_unitario
+        # y fecha_compra se aceptan solo por compatibilidad con VentasService
+        datos = self._pedir('POST', '/boletos', {
+            'nombre': nombre, 'apellidos': apellidos, 'horario_id': horario_id,
+            'fecha_viaje': fecha_viaje, 'asientos': list(asientos),
+            'terminal': terminal or self.terminal,
+        })
+        return VentaBoletos(**datos)
+
+    def buscar_clientes(self, busqueda, limite=50):
+        return self._pedir('GET', '/clientes', q=busqueda, limite=limite)['clientes']
+
+    def cursor_clientes(self, busqueda, limite=500):
+        """Resultados de buscar_clientes para una TablaVirtual, en el formato de CONSULTA_CLIENTES"""
+        return CursorLista(lambda: [tuple(c.values())[:6] for c in self.buscar_clientes(busqueda, limite)])
+
+    def saldo(self):
+        return self._pedir('GET', '/saldo')['saldo']
+
+
+# =================== CONSULTAS EN SEGUNDO PLANO ========================
+class _TareaConsulta:
+    def __init__(self, consulta, al_terminar, mensaje_error, clave, al_fallar=None):
+        self.consulta = consulta
+        self.al_terminar = al_terminar
+        self.mensaje_error = mensaje_error
+        self.clave = clave
+        self.al_fallar = al_fallar
+        self.cancelada = False
+        self.conn = None  # Conexión del hilo trabajador mientras la consulta corre
+        # Protege conn: la conexión del hilo se reutiliza en su siguiente consulta
+        # y un interrupt() tardío la abortaría
+        self.lock = threading.Lock()
+
+
+class EjecutorConsultas:
+    """Ejecuta las consultas de las pantallas en hilos trabajadores.
+
+    consulta(conn) corre fuera del hilo de Tk y su resultado se entrega a
+    al_terminar(resultado) en el hilo de Tk, revisando la cola con root.after;
+    si falla se muestra el error y se llama a al_fallar(error), si se indicó.
+    Una tarea nueva con la misma clave reemplaza a la anterior, y cancelar()
+    descarta todas las pendientes e interrumpe las que están en curso (se usa
+    al cambiar de módulo). al_cambiar_estado(ocupado) permite mostrar un
+    indicador de carga mientras haya consultas pendientes.
+    """
+
+    def __init__(self, root, db, hilos=2, intervalo=50, al_cambiar_estado=None):
+        self.root = root
+        self.db = db
+        self.intervalo = intervalo
+        self.al_cambiar_estado = al_cambiar_estado
+        self._pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="Consultas")
+        self._resultados = queue.Queue()
+        self._tareas = set()
+        self._lock = threading.Lock()
+        self._revisando = False
+
+    def ejecutar(self, consulta, al_terminar, mensaje_error="Error al consultar la base de datos", clave=None,
+                 al_fallar=None):
+        """Encola una consulta; devuelve la tarea (útil para cancelarla)"""
+        tarea = _TareaConsulta(consulta, al_terminar, mensaje_error, clave, al_fallar)
+        with self._lock:
+            if clave is not None:
+                for anterior in [t for t in self._tareas if t.clave == clave]:
+                    self._cancelar_tarea(anterior)
+            self._tareas.add(tarea)
+            pendientes = len(self._tareas)
+        if pendientes == 1:
+            self._notificar(True)
+        self._pool.submit(self._correr, tarea)
+        if not self._revisando:
+            self._revisando = True
+            self.root.after(self.intervalo, self._revisar)
+        return tarea
+
+    def cancelar(self, tarea=None):
+        """Cancela una tarea o, sin argumentos, todas las pendientes"""
+        with self._lock:
+            tareas = [tarea] if tarea is not None else list(self._tareas)
+            for t in tareas:
+                self._cancelar_tarea(t)
+            vacio = not self._tareas
+        if vacio and tareas:
+            self._notificar(False)
+
+    def ocupado(self):
+        with self._lock:
+            return bool(self._tareas)
+
+    def detener(self):
+        self.cancelar()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _cancelar_tarea(self, tarea):
+        tarea.cancelada = True
+        self._tareas.discard(tarea)
+        with tarea.lock:
+            if tarea.conn is not None:  # Solo mientras la consulta sigue en curso
+                tarea.conn.interrupt()
+
+    def _correr(self, tarea):
+        conn = self.db.conectar()
+        with tarea.lock:
+            if tarea.cancelada:
+                conn.close()
+                return
+            tarea.conn = conn
+        try:
+            resultado = tarea.consulta(conn)
+            self._resultados.put((tarea, resultado, None))
+        except Exception as e:
+            self._resultados.put((tarea, None, e))
+        finally:
+            with tarea.lock:
+                tarea.conn = None
+            conn.close()
+
+    def _revisar(self):
+        while True:
+            try:
+                tarea, resultado, error = self._resultados.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                if tarea.cancelada:
+                    continue
+                self._tareas.discard(tarea)
+                vacio = not self._tareas
+            if vacio:
+                self._notificar(False)
+            try:
+                if error is not None:
+                    if tarea.al_fallar is not None:
+                        tarea.al_fallar(error)
+                    messagebox.showerror("Error", f"{tarea.mensaje_error}: {str(error)}")
+                else:
+                    tarea.al_terminar(resultado)
+            except tk.TclError:
+                pass  # La ventana de destino se cerró antes de llegar el resultado
+
+        if self.ocupado():
+            self.root.after(self.intervalo, self._revisar)
+        else:
+            self._revisando = False
+
+    def _notificar(self, ocupado):
+        if self.al_cambiar_estado is not None:
+            self.al_cambiar_estado(ocupado)
+
+
+# =================== TABLAS VIRTUALES =================================
+class CursorKeyset:
+    """Recorre una consulta por páginas sin OFFSET (paginación por clave).
+
+    `consulta` es un SELECT sin ORDER BY; `orden` son los nombres de columnas
+    del resultado que forman la clave de orden y deben identificar cada fila
+    (se termina con el id). Cada página continúa desde la última fila de la
+    anterior con una comparación de valores de fila, así que con un índice
+    sobre la clave cuesta lo mismo sin importar cuán lejos se esté.
+    """
+
+    def __init__(self, db, consulta, orden, parametros=(), descendente=False, tam_pagina=100):
+        self.db = db
+        self.consulta = consulta
+        self.orden = tuple(orden)
+        self.parametros = tuple(parametros)
+        self.descendente = descendente
+        self.tam_pagina = tam_pagina
+        self._posiciones = None
+
+    def primera(self):
+        return self._pagina(None, adelante=True)
+
+    def siguiente(self, ultima_fila):
+        """Página que sigue a `ultima_fila` en el orden de la consulta"""
+        return self._pagina(ultima_fila, adelante=True)
+
+    def anterior(self, primera_fila):
+        """Página que precede a `primera_fila`, en el orden de la consulta"""
+        return self._pagina(primera_fila, adelante=False)
+
+    def rango(self, desde=None, hasta=None):
+        """Filas entre `desde` y `hasta` (incluidas; None = sin límite), en el orden de la consulta"""
+        condiciones, parametros = [], []
+        for fila, menor in ((desde, False), (hasta, True)):
+            if fila is not None:
+                condiciones.append(self._comparacion('<=' if menor != self.descendente else '>='))
+                parametros.extend(self.clave(fila))
+        return self._consultar(condiciones, parametros, self.descendente, None)
+
+    def misma_consulta(self, otro):
+        return (otro is not None and self.consulta == otro.consulta and self.orden == otro.orden
+                and self.parametros == otro.parametros and self.descendente == otro.descendente)
+
+    def clave(self, fila):
+        return tuple(fila[i] for i in self._posiciones)
+
+    def _comparacion(self, operador):
+        marcadores = ", ".join("?" * len(self.orden))
+        return f"({', '.join(self.orden)}) {operador} ({marcadores})"
+
+    def sentencia_siguiente(self, clave):
+        """(sql, parámetros) con que se pide la página que sigue a una fila de esa clave"""
+        return self._sentencia([self._comparacion('<' if self.descendente else '>')], list(clave),
+                               self.descendente, self.tam_pagina)
+
+    def _pagina(self, desde, adelante):
+        descendente = self.descendente == adelante
+        condiciones, parametros = [], []
+        if desde is not None:
+            condiciones.append(self._comparacion('<' if descendente else '>'))
+            parametros.extend(self.clave(desde))
+        filas = self._consultar(condiciones, parametros, descendente, self.tam_pagina)
+        return filas if adelante else filas[::-1]
+
+    def _sentencia(self, condiciones, parametros_clave, descendente, limite):
+        sql = f"SELECT * FROM ({self.consulta})"
+        if condiciones:
+            sql += " WHERE " + " AND ".join(condiciones)
+        sentido = " DESC" if descendente else ""
+        sql += " ORDER BY " + ", ".join(c + sentido for c in self.orden)
+        parametros = list(self.parametros) + list(parametros_clave)
+        if limite is not None:
+            sql += " LIMIT ?"
+            parametros.append(limite)
+        return sql, parametros
+
+    def _consultar(self, condiciones, parametros_clave, descendente, limite):
+        sql, parametros = self._sentencia(condiciones, parametros_clave, descendente, limite)
+        conn = self.db.conectar()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql, parametros)
+            filas = cursor.fetchall()
+            if self._posiciones is None:
+                nombres = [d[0] for d in cursor.description]
+                self._posiciones = [nombres.index(c) for c in self.orden]
+        finally:
+            conn.close()
+        return filas
+
+
+class CursorLista:
+    """Mismas páginas que CursorKeyset sobre filas ya ordenadas que se obtienen
+    de una sola vez con obtener() (p. ej. del servidor de ventas).
+
+    obtener() se llama al pedir la primera página, así que con una
+    TablaVirtual en segundo plano corre fuera del hilo de Tk.
+    """
+
+    def __init__(self, obtener, tam_pagina=100):
+        self.obtener = obtener
+        self.tam_pagina = tam_pagina
+        self._filas = []
+        self._indices = {}
+        self._posiciones = None
+
+    def primera(self):
+        self._filas = [tuple(fila) for fila in self.obtener()]
+        self._indices = {fila: i for i, fila in enumerate(self._filas)}
+        return self._filas[:self.tam_pagina]
+
+    def siguiente(self, ultima_fila):
+        inicio = self._indices[tuple(ultima_fila)] + 1
+        return self._filas[inicio:inicio + self.tam_pagina]
+
+    def anterior(self, primera_fila):
+        fin = self._indices[tuple(primera_fila)]
+        return self._filas[max(0, fin - self.tam_pagina):fin]
+
+    def rango(self, desde=None, hasta=None):
+        inicio = 0 if desde is None else self._indices[tuple(desde)]
+        fin = len(self._filas) if hasta is None else self._indices[tuple(hasta)] + 1
+        return self._filas[inicio:fin]
+
+    def misma_consulta(self, otro):
+        return otro is self
+
+
+def actualizar_filas(tree, filas):
+    """Aplica a un Treeview solo las diferencias con lo que ya muestra.
+
+    `filas` es la lista completa deseada de (iid, valores, tags), con el iid
+    tomado de la llave primaria. Se borran, insertan o modifican únicamente
+    las filas que cambiaron, así que la selección se conserva y la primera
+    fila visible sigue en su lugar.
+    """
+    mostradas = getattr(tree, 'filas_mostradas', None)
+    if mostradas is None:
+        # Primera carga (o la llenó otro código): se parte de cero
+        tree.delete(*tree.get_children())
+        mostradas = {}
+
+    hijos = tree.get_children()
+    superior = hijos[min(len(hijos) - 1, round(tree.yview()[0] * len(hijos)))] if hijos else None
+
+    deseadas = {}
+    for iid, valores, tags in filas:
+        deseadas[str(iid)] = (tuple(valores), tuple(tags))
+    borradas = [iid for iid in mostradas if iid not in deseadas]
+    if borradas:
+        tree.delete(*borradas)
+
+    # Si las filas que se quedan conservan su orden relativo basta con insertar
+    # las nuevas en su posición; si no, se reacomodan
+    actuales = [iid for iid in tree.get_children()]
+    quedan = [str(iid) for iid, _, _ in filas if str(iid) in mostradas]
+    reordenar = actuales != quedan
+
+    for indice, (iid, valores, tags) in enumerate(filas):
+        iid = str(iid)
+        anterior = mostradas.get(iid)
+        if anterior is None:
+            tree.insert("", indice, iid=iid, values=valores, tags=tags)
+        else:
+            if anterior != deseadas[iid]:
+                tree.item(iid, values=valores, tags=tags)
+            if reordenar:
+                tree.move(iid, "", indice)
+    tree.filas_mostradas = deseadas
+
+    if superior is not None and superior in deseadas:
+        hijos = tree.get_children()
+        tree.yview_moveto(hijos.index(superior) / len(hijos))
+
+
+class TablaVirtual:
+    """Treeview que solo mantiene en pantalla una ventana de filas de un CursorKeyset.
+
+    Al acercarse al final del desplazamiento pide la página siguiente y, al
+    volver arriba, la anterior; nunca guarda más de `paginas_en_memoria`
+    páginas, de modo que la memoria y el costo de cada paso no dependen del
+    tamaño de la tabla. `formatear(fila)` devuelve (valores, tags) para el
+    Treeview y `clave_item(fila)`, si se da, el iid de cada fila.
+    Con `paginas_en_memoria=None` no se descarta nada: cada página se agrega
+    debajo de las anteriores ("cargar anteriores").
+    Con un EjecutorConsultas las páginas se piden fuera del hilo de Tk.
+    """
+
+    def __init__(self, tree, formatear=None, clave_item=None, paginas_en_memoria=3,
+                 ejecutor=None, mensaje_error="Error al cargar datos"):
+        self.tree = tree
+        self.formatear = formatear or (lambda fila: (fila, ()))
+        self.clave_item = clave_item
+        self.paginas_en_memoria = paginas_en_memoria
+        self.ejecutor = ejecutor
+        self.mensaje_error = mensaje_error
+        self.cursor = None
+        self._paginas = deque()  # (iids, primera fila, última fila)
+        self._inicio = True
+        self._fin = True
+        self._cargando = False
+        self._generacion = 0
+        self._desplazar = tree.cget("yscrollcommand")
+        tree.configure(yscrollcommand=self._al_desplazar)
+
+    def cargar(self, cursor):
+        """Muestra la primera página del cursor.
+
+        Si es la misma consulta que ya se muestra (p. ej. tras guardar un
+        registro), solo se refresca la ventana actual con refrescar().
+        """
+        if self.clave_item is not None and self._paginas and cursor.misma_consulta(self.cursor):
+            cursor._posiciones = self.cursor._posiciones
+            self.cursor = cursor
+            return self.refrescar()
+        self._generacion += 1
+        self.cursor = cursor
+        self._paginas.clear()
+        self.tree.delete(*self.tree.get_children())
+        self.tree.filas_mostradas = {}
+        self._inicio = True
+        self._fin = False
+        self._cargando = False
+        self._pedir(cursor.primera, self._agregar_al_final)
+
+    def refrescar(self):
+        """Vuelve a consultar las filas de la ventana actual y aplica solo los cambios"""
+        if self.cursor is None or self.clave_item is None or not self._paginas:
+            return
+        desde = None if self._inicio else self._paginas[0][1]
+        hasta = None if self._fin else self._paginas[-1][2]
+        self._generacion += 1
+        self._pedir(lambda: self.cursor.rango(desde, hasta), self._reemplazar_ventana)
+
+    def _reemplazar_ventana(self, filas):
+        actualizar_filas(self.tree, [(self.clave_item(fila),) + tuple(self.formatear(fila)) for fila in filas])
+        tam = self.cursor.tam_pagina
+        self._paginas.clear()
+        for i in range(0, len(filas), tam):
+            pagina = filas[i:i + tam]
+            self._paginas.append(([str(self.clave_item(f)) for f in pagina], pagina[0], pagina[-1]))
+
+    def _pedir(self, consulta, al_terminar):
+        self._cargando = True
+        generacion = self._generacion
+
+        def entregar(filas):
+            if generacion != self._generacion:
+                return
+            self._cargando = False
+            al_terminar(filas)
+
+        def fallar(error):
+            # Sin esto la tabla quedaría esperando la página y no volvería a pedir otra
+            if generacion == self._generacion:
+                self._cargando = False
+
+        if self.ejecutor is not None:
+            self.ejecutor.ejecutar(lambda conn: consulta(), entregar, self.mensaje_error, clave=self,
+                                   al_fallar=fallar)
+        else:
+            try:
+                filas = consulta()
+            except Exception as e:
+                self._cargando = False
+                messagebox.showerror("Error", f"{self.mensaje_error}: {str(e)}")
+                return
+            entregar(filas)
+
+    def _insertar(self, posicion, filas):
+        iids = []
+        mostradas = self.tree.filas_mostradas
+        for i, fila in enumerate(filas):
+            valores, tags = self.formatear(fila)
+            opciones = {"values": valores, "tags": tags}
+            if self.clave_item is not None:
+                opciones["iid"] = str(self.clave_item(fila))
+            indice = tk.END if posicion == tk.END else posicion + i
+            iid = self.tree.insert("", indice, **opciones)
+            mostradas[iid] = (tuple(valores), tuple(tags))
+            iids.append(iid)
+        return iids
+
+    def _quitar(self, iids):
+        self.tree.delete(*iids)
+        for iid in iids:
+            self.tree.filas_mostradas.pop(iid, None)
+
+    def _fila_superior(self):
+        total = len(self.tree.get_children())
+        return round(self.tree.yview()[0] * total)
+
+    def _mover_a(self, fila):
+        total = len(self.tree.get_children())
+        if total:
+            self.tree.yview_moveto(max(0, fila) / total)
+
+    def _agregar_al_final(self, filas):
+        if len(filas) < self.cursor.tam_pagina:
+            self._fin = True
+        if not filas:
+            return
+        superior = self._fila_superior()
+        self._paginas.append((self._insertar(tk.END, filas), filas[0], filas[-1]))
+        if self.paginas_en_memoria is not None and len(self._paginas) > self.paginas_en_memoria:
+            iids = self._paginas.popleft()[0]
+            self._quitar(iids)
+            self._inicio = False
+            self._mover_a(superior - len(iids))
+
+    def _agregar_al_inicio(self, filas):
+        if len(filas) < self.cursor.tam_pagina:
+            self._inicio = True
+        if not filas:
+            return
+        superior = self._fila_superior()
+        self._paginas.appendleft((self._insertar(0, filas), filas[0], filas[-1]))
+        if self.paginas_en_memoria is not None and len(self._paginas) > self.paginas_en_memoria:
+            self._quitar(self._paginas.pop()[0])
+            self._fin = False
+        self._mover_a(superior + len(filas))
+
+    def _al_desplazar(self, primero, ultimo):
+        if self._desplazar:
+            self.tree.tk.call(*self.tree.tk.splitlist(self._desplazar), primero, ultimo)
+        if self.cursor is None or self._cargando:
+            return
+        if float(ultimo) > 0.9 and not self._fin and self._paginas:
+            ultima = self._paginas[-1][2]
+            self._pedir(lambda: self.cursor.siguiente(ultima), self._agregar_al_final)
+        elif float(primero) < 0.1 and not self._inicio and self._paginas:
+            primera = self._paginas[0][1]
+            self._pedir(lambda: self.cursor.anterior(primera), self._agregar_al_inicio)
+
+
+# =================== CALENDARIOS =====================================
+def selector_fecha(padre, **opciones):
+    """DateEntry de tkcalendar; se importa al mostrar el primer calendario y no al iniciar"""
+    from tkcalendar import DateEntry
+    return DateEntry(padre, **opciones)
+
+
+# =================== IMÁGENES ========================================
+class CacheImagenes:
+    """Imágenes redimensionadas por (ruta, tamaño), decodificadas una sola vez.
+
+    En memoria guarda la variante PIL y el PhotoImage; en disco guarda el PNG
+    ya redimensionado con la fecha de modificación del original en el
+    nombre, así que al reiniciar la taquilla el logo se lee tal cual (Tk lo
+    carga sin PIL ni LANCZOS) y si el original cambia se vuelve a generar.
+    Los PhotoImage pertenecen a la ventana Tk: se usa desde el hilo de la UI.
+    """
+
+    def __init__(self, directorio=DIRECTORIO_CACHE_IMAGENES):
+        self.directorio = directorio
+        self._imagenes = {}  # (ruta, tamaño) -> (mtime, imagen PIL)
+        self._fotos = {}     # (ruta, tamaño) -> (mtime, PhotoImage)
+        self.errores_guardado = 0  # Variantes que no se pudieron escribir en disco
+
+    def _prefijo(self, ruta, tamaño):
+        nombre = os.path.splitext(os.path.basename(ruta))[0]
+        return f"{nombre}_{tamaño[0]}x{tamaño[1]}_"
+
+    def ruta_en_disco(self, ruta, tamaño, mtime):
+        return os.path.join(self.directorio, f"{self._prefijo(ruta, tamaño)}{mtime}.png")
+
+    def imagen(self, ruta, tamaño):
+        """Variante PIL de `ruta` redimensionada a `tamaño` (ancho, alto)"""
+        from PIL import Image
+
+        llave = (ruta, tuple(tamaño))
+        mtime = os.stat(ruta).st_mtime_ns
+        entrada = self._imagenes.get(llave)
+        if entrada is not None and entrada[0] == mtime:
+            return entrada[1]
+        en_disco = self.ruta_en_disco(ruta, tamaño, mtime)
+        if os.path.exists(en_disco):
+            imagen = Image.open(en_disco)
+            imagen.load()
+        else:
+            imagen = Image.open(ruta).resize(tuple(tamaño), Image.LANCZOS)
+            self._guardar(imagen, ruta, tamaño, en_disco)
+        self._imagenes[llave] = (mtime, imagen)
+        return imagen
+
+    def foto(self, ruta, tamaño):
+        """PhotoImage de `ruta` redimensionada, listo para un tk.Label"""
+        llave = (ruta, tuple(tamaño))
+        mtime = os.stat(ruta).st_mtime_ns
+        entrada = self._fotos.get(llave)
+        if entrada is not None and entrada[0] == mtime:
+            return entrada[1]
+        en_disco = self.ruta_en_disco(ruta, tamaño, mtime)
+        if not os.path.exists(en_disco):
+            self.imagen(ruta, tamaño)
+        if os.path.exists(en_disco):
+            foto = tk.PhotoImage(file=en_disco)
+        else:
+            # Sin caché en disco (carpeta de solo lectura): se convierte desde PIL
+            from PIL import ImageTk
+            foto = ImageTk.PhotoImage(self.imagen(ruta, tamaño))
+        self._fotos[llave] = (mtime, foto)
+        return foto
+
+    def _guardar(self, imagen, ruta, tamaño, en_disco):
+        """Escribe la variante en disco y borra las de versiones anteriores del original"""
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            temporal = en_disco + ".tmp"
+            imagen.save(temporal, format="PNG")
+            os.replace(temporal, en_disco)
+            prefijo = self._prefijo(ruta, tamaño)
+            for archivo in os.listdir(self.directorio):
+                anterior = os.path.join(self.directorio, archivo)
+                if archivo.startswith(prefijo) and anterior != en_disco:
+                    os.remove(anterior)
+        except OSError:
+            # Sin caché en disco la imagen se sigue sirviendo desde memoria
+            self.errores_guardado += 1
+
+
+# =================== GRÁFICOS ========================================
+class EspacioGrafico:
+    """Figura y canvas de un gráfico que se reutilizan en cada ejecución de su reporte.
+
+    El canvas es hijo de `contenedor`, un frame que sobrevive entre
+    ejecuciones, y se empaca con mostrar() dentro del frame que arme cada
+    reporte (`in_`), así que limpiar los resultados no lo destruye.
+    """
+
+    def __init__(self, contenedor, figsize=(6, 4), dpi=100, facecolor='white'):
+        # matplotlib se importa con el primer gráfico y no al iniciar la aplicación
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+        self.contenedor = contenedor
+        self.figura = Figure(figsize=figsize, dpi=dpi, facecolor=facecolor)
+        self.ejes = self.figura.add_subplot(111)
+        self.canvas = FigureCanvasTkAgg(self.figura, contenedor)
+        self.widget = self.canvas.get_tk_widget()
+        self.categorias = None
+        self.artistas = None
+
+    def vigente(self, contenedor=None):
+        return ((contenedor is None or contenedor is self.contenedor)
+                and bool(self.widget.winfo_exists()))
+
+    def graficar(self, categorias, dibujar, actualizar):
+        """Dibuja el gráfico reutilizando sus artistas.
+
+        Con las mismas categorías (eje X) que la vez anterior solo se llama a
+        actualizar(ejes, artistas) para cambiar los datos en sitio; si no, se
+        limpian los ejes y dibujar(ejes) arma el gráfico y devuelve un dict
+        con sus artistas ('barras' o 'linea' y 'etiquetas').
+        """
+        categorias = tuple(categorias)
+        if self.artistas and categorias and categorias == self.categorias:
+            actualizar(self.ejes, self.artistas)
+        else:
+            self.ejes.clear()
+            self.artistas = dibujar(self.ejes) or {}
+            self.categorias = categorias
+        self.canvas.draw_idle()
+
+    def mostrar(self, dentro=None, **opciones):
+        self.widget.pack(in_=dentro or self.contenedor, **opciones)
+        # El frame del reporte se crea después que el canvas y quedaría encima
+        # de él en el orden de apilado; se sube el canvas sobre sus hermanos
+        self.widget.lift()
+
+    def cerrar(self):
+        # Un dibujo pendiente sobre un canvas destruido fallaría en el after_idle
+        pendiente = getattr(self.canvas, '_idle_draw_id', None)
+        if self.widget.winfo_exists():
+            if pendiente:
+                self.widget.after_cancel(pendiente)
+            self.widget.destroy()
+        self.figura.clear()
+        self.artistas = None
+
+
+def actualizar_valores(ejes, artistas, valores, formato, desfase=0.0, limites_y=None):
+    """Cambia en sitio los valores de un gráfico de barras o de línea ya dibujado.
+
+    Mueve y reescribe las etiquetas de valor (desplazadas `desfase` veces el
+    máximo) y ajusta el eje Y con limites_y(valores) o, sin él, a los datos.
+    """
+    maximo = max(valores)
+    if 'barras' in artistas:
+        for barra, valor in zip(artistas['barras'], valores):
+            barra.set_height(valor)
+    else:
+        artistas['linea'].set_ydata(valores)
+    for etiqueta, valor in zip(artistas.get('etiquetas', ()), valores):
+        etiqueta.set_y(valor + maximo * desfase)
+        etiqueta.set_text(formato.format(valor))
+    if limites_y is not None:
+        ejes.set_ylim(*limites_y(valores))
+    else:
+        ejes.relim()
+        ejes.autoscale_view()
+
+
+class GestorGraficos:
+    """Un EspacioGrafico por nombre de gráfico, creados la primera vez que se usan.
+
+    Si el contenedor del espacio ya no existe (se volvió a abrir el módulo) se
+    cierra y se crea otro. liberar() cierra todas las figuras al salir del
+    módulo, así que la memoria no crece con cada reporte.
+    """
+
+    def __init__(self):
+        self._espacios = {}
+
+    def espacio(self, nombre, contenedor, **opciones_figura):
+        espacio = self._espacios.get(nombre)
+        if espacio is not None and not espacio.vigente(contenedor):
+            espacio.cerrar()
+            espacio = None
+        if espacio is None:
+            espacio = EspacioGrafico(contenedor, **opciones_figura)
+            self._espacios[nombre] = espacio
+        return espacio
+
+    def limpiar(self, contenedor):
+        """Destruye los widgets de `contenedor` salvo los canvas de gráficos, que solo se ocultan"""
+        canvas = {str(e.widget) for e in self._espacios.values() if e.vigente()}
+        for widget in contenedor.winfo_children():
+            if str(widget) in canvas:
+                widget.pack_forget()
+            else:
+                widget.destroy()
+
+    def liberar(self):
+        for espacio in self._espacios.values():
+            espacio.cerrar()
+        self._espacios.clear()
 
 
 # Clase principal del sistema
 class SistemaERP:
-    def __init__(self, root):
+    def __init__(self, root, perfil_bd=None):
         self.root = root
         self.root.title("Sistema ERP -  Enlaces Terestres Nacionales")
         self.root.geometry("800x600")
         self.root.resizable(True, True)
+
+        # Latencias de las sentencias SQL y registro de lentas (pantalla "Consultas SQL")
+        self.estadisticas_sql = EstadisticasSQL() if INSTRUMENTAR_SQL else None
+        
+        # Conexiones compartidas a la base de datos con el perfil de almacenamiento
+        self.db = GestorConexiones(DB_PATH, perfil_almacenamiento(perfil_bd), estadisticas=self.estadisticas_sql)
+        
+        # Escritor único de movimientos de finanzas (su hilo arranca con el primer movimiento)
+        self.libro = EscritorLibro(self.db)
+        
+        # Con servidor de ventas, la disponibilidad, las retenciones, la venta de
+        # boletos y la búsqueda de clientes pasan por él
+        self.api = ClienteAPI(API_URL) if API_URL else None
+        if self.api is not None:
+            self.asientos = self.retenciones = self.ventas = self.api
+        else:
+            self.asientos = MotorAsientos(self.db)
+            self.retenciones = RetencionesAsientos(self.db)
+            self.ventas = VentasService(self.db, self.libro, self.asientos, self.retenciones)
+        self.errores_retencion = 0  # Retenciones de asientos que fallaron (ver retener_asientos_seleccionados)
         
-        # Crear la base de datos y tablas
-        self.crear_base_datos()
+        # Operaciones de negocio sin Tk que usan las pantallas
+        self.finanzas = FinanzasService(self.db, self.libro)
+        self.inventario = InventarioService(self.db, self.libro)
+        self.rh = RHService(self.db, self.libro)
+        self.logistica = LogisticaService(self.db)
         
-        # Crear usuarios predefinidos para administradores y jefes
-        self.crear_usuarios_predefinidos()
+        # Consultas de pantallas y reportes fuera del hilo de Tk
+        self.consultas = EjecutorConsultas(self.root, self.db, al_cambiar_estado=self.mostrar_indicador_carga)
+        
+        # Resultados de reportes mientras no cambien los acumulados que leen
+        self.cache_reportes = CacheReportes()
+        
+        # Figuras de los gráficos, reutilizadas entre reportes
+        self.graficos = GestorGraficos()
+        
+        # Logo redimensionado, compartido por el login y los módulos
+        self.imagenes = CacheImagenes()
+
+        # Crear la base de datos y tablas; con servidor de ventas el esquema es suyo
+        if self.api is None:
+            self.crear_base_datos()
+        
+            # Crear usuarios predefinidos para administradores y jefes
+            self.crear_usuarios_predefinidos()
         
         # Iniciar con la pantalla de login
         self.mostrar_login()
     
     def crear_base_datos(self):
         # Conectar a la base de datos (se crea si no existe)
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         cursor = conn.cursor()
         
         # Tabla de usuarios
@@ -188,13 +3236,43 @@ class SistemaERP:
         )
         ''')
         
+        # Tabla de salidas de inventario
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS salidas_inventario (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            producto_id INTEGER,
+            fecha TEXT,
+            tipo_producto TEXT,
+            descripcion TEXT,
+            cantidad INTEGER,
+            destino TEXT,
+            responsable TEXT,
+            notas TEXT,
+            FOREIGN KEY(producto_id) REFERENCES compras(id)
+        )
+        ''')
+        
+        # Tabla de inventario
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS inventario (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            producto_id INTEGER,
+            tipo_producto TEXT,
+            descripcion TEXT,
+            cantidad INTEGER,
+            fecha_actualizacion TEXT,
+            FOREIGN KEY(producto_id) REFERENCES compras(id)
+        )
+        ''')
+        
+        # Índices y demás cambios versionados del esquema
+        migrar_esquema(conn)
+        
         # Insertar saldo inicial en finanzas
         cursor.execute("SELECT COUNT(*) FROM finanzas")
         if cursor.fetchone()[0] == 0:
-            cursor.execute('''
-            INSERT INTO finanzas (fecha, concepto, ingreso, egreso, saldo_actual)
-            VALUES (?, ?, ?, ?, ?)
-            ''', (datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "Saldo inicial", 100000000, 0, 100000000))
+            registrar_movimiento(cursor, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                                 "Saldo inicial", ingreso=100000000)
         
         # Insertar proveedores predefinidos
         cursor.execute("SELECT COUNT(*) FROM proveedores")
@@ -220,7 +3298,7 @@ class SistemaERP:
         def hash_password(password):
             return hashlib.sha256(password.encode()).hexdigest()
         
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         cursor = conn.cursor()
         
         # Verificar si ya existen usuarios
@@ -254,7 +3332,7 @@ class SistemaERP:
         base_username = f"{nombre_simple[0:3]}{apellido_simple[0:3]}"
         
         # Verificar si ya existe
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         cursor = conn.cursor()
         
         cursor.execute("SELECT username FROM usuarios WHERE username LIKE ?", (f"{base_username}%",))
@@ -280,8 +3358,7 @@ class SistemaERP:
     
     def mostrar_login(self):
         # Limpiar ventana
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        self.limpiar_ventana()
 
         # Fondo de la ventana
         self.root.configure(bg="#e6ecf0")
@@ -292,9 +3369,7 @@ class SistemaERP:
 
         # Cargar y mostrar el logo
         try:
-            logo_img = Image.open("logo.png")
-            logo_img = logo_img.resize((150, 150), Image.LANCZOS)  # Usa LANCZOS para mejor calidad
-            self.logo_tk = ImageTk.PhotoImage(logo_img)  # IMPORTANTE: guardar como atributo de clase
+            self.logo_tk = self.imagenes.foto("logo.png", (150, 150))  # IMPORTANTE: guardar como atributo de clase
             logo_label = tk.Label(login_frame, image=self.logo_tk, bg="white")
             logo_label.pack(pady=(0, 20))
         except Exception as e:
@@ -355,7 +3430,7 @@ class SistemaERP:
         hashed_password = hashlib.sha256(password.encode()).hexdigest()
         
         # Verificar en la base de datos
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -387,8 +3462,7 @@ class SistemaERP:
         from tkinter import font as tkfont
         
         # Limpiar ventana
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        self.limpiar_ventana()
 
         # Configurar fondo de la ventana
         self.root.configure(bg="#e6ecf0")
@@ -498,16 +3572,8 @@ class SistemaERP:
 
         # Cargar, redimensionar y mostrar logo
         try:
-            # Cargar la imagen original
-            original_logo = tk.PhotoImage(file="logo.png")
-            
-            # Redimensionar la imagen (ajustar estos valores según necesites)
-            width = 200  # Ancho deseado
-            height = 200  # Alto deseado
-            logo_img = original_logo.subsample(
-                max(1, original_logo.width() // width),
-                max(1, original_logo.height() // height)
-            )
+            # Logo redimensionado desde la caché (ajustar el tamaño según necesites)
+            logo_img = self.imagenes.foto("logo.png", (200, 200))
             
             # Mostrar logo centrado
             logo_label = tk.Label(logo_frame, image=logo_img, bg="white")
@@ -560,23 +3626,26 @@ class SistemaERP:
             ("Proveedores", self.mostrar_modulo_proveedores),
             ("Ventas", self.mostrar_modulo_ventas),
             ("Logística", self.mostrar_modulo_logistica),
-            ("Reportes Generales", self.mostrar_reportes_generales)
+            ("Reportes Generales", self.mostrar_reportes_generales),
+            ("Consultas SQL", self.mostrar_consultas_sql)
         ]
         
-        # Configurar el grid para 4 filas y 2 columnas
+        # Configurar el grid para 5 filas y 2 columnas
         for i in range(2):  # 2 columnas
             parent_frame.grid_columnconfigure(i, weight=1, uniform="cols")
-        for i in range(4):  # 4 filas
+        for i in range(5):  # 5 filas
             parent_frame.grid_rowconfigure(i, weight=1)
         
-        # Colocar los botones en la cuadrícula 4x2
+        # Colocar los botones en la cuadrícula 5x2 (el último, solo, ocupa las dos columnas)
         for i, (texto, comando) in enumerate(departamentos):
-            row = i // 2  # 0-3 (4 filas)
+            row = i // 2  # 0-4 (5 filas)
             col = i % 2   # 0-1 (2 columnas)
+            ultimo_solo = i == len(departamentos) - 1 and col == 0
             
             # Frame contenedor para efecto hover
             btn_container = tk.Frame(parent_frame, bg="white", padx=3, pady=3)
-            btn_container.grid(row=row, column=col, padx=12, pady=12, sticky="nsew")
+            btn_container.grid(row=row, column=col, columnspan=2 if ultimo_solo else 1,
+                               padx=12, pady=12, sticky="nsew")
             
             # El botón ocupa todo el espacio del contenedor
             btn = tk.Button(
@@ -642,8 +3711,7 @@ class SistemaERP:
         self.root.configure(bg='#e6ecf0')
     
         # Limpiar ventana
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        self.limpiar_ventana()
     
         # Frame principal
         main_frame = tk.Frame(self.root, bg='#e6ecf0')
@@ -704,9 +3772,7 @@ class SistemaERP:
 
         # Logo debajo del título
         try:
-            logo_img = Image.open("logo.png")  # Asegúrate que la ruta es correcta
-            logo_img = logo_img.resize((150, 150), Image.LANCZOS)
-            self.logo_tk = ImageTk.PhotoImage(logo_img)  # Mantener en self para evitar garbage collection
+            self.logo_tk = self.imagenes.foto("logo.png", (150, 150))  # Mantener en self para evitar garbage collection
             logo_label = tk.Label(frame, image=self.logo_tk, bg='#FFFFFF')
             logo_label.pack(pady=(0, 10))
         except Exception as e:
@@ -859,14 +3925,10 @@ class SistemaERP:
         grafico_frame = tk.Frame(frame, bg='#FFFFFF')
         grafico_frame.pack(fill=tk.BOTH, expand=True, pady=10)
 
-        # Crear figura para el gráfico mejorado
-        self.figure_pagos = plt.Figure(figsize=(8, 5), dpi=100)
-        self.ax_pagos = self.figure_pagos.add_subplot(111)
-        self.figure_pagos.subplots_adjust(bottom=0.3)  # Ajustar espacio para etiquetas
-
-        # Canvas para el gráfico
-        self.canvas_pagos = FigureCanvasTkAgg(self.figure_pagos, grafico_frame)
-        self.canvas_pagos.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        # Figura y canvas del gráfico (se reutilizan en cada actualización)
+        self.grafico_pagos = self.graficos.espacio("pagos_empleados", grafico_frame, figsize=(8, 5))
+        self.grafico_pagos.figura.subplots_adjust(bottom=0.3)  # Ajustar espacio para etiquetas
+        self.grafico_pagos.mostrar(fill=tk.BOTH, expand=True)
 
         # Cargar datos iniciales
         self.cargar_empleados_lista()
@@ -942,7 +4004,7 @@ class SistemaERP:
         busqueda = self.busqueda_contrasena.get().lower()
         self.lista_empleados_contrasena.delete(0, tk.END)
 
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         cursor = conn.cursor()
 
         try:
@@ -966,7 +4028,7 @@ class SistemaERP:
 
     def cargar_empleados_para_contrasena(self):
         """Carga los empleados que tienen cuentas de usuario"""
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         cursor = conn.cursor()
 
         try:
@@ -1021,7 +4083,7 @@ class SistemaERP:
 
         contrasena_hash = hashlib.sha256(nueva_contrasena.encode()).hexdigest()
 
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         cursor = conn.cursor()
 
         try:
@@ -1070,7 +4132,7 @@ class SistemaERP:
         busqueda = self.busqueda_empleado.get().lower()
         self.lista_empleados.delete(0, tk.END)
     
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         cursor = conn.cursor()
         try:
             cursor.execute('''
@@ -1119,7 +4181,7 @@ class SistemaERP:
         fecha_contratacion = datetime.datetime.now().strftime("%Y-%m-%d")
     
         # Insertar en la base de datos
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         cursor = conn.cursor()
     
         try:
@@ -1185,52 +4247,38 @@ class SistemaERP:
             self.cargar_empleados_para_contrasena()
     
         # Actualizar gráfico de pagos si está visible
-        if hasattr(self, 'canvas_pagos'):
+        if hasattr(self, 'grafico_pagos') and self.grafico_pagos.vigente():
             self.actualizar_grafico_pagos()
     
     def cargar_empleados(self, tree, solo_activos=False, solo_despedidos=False):
-        # Limpiar treeview
-        for item in tree.get_children():
-            tree.delete(item)
+        query = '''
+        SELECT id, nombre, apellidos, edad, puesto, fecha_contratacion, salario, 
+            CASE WHEN activo = 1 THEN 'Activo' ELSE 'Despedido' END as estado
+        FROM empleados
+        '''
     
-        # Cargar empleados de la base de datos
-        conn = sqlite3.connect('erp_autobuses.db')
-        cursor = conn.cursor()
+        conditions = []
+        if solo_activos:
+            conditions.append('activo = 1')
+        if solo_despedidos:
+            conditions.append('activo = 0')
     
-        try:
-            query = '''
-            SELECT id, nombre, apellidos, edad, puesto, fecha_contratacion, salario, 
-                CASE WHEN activo = 1 THEN 'Activo' ELSE 'Despedido' END as estado
-            FROM empleados
-            '''
-        
-            conditions = []
-            if solo_activos:
-                conditions.append('activo = 1')
-            if solo_despedidos:
-                conditions.append('activo = 0')
-        
-            if conditions:
-                query += ' WHERE ' + ' AND '.join(conditions)
-        
-            # Ordenar siempre por ID (cambiar 'nombre, apellidos' por 'id')
-            query += ' ORDER BY id ASC'  # ASC para orden ascendente
-        
-            cursor.execute(query)
-        
-            for row in cursor.fetchall():
-                # Formatear el salario para mostrar 2 decimales
-                row_list = list(row)
-                if row_list[6]:  # Si tiene valor salario
-                    row_list[6] = f"${float(row_list[6]):.2f}"
-                else:
-                    row_list[6] = "$0.00"
-                tree.insert("", tk.END, values=tuple(row_list))
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al cargar empleados: {str(e)}")
-        finally:
-            conn.close()
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+    
+        def formatear(row):
+            # Formatear el salario para mostrar 2 decimales
+            row_list = list(row)
+            if row_list[6]:  # Si tiene valor salario
+                row_list[6] = f"${float(row_list[6]):.2f}"
+            else:
+                row_list[6] = "$0.00"
+            return tuple(row_list), ()
+    
+        # Ordenar siempre por ID, cargando por páginas a medida que se desplaza
+        tabla = self.tabla_virtual(tree, formatear, clave_item=lambda row: row[0],
+                                   mensaje_error="Error al cargar empleados")
+        tabla.cargar(CursorKeyset(self.db, query, ("id",)))
 
     def despedir_empleado(self, tree):
         # Obtener el elemento seleccionado
@@ -1244,7 +4292,7 @@ class SistemaERP:
     
         # Confirmar despido
         if messagebox.askyesno("Confirmar", "¿Está seguro de despedir a este empleado?"):
-            conn = sqlite3.connect('erp_autobuses.db')
+            conn = self.db.conectar()
             cursor = conn.cursor()
         
             try:
@@ -1288,7 +4336,7 @@ class SistemaERP:
                 if hasattr(self, 'lista_empleados'):
                     self.cargar_empleados_lista()  # Actualizar lista en pestaña de Pagos
             
-                if hasattr(self, 'canvas_pagos'):
+                if hasattr(self, 'grafico_pagos') and self.grafico_pagos.vigente():
                     self.actualizar_grafico_pagos()  # Actualizar gráfico de pagos
                 
                 if hasattr(self, 'lista_empleados_contrasena'):
@@ -1302,7 +4350,7 @@ class SistemaERP:
     
     def cargar_empleados_lista(self):
         self.lista_empleados.delete(0, tk.END)
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         cursor = conn.cursor()
         try:
             cursor.execute('''
@@ -1330,71 +4378,26 @@ class SistemaERP:
         empleado_str = self.lista_empleados.get(seleccion[0])
         empleado_id = int(empleado_str.split("-")[0].strip())
         
-        # Obtener datos del empleado
-        conn = sqlite3.connect('erp_autobuses.db')
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute('''
-            SELECT nombre, apellidos, salario 
-            FROM empleados 
-            WHERE id = ?
-            ''', (empleado_id,))
-            
-            empleado = cursor.fetchone()
-            if not empleado:
-                messagebox.showerror("Error", "Empleado no encontrado")
-                return
-            
-            nombre_completo = f"{empleado[0]} {empleado[1]}"
-            salario = float(empleado[2])
-            
-            # Confirmar monto del pago
-            monto = salario
-            concepto = f"Pago de salario a {nombre_completo}"
-            
-            # Verificar saldo disponible
-            cursor.execute('''
-            SELECT saldo_actual FROM finanzas 
-            ORDER BY id DESC LIMIT 1
-            ''')
-            
-            saldo_actual = cursor.fetchone()[0]
-            
-            if saldo_actual < monto:
-                messagebox.showerror("Error", "Saldo insuficiente para realizar el pago")
-                return
-            
-            # Registrar pago en la tabla de pagos
-            fecha_pago = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            cursor.execute('''
-            INSERT INTO pagos_empleados (empleado_id, fecha, monto, concepto)
-            VALUES (?, ?, ?, ?)
-            ''', (empleado_id, fecha_pago, monto, concepto))
-            
-            # Actualizar saldo en finanzas
-            nuevo_saldo = saldo_actual - monto
-            
-            cursor.execute('''
-            INSERT INTO finanzas (fecha, concepto, ingreso, egreso, saldo_actual)
-            VALUES (?, ?, ?, ?, ?)
-            ''', (fecha_pago, concepto, 0, monto, nuevo_saldo))
-            
-            conn.commit()
-            messagebox.showinfo("Éxito", f"Pago realizado exitosamente a {nombre_completo}\nMonto: ${monto:.2f}")
-            
-            # Actualizar gráfico
-            self.actualizar_grafico_pagos()
-            
+            # El pago y su egreso en finanzas se confirman juntos (verifica el saldo de forma atómica)
+            pago = self.rh.realizar_pago(empleado_id)
+        except RegistroNoEncontrado:
+            messagebox.showerror("Error", "Empleado no encontrado")
+            return
+        except SaldoInsuficiente:
+            messagebox.showerror("Error", "Saldo insuficiente para realizar el pago")
+            return
         except Exception as e:
             messagebox.showerror("Error", f"Error al realizar pago: {str(e)}")
-            conn.rollback()
-        finally:
-            conn.close()
+            return
+        
+        messagebox.showinfo("Éxito", f"Pago realizado exitosamente a {pago.nombre_completo}\nMonto: ${pago.monto:.2f}")
+        
+        # Actualizar gráfico
+        self.actualizar_grafico_pagos()
     
     def actualizar_grafico_pagos(self):
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         cursor = conn.cursor()
         try:
             # Obtener últimos 10 pagos
@@ -1407,41 +4410,50 @@ class SistemaERP:
             ''')
             pagos = cursor.fetchall()
         
-            # Limpiar gráfico actual
-            self.ax_pagos.clear()
-        
-            if pagos:
-                # Preparar datos para el gráfico
-                fechas = [pago[0][:10] for pago in reversed(pagos)]  # Solo fecha, sin hora
-                nombres = [pago[1] for pago in reversed(pagos)]
-                montos = [pago[2] for pago in reversed(pagos)]
+            # Preparar datos para el gráfico
+            nombres = [pago[1] for pago in reversed(pagos)]
+            montos = [pago[2] for pago in reversed(pagos)]
+            
+            def dibujar(ax):
+                if not pagos:
+                    ax.text(0.5, 0.5, "No hay pagos registrados", 
+                            horizontalalignment='center',
+                            verticalalignment='center',
+                            transform=ax.transAxes)
+                    return {}
             
                 # Crear gráfico de barras horizontales
-                bars = self.ax_pagos.barh(nombres, montos, color='skyblue')
+                bars = ax.barh(nombres, montos, color='skyblue')
             
                 # Configuración del gráfico
-                self.ax_pagos.set_title('Últimos Pagos Realizados', pad=20)
-                self.ax_pagos.set_xlabel('Monto ($)')
-                self.ax_pagos.set_ylabel('Empleado')
+                ax.set_title('Últimos Pagos Realizados', pad=20)
+                ax.set_xlabel('Monto ($)')
+                ax.set_ylabel('Empleado')
             
                 # Añadir etiquetas con valores
+                etiquetas = []
                 for bar in bars:
                     width = bar.get_width()
-                    self.ax_pagos.text(width + 100, bar.get_y() + bar.get_height()/2,
-                                    f"${width:,.2f}",
-                                    va='center', ha='left', fontsize=9)
+                    etiquetas.append(ax.text(width + 100, bar.get_y() + bar.get_height()/2,
+                                             f"${width:,.2f}",
+                                             va='center', ha='left', fontsize=9))
             
                 # Ajustar diseño
-                self.ax_pagos.grid(axis='x', linestyle='--', alpha=0.7)
-                self.figure_pagos.tight_layout()
-            else:
-                self.ax_pagos.text(0.5, 0.5, "No hay pagos registrados", 
-                                horizontalalignment='center',
-                                verticalalignment='center',
-                                transform=self.ax_pagos.transAxes)
+                ax.grid(axis='x', linestyle='--', alpha=0.7)
+                self.grafico_pagos.figura.tight_layout()
+                return {'barras': bars, 'etiquetas': etiquetas}
+            
+            def actualizar(ax, artistas):
+                # Mismos empleados en el mismo orden: solo cambian los montos
+                for bar, etiqueta, monto in zip(artistas['barras'], artistas['etiquetas'], montos):
+                    bar.set_width(monto)
+                    etiqueta.set_x(monto + 100)
+                    etiqueta.set_text(f"${monto:,.2f}")
+                ax.relim()
+                ax.autoscale_view()
         
             # Actualizar canvas
-            self.canvas_pagos.draw()
+            self.grafico_pagos.graficar(nombres, dibujar, actualizar)
         
         except Exception as e:
             messagebox.showerror("Error", f"Error al cargar datos de pagos: {str(e)}")
@@ -1454,7 +4466,7 @@ class SistemaERP:
         username = base_user
         counter = 1
         
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         cursor = conn.cursor()
         
         try:
@@ -1478,8 +4490,7 @@ class SistemaERP:
     
     def mostrar_modulo_finanzas(self):
         # Limpiar ventana
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        self.limpiar_ventana()
         
         # Configurar fondo general
         self.root.configure(bg='#e6ecf0')
@@ -1538,12 +4549,11 @@ class SistemaERP:
             info_frame.pack(fill=tk.X, pady=20, padx=10)
             
             # Obtener saldo actual
-            conn = sqlite3.connect('erp_autobuses.db')
+            conn = self.db.conectar()
             cursor = conn.cursor()
             
             try:
-                cursor.execute("SELECT saldo_actual FROM finanzas ORDER BY id DESC LIMIT 1")
-                saldo = cursor.fetchone()[0]
+                saldo = leer_saldo(cursor)
                 
                 # Mostrar saldo
                 tk.Label(info_frame, text="Saldo Actual:", 
@@ -1562,25 +4572,23 @@ class SistemaERP:
             grafico_frame = tk.Frame(frame, bg='white')
             grafico_frame.pack(fill=tk.BOTH, expand=True, pady=10, padx=10)
             
-            # Crear figura para el gráfico
-            figure = plt.Figure(figsize=(6, 4), dpi=100, facecolor='white')
-            self.ax_finanzas = figure.add_subplot(111)
-            self.ax_finanzas.set_facecolor('white')
+            # Figura y canvas del gráfico (se reutilizan en cada actualización)
+            self.grafico_finanzas = self.graficos.espacio("saldo_finanzas", grafico_frame)
+            ax = self.grafico_finanzas.ejes
+            ax.set_facecolor('white')
             
             # Configurar colores del gráfico
-            self.ax_finanzas.spines['bottom'].set_color('#003366')
-            self.ax_finanzas.spines['top'].set_color('#003366') 
-            self.ax_finanzas.spines['right'].set_color('#003366')
-            self.ax_finanzas.spines['left'].set_color('#003366')
-            self.ax_finanzas.tick_params(axis='x', colors='#003366')
-            self.ax_finanzas.tick_params(axis='y', colors='#003366')
-            self.ax_finanzas.yaxis.label.set_color('#003366')
-            self.ax_finanzas.xaxis.label.set_color('#003366')
-            self.ax_finanzas.title.set_color('#003366')
-            
-            # Canvas para el gráfico
-            self.canvas_finanzas = FigureCanvasTkAgg(figure, grafico_frame)
-            self.canvas_finanzas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+            ax.spines['bottom'].set_color('#003366')
+            ax.spines['top'].set_color('#003366') 
+            ax.spines['right'].set_color('#003366')
+            ax.spines['left'].set_color('#003366')
+            ax.tick_params(axis='x', colors='#003366')
+            ax.tick_params(axis='y', colors='#003366')
+            ax.yaxis.label.set_color('#003366')
+            ax.xaxis.label.set_color('#003366')
+            ax.title.set_color('#003366')
+            
+            self.grafico_finanzas.mostrar(fill=tk.BOTH, expand=True)
             
             # Cargar datos para el gráfico
             self.actualizar_grafico_finanzas()
@@ -1743,13 +4751,13 @@ class SistemaERP:
         
         # Fechas
         tk.Label(options_frame, text="Desde:", bg='white', fg='#003366').pack(side=tk.LEFT, padx=5)
-        self.fecha_desde = DateEntry(options_frame, width=12, 
+        self.fecha_desde = selector_fecha(options_frame, width=12, 
                                    background='#003366', foreground='white', 
                                    borderwidth=2, font=('Arial', 10))
         self.fecha_desde.pack(side=tk.LEFT, padx=5)
         
         tk.Label(options_frame, text="Hasta:", bg='white', fg='#003366').pack(side=tk.LEFT, padx=5)
-        self.fecha_hasta = DateEntry(options_frame, width=12, 
+        self.fecha_hasta = selector_fecha(options_frame, width=12, 
                                    background='#003366', foreground='white', 
                                    borderwidth=2, font=('Arial', 10))
         self.fecha_hasta.pack(side=tk.LEFT, padx=5)
@@ -1765,12 +4773,11 @@ class SistemaERP:
     
     def actualizar_saldo(self):
         # Actualizar el saldo mostrado
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         cursor = conn.cursor()
         
         try:
-            cursor.execute("SELECT saldo_actual FROM finanzas ORDER BY id DESC LIMIT 1")
-            saldo = cursor.fetchone()[0]
+            saldo = leer_saldo(cursor)
             self.saldo_label.config(text=f"${saldo:,.2f}")
             
         except Exception as e:
@@ -1780,7 +4787,7 @@ class SistemaERP:
     
     def actualizar_grafico_finanzas(self):
         # Obtener datos de transacciones recientes
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         cursor = conn.cursor()
         
         try:
@@ -1802,37 +4809,36 @@ class SistemaERP:
                 fechas.append(transaccion[0][:10])  # Solo la fecha, sin la hora
                 saldos.append(transaccion[3])
             
-            # Limpiar gráfico actual
-            self.ax_finanzas.clear()
-            
-            # Si hay datos, crear el gráfico
-            if transacciones:
+            def dibujar(ax):
+                if not transacciones:
+                    ax.text(0.5, 0.5, "No hay transacciones registradas", 
+                            horizontalalignment='center',
+                            verticalalignment='center',
+                            transform=ax.transAxes,
+                            color='#003366')
+                    return {}
+                
                 # Gráfico principal (manteniendo tus estilos exactos)
-                self.ax_finanzas.plot(fechas, saldos, 'o-', linewidth=2, color='#003366')
+                linea, = ax.plot(fechas, saldos, 'o-', linewidth=2, color='#003366')
                 
                 # Configuración de ejes (sin rotación)
-                self.ax_finanzas.set_title('Evolución del Saldo', color='#003366')
-                self.ax_finanzas.set_xlabel('Fecha', color='#003366')
-                self.ax_finanzas.set_ylabel('Saldo ($)', color='#003366')
-                self.ax_finanzas.tick_params(axis='x', colors='#003366')
-                self.ax_finanzas.tick_params(axis='y', colors='#003366')
-                self.ax_finanzas.grid(True, color='#e6ecf0')
+                ax.set_title('Evolución del Saldo', color='#003366')
+                ax.set_xlabel('Fecha', color='#003366')
+                ax.set_ylabel('Saldo ($)', color='#003366')
+                ax.tick_params(axis='x', colors='#003366')
+                ax.tick_params(axis='y', colors='#003366')
+                ax.grid(True, color='#e6ecf0')
                 
                 # Formatear eje Y como moneda (mejora simple pero útil)
-                self.ax_finanzas.yaxis.set_major_formatter('${x:,.0f}')
+                ax.yaxis.set_major_formatter('${x:,.0f}')
                 
-            else:
-                self.ax_finanzas.text(0.5, 0.5, "No hay transacciones registradas", 
-                                    horizontalalignment='center',
-                                    verticalalignment='center',
-                                    transform=self.ax_finanzas.transAxes,
-                                    color='#003366')
+                # Ajustar layout automáticamente
+                self.grafico_finanzas.figura.tight_layout()
+                return {'linea': linea}
             
-            # Ajustar layout automáticamente
-            plt.tight_layout()
-            
-            # Actualizar canvas
-            self.canvas_finanzas.draw()
+            # Con las mismas fechas solo se mueve la línea
+            self.grafico_finanzas.graficar(
+                fechas, dibujar, lambda ax, artistas: actualizar_valores(ax, artistas, saldos, "${:,.0f}"))
             
         except Exception as e:
             messagebox.showerror("Error", f"Error al cargar datos financieros: {str(e)}")
@@ -1840,78 +4846,37 @@ class SistemaERP:
             conn.close()
     
     def registrar_transaccion(self):
-        # Validar datos
+        # Datos del formulario
         tipo = self.tipo_transaccion.get()
         concepto = self.concepto_transaccion.get()
         monto_str = self.monto_transaccion.get()
         
-        if not tipo or not concepto or not monto_str:
-            messagebox.showwarning("Advertencia", "Todos los campos son obligatorios")
-            return
-        
+        # Registrar transacción (valida los datos y actualiza el saldo a través del escritor de finanzas)
         try:
-            monto = float(monto_str)
-            if monto <= 0:
-                messagebox.showwarning("Advertencia", "El monto debe ser mayor a cero")
-                return
-        except ValueError:
-            messagebox.showerror("Error", "El monto debe ser un número válido")
+            self.finanzas.registrar_transaccion(tipo, concepto, monto_str)
+        except DatosInvalidos as e:
+            messagebox.showwarning("Advertencia", str(e))
+            return
+        except SaldoInsuficiente:
+            messagebox.showerror("Error", "Saldo insuficiente para realizar esta transacción")
             return
-        
-        # Registrar transacción
-        conn = sqlite3.connect('erp_autobuses.db')
-        cursor = conn.cursor()
-        
-        try:
-            # Obtener último saldo
-            cursor.execute("SELECT saldo_actual FROM finanzas ORDER BY id DESC LIMIT 1")
-            resultado = cursor.fetchone()
-            saldo_actual = resultado[0] if resultado else 0.0
-            
-            # Calcular nuevo saldo
-            if tipo == "Ingreso":
-                ingreso = monto
-                egreso = 0.0
-                nuevo_saldo = saldo_actual + monto
-            else:  # Egreso
-                if saldo_actual < monto:
-                    messagebox.showerror("Error", "Saldo insuficiente para realizar esta transacción")
-                    return
-                ingreso = 0.0
-                egreso = monto
-                nuevo_saldo = saldo_actual - monto
-            
-            # Insertar transacción
-            fecha = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            cursor.execute('''
-                INSERT INTO finanzas (fecha, concepto, ingreso, egreso, saldo_actual)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (fecha, concepto, ingreso, egreso, nuevo_saldo))
-            
-            conn.commit()
-            messagebox.showinfo("Éxito", "Transacción registrada exitosamente")
-            
-            # Limpiar campos
-            self.tipo_transaccion.set("")
-            self.concepto_transaccion.delete(0, tk.END)
-            self.monto_transaccion.delete(0, tk.END)
-            
-            # Actualizar vista
-            self.cargar_transacciones()
-            self.actualizar_saldo()
-            self.actualizar_grafico_finanzas()
-            
         except Exception as e:
-            conn.rollback()
             messagebox.showerror("Error", f"Error al registrar transacción: {str(e)}")
-        finally:
-            conn.close()
+            return
         
-    def cargar_transacciones(self):
-        # Limpiar treeview
-        for item in self.tree_transacciones.get_children():
-            self.tree_transacciones.delete(item)
+        messagebox.showinfo("Éxito", "Transacción registrada exitosamente")
+        
+        # Limpiar campos
+        self.tipo_transaccion.set("")
+        self.concepto_transaccion.delete(0, tk.END)
+        self.monto_transaccion.delete(0, tk.END)
+        
+        # Actualizar vista
+        self.cargar_transacciones()
+        self.actualizar_saldo()
+        self.actualizar_grafico_finanzas()
         
+    def cargar_transacciones(self):
         # Determinar filtro
         filtro = self.filtro_transaccion.get()
         
@@ -1926,63 +4891,40 @@ class SistemaERP:
         # Configurar columnas visibles
         self.tree_transacciones["displaycolumns"] = visible_columns
         
-        # Obtener datos de la base de datos
-        conn = sqlite3.connect('erp_autobuses.db')
-        cursor = conn.cursor()
+        # Consulta para obtener transacciones
+        query = CONSULTA_TRANSACCIONES + FILTROS_TRANSACCIONES.get(filtro, "")
+        
+        # Páginas de 200 por id descendente; las anteriores se cargan al bajar
+        tabla = self.tabla_virtual(self.tree_transacciones, self.formatear_transaccion,
+                                   clave_item=lambda row: row[0], segundo_plano=True,
+                                   mensaje_error="Error al cargar transacciones",
+                                   paginas_en_memoria=None)
+        tabla.cargar(CursorKeyset(self.db, query, ("id",), descendente=True, tam_pagina=200))
+            
+        # Ajustar automáticamente el ancho de la columna Concepto
+        self.ajustar_ancho_columnas()
+
+    def formatear_transaccion(self, row):
+        # Formatear valores
+        fecha = row[1].split()[0] if ' ' in row[1] else row[1]
+        
+        # Formatear montos
+        ingreso = f"${row[3]:,.2f}" if row[3] > 0 else ""
+        egreso = f"${row[4]:,.2f}" if row[4] > 0 else ""
+        saldo = f"${row[5]:,.2f}" if row[5] is not None else "$0.00"
+        
+        valores = (
+            row[0],  # ID
+            fecha,   # Fecha
+            row[2],  # Concepto
+            ingreso,
+            egreso,
+            saldo
+        )
         
-        try:
-            # Consulta para obtener transacciones
-            query = '''
-            SELECT 
-                id,
-                fecha,
-                concepto,
-                ingreso,
-                egreso,
-                saldo_actual
-            FROM finanzas
-            '''
-            
-            if filtro == "Ingresos":
-                query += ' WHERE ingreso > 0'
-            elif filtro == "Egresos":
-                query += ' WHERE egreso > 0'
-            
-            query += ' ORDER BY id DESC LIMIT 200'
-            
-            cursor.execute(query)
-            transacciones = cursor.fetchall()
-            
-            for row in transacciones:
-                # Formatear valores
-                fecha = row[1].split()[0] if ' ' in row[1] else row[1]
-                
-                # Formatear montos
-                ingreso = f"${row[3]:,.2f}" if row[3] > 0 else ""
-                egreso = f"${row[4]:,.2f}" if row[4] > 0 else ""
-                saldo = f"${row[5]:,.2f}" if row[5] is not None else "$0.00"
-                
-                valores = (
-                    row[0],  # ID
-                    fecha,   # Fecha
-                    row[2],  # Concepto
-                    ingreso,
-                    egreso,
-                    saldo
-                )
-                
-                # Determinar estilo de fila
-                tags = ('ingreso',) if row[3] > 0 else ('egreso',) if row[4] > 0 else ()
-                
-                self.tree_transacciones.insert("", tk.END, values=valores, tags=tags)
-                
-            # Ajustar automáticamente el ancho de la columna Concepto
-            self.ajustar_ancho_columnas()
-                
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al cargar transacciones: {str(e)}")
-        finally:
-            conn.close()
+        # Determinar estilo de fila
+        tags = ('ingreso',) if row[3] > 0 else ('egreso',) if row[4] > 0 else ()
+        return valores, tags
 
     def ajustar_ancho_columnas(self):
         # Ajustar dinámicamente el ancho de la columna Concepto
@@ -1994,8 +4936,7 @@ class SistemaERP:
     
     def generar_informe_finanzas(self):
         # Limpiar frame de resultados
-        for widget in self.resultado_frame.winfo_children():
-            widget.destroy()
+        self.graficos.limpiar(self.resultado_frame)
         
         # Validar datos
         tipo_informe = self.tipo_informe.get()
@@ -2023,18 +4964,20 @@ class SistemaERP:
             self.generar_informe_gastos_categoria(fecha_desde_str, fecha_hasta_str)
     
     def generar_informe_ingresos_egresos(self, fecha_desde, fecha_hasta):
-        conn = sqlite3.connect('erp_autobuses.db')
-        cursor = conn.cursor()
-        
-        try:
+        def consultar(conn):
+            cursor = conn.cursor()
             # Obtener total de ingresos y egresos
-            cursor.execute('''
-            SELECT SUM(ingreso), SUM(egreso)
-            FROM finanzas
-            WHERE fecha BETWEEN ? AND ?
-            ''', (fecha_desde, fecha_hasta))
-            
-            totales = cursor.fetchone()
+            cursor.execute(CONSULTA_INFORME_INGRESOS_EGRESOS, (fecha_desde, fecha_hasta))
+            return cursor.fetchone()
+
+        self.consultas.ejecutar(lambda conn: self.cache_reportes.consultar(
+                                    conn, "ingresos_egresos", (fecha_desde, fecha_hasta),
+                                    ("movimientos_diarios",), consultar),
+                                lambda totales: self.mostrar_informe_ingresos_egresos(totales, fecha_desde, fecha_hasta),
+                                "Error al generar informe", clave="informe")
+
+    def mostrar_informe_ingresos_egresos(self, totales, fecha_desde, fecha_hasta):
+        try:
             total_ingresos = totales[0] or 0
             total_egresos = totales[1] or 0
             
@@ -2062,76 +5005,87 @@ class SistemaERP:
             tk.Label(tabla_frame, text=f"${balance:,.2f}", 
                     font=("Arial", 12, "bold"), bg='white', fg=balance_color).grid(row=2, column=1, padx=10, pady=5)
             
-            # Crear gráfico con mejoras
-            figure = plt.Figure(figsize=(6, 4), dpi=100, facecolor='white')
-            ax = figure.add_subplot(111)
-            ax.set_facecolor('#f8f9fa')  # Fondo más claro para mejor contraste
-            
-            # Configurar estilo del gráfico
-            for spine in ['bottom', 'top', 'right', 'left']:
-                ax.spines[spine].set_color('#dee2e6')
-                ax.spines[spine].set_linewidth(0.5)
-                
-            ax.tick_params(axis='both', colors='#495057', labelsize=9)
-            ax.yaxis.label.set_color('#495057')
-            ax.xaxis.label.set_color('#495057')
-            ax.title.set_color('#003366')
-            
+            # Crear gráfico con mejoras (la figura se reutiliza entre ejecuciones)
+            grafico = self.graficos.espacio("ingresos_egresos", self.resultado_frame)
             labels = ['Ingresos', 'Egresos']
             values = [total_ingresos, total_egresos]
-            colors = ['#2e8b57', '#dc3545']  # Verde más oscuro y rojo más intenso
-            
-            bars = ax.bar(labels, values, color=colors, width=0.6, edgecolor='white', linewidth=1)
-            ax.set_title('Comparación de Ingresos y Egresos', pad=15, fontsize=12, fontweight='bold')
-            ax.set_ylabel('Monto ($)', fontsize=10)
-            
-            # Ajustar límites del eje Y para mejor visualización
-            max_value = max(values)
-            ax.set_ylim(0, max_value * 1.25)  # 25% más de espacio para las etiquetas
-            
-            # Agregar etiquetas con valores mejoradas
-            for bar in bars:
-                height = bar.get_height()
-                ax.text(bar.get_x() + bar.get_width()/2., 
-                        height + (max_value * 0.02),  # 2% del valor máximo como offset
-                        f"${height:,.2f}",
-                        ha='center', 
-                        va='bottom',
-                        color='#212529',
-                        fontsize=10,
-                        fontweight='bold',
-                        bbox=dict(facecolor='white', 
-                                edgecolor='#dee2e6', 
-                                boxstyle='round,pad=0.2',
-                                alpha=0.8))
             
-            # Grid más sutil
-            ax.grid(axis='y', linestyle='--', alpha=0.5, color='#adb5bd')
+            def dibujar(ax):
+                ax.set_facecolor('#f8f9fa')  # Fondo más claro para mejor contraste
             
-            # Añadir línea de balance cero para referencia
-            if total_ingresos > 0 or total_egresos > 0:
-                ax.axhline(0, color='#495057', linestyle='-', linewidth=0.5)
+                # Configurar estilo del gráfico
+                for spine in ['bottom', 'top', 'right', 'left']:
+                    ax.spines[spine].set_color('#dee2e6')
+                    ax.spines[spine].set_linewidth(0.5)
+                
+                ax.tick_params(axis='both', colors='#495057', labelsize=9)
+                ax.yaxis.label.set_color('#495057')
+                ax.xaxis.label.set_color('#495057')
+                ax.title.set_color('#003366')
+            
+                colors = ['#2e8b57', '#dc3545']  # Verde más oscuro y rojo más intenso
             
-            # Ajustar márgenes
-            figure.tight_layout()
-            figure.subplots_adjust(top=0.85)
+                bars = ax.bar(labels, values, color=colors, width=0.6, edgecolor='white', linewidth=1)
+                ax.set_title('Comparación de Ingresos y Egresos', pad=15, fontsize=12, fontweight='bold')
+                ax.set_ylabel('Monto ($)', fontsize=10)
             
-            canvas = FigureCanvasTkAgg(figure, self.resultado_frame)
-            canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+                # Ajustar límites del eje Y para mejor visualización
+                max_value = max(values)
+                ax.set_ylim(0, max_value * 1.25)  # 25% más de espacio para las etiquetas
             
+                # Agregar etiquetas con valores mejoradas
+                etiquetas = []
+                for bar in bars:
+                    height = bar.get_height()
+                    etiquetas.append(ax.text(bar.get_x() + bar.get_width()/2., 
+                            height + (max_value * 0.02),  # 2% del valor máximo como offset
+                            f"${height:,.2f}",
+                            ha='center', 
+                            va='bottom',
+                            color='#212529',
+                            fontsize=10,
+                            fontweight='bold',
+                            bbox=dict(facecolor='white', 
+                                    edgecolor='#dee2e6', 
+                                    boxstyle='round,pad=0.2',
+                                    alpha=0.8)))
+            
+                # Grid más sutil
+                ax.grid(axis='y', linestyle='--', alpha=0.5, color='#adb5bd')
+            
+                # Añadir línea de balance cero para referencia
+                if total_ingresos > 0 or total_egresos > 0:
+                    ax.axhline(0, color='#495057', linestyle='-', linewidth=0.5)
+            
+                # Ajustar márgenes
+                grafico.figura.tight_layout()
+                grafico.figura.subplots_adjust(top=0.85)
+                return {'barras': bars, 'etiquetas': etiquetas}
+            
+            grafico.graficar(labels, dibujar, lambda ax, artistas: actualizar_valores(
+                ax, artistas, values, "${:,.2f}", desfase=0.02,
+                limites_y=lambda valores: (0, max(valores) * 1.25)))
+            grafico.mostrar(fill=tk.BOTH, expand=True, pady=(0, 10))
         except Exception as e:
             messagebox.showerror("Error", f"Error al generar informe: {str(e)}")
-        finally:
-            conn.close()
-    
+
     def generar_informe_ventas_ruta(self, fecha_desde, fecha_hasta):
-        conn = sqlite3.connect('erp_autobuses.db')
-        cursor = conn.cursor()
-        
+        def consultar(conn):
+            cursor = conn.cursor()
+            # 2. OBTENER DATOS DE LA BASE DE DATOS
+            cursor.execute(CONSULTA_INFORME_VENTAS_RUTA, (fecha_desde, fecha_hasta))
+            return cursor.fetchall()
+
+        self.consultas.ejecutar(lambda conn: self.cache_reportes.consultar(
+                                    conn, "ventas_ruta", (fecha_desde, fecha_hasta),
+                                    ("ventas_diarias_ruta", "rutas"), consultar),
+                                lambda ventas_ruta: self.mostrar_informe_ventas_ruta(ventas_ruta, fecha_desde, fecha_hasta),
+                                "Error al generar informe", clave="informe")
+
+    def mostrar_informe_ventas_ruta(self, ventas_ruta, fecha_desde, fecha_hasta):
         try:
             # Limpiar frame anterior
-            for widget in self.resultado_frame.winfo_children():
-                widget.destroy()
+            self.graficos.limpiar(self.resultado_frame)
 
             # Configurar fondo blanco
             self.resultado_frame.configure(bg='white')
@@ -2155,21 +5109,6 @@ class SistemaERP:
                     bg='white',
                     fg='#003366').pack(pady=(5, 15))
 
-            # 2. OBTENER DATOS DE LA BASE DE DATOS
-            cursor.execute('''
-            SELECT r.origen || ' - ' || r.destino as ruta, 
-                COUNT(b.id) as total_boletos, 
-                SUM(b.precio) as total_ventas
-            FROM boletos b
-            JOIN horarios h ON b.horario_id = h.id
-            JOIN rutas r ON h.ruta_id = r.id
-            WHERE b.fecha_compra BETWEEN ? AND ?
-            GROUP BY r.id
-            ORDER BY total_ventas DESC
-            ''', (fecha_desde, fecha_hasta))
-            
-            ventas_ruta = cursor.fetchall()
-
             if not ventas_ruta:
                 tk.Label(main_frame, text="No hay ventas registradas en este período",
                         bg='white', fg='red').pack(pady=50)
@@ -2239,76 +5178,79 @@ class SistemaERP:
             top_rutas = [row[0] for row in ventas_ruta[:5]]
             top_ventas = [row[2] for row in ventas_ruta[:5]]
 
-            # Crear figura con fondo blanco
-            fig = plt.Figure(figsize=(10, 5), dpi=100, facecolor='white')
-            ax = fig.add_subplot(111, facecolor='white')
-            
-            # Configuración del gráfico mejorado
-            ax.spines['top'].set_visible(False)
-            ax.spines['right'].set_visible(False)
-            ax.spines['left'].set_color('#003366')  # Color para el eje Y
-            ax.spines['bottom'].set_color('#003366')  # Color para el eje X
-            
-            # Configurar colores de los ejes y etiquetas
-            ax.tick_params(axis='both', colors='#003366', labelsize=9)
-            ax.grid(axis='y', color='#f0f0f0', linestyle='--')
-            
-            # Crear barras con colores modernos
-            colors = ['#4e79a7', '#f28e2b', '#e15759', '#76b7b2', '#59a14f']
-            bars = ax.bar(top_rutas, top_ventas, color=colors, width=0.6, edgecolor='white', linewidth=0.5)
-            
-            # Añadir valores encima de las barras
-            for bar in bars:
-                height = bar.get_height()
-                ax.text(bar.get_x() + bar.get_width()/2., height,
-                        f'${height:,.0f}',
-                        ha='center', va='bottom', color='black', fontsize=9,
-                        bbox=dict(facecolor='white', edgecolor='none', pad=1))
-
-            # Configurar título y etiquetas con color #003366
-            ax.set_title('Top Ventas por Ruta', pad=20, fontsize=12, fontweight='bold', color='#003366')
-            ax.set_ylabel('Ventas ($)', fontsize=10, color='#003366')
-            ax.set_xlabel('Ruta', fontsize=10, color='#003366')
-            
-            # Ajustar espacio entre etiquetas del eje X
-            plt.xticks(rotation=45, ha='right', fontsize=9)  # Rotación de 45 grados para mejor legibilidad
-            fig.subplots_adjust(bottom=0.25)  # Aumentar espacio inferior para las etiquetas
-            
-            # Asegurar que las etiquetas no se solapen
-            fig.tight_layout()
-            plt.margins(x=0.1)  # Añadir margen adicional a los lados
+            # Figura reutilizada entre ejecuciones, mostrada dentro de graph_frame
+            grafico = self.graficos.espacio("ventas_ruta", self.resultado_frame, figsize=(10, 5))
+            
+            def dibujar(ax):
+                ax.set_facecolor('white')
+                
+                # Configuración del gráfico mejorado
+                ax.spines['top'].set_visible(False)
+                ax.spines['right'].set_visible(False)
+                ax.spines['left'].set_color('#003366')  # Color para el eje Y
+                ax.spines['bottom'].set_color('#003366')  # Color para el eje X
+                
+                # Configurar colores de los ejes y etiquetas
+                ax.tick_params(axis='both', colors='#003366', labelsize=9)
+                ax.grid(axis='y', color='#f0f0f0', linestyle='--')
+                
+                # Crear barras con colores modernos
+                colors = ['#4e79a7', '#f28e2b', '#e15759', '#76b7b2', '#59a14f']
+                bars = ax.bar(top_rutas, top_ventas, color=colors, width=0.6, edgecolor='white', linewidth=0.5)
+                
+                # Añadir valores encima de las barras
+                etiquetas = []
+                for bar in bars:
+                    height = bar.get_height()
+                    etiquetas.append(ax.text(bar.get_x() + bar.get_width()/2., height,
+                            f'${height:,.0f}',
+                            ha='center', va='bottom', color='black', fontsize=9,
+                            bbox=dict(facecolor='white', edgecolor='none', pad=1)))
+
+                # Configurar título y etiquetas con color #003366
+                ax.set_title('Top Ventas por Ruta', pad=20, fontsize=12, fontweight='bold', color='#003366')
+                ax.set_ylabel('Ventas ($)', fontsize=10, color='#003366')
+                ax.set_xlabel('Ruta', fontsize=10, color='#003366')
+                
+                # Ajustar espacio entre etiquetas del eje X
+                for etiqueta in ax.get_xticklabels():  # Rotación de 45 grados para mejor legibilidad
+                    etiqueta.set(rotation=45, ha='right', fontsize=9)
+                grafico.figura.subplots_adjust(bottom=0.25)  # Aumentar espacio inferior para las etiquetas
+                
+                # Asegurar que las etiquetas no se solapen
+                grafico.figura.tight_layout()
+                ax.margins(x=0.1)  # Añadir margen adicional a los lados
+                return {'barras': bars, 'etiquetas': etiquetas}
 
             # Integrar gráfico en Tkinter
-            chart = FigureCanvasTkAgg(fig, master=graph_frame)
-            chart.draw()
-            chart.get_tk_widget().pack(fill='both', expand=True)
-
+            grafico.graficar(top_rutas, dibujar,
+                             lambda ax, artistas: actualizar_valores(ax, artistas, top_ventas, "${:,.0f}"))
+            grafico.mostrar(dentro=graph_frame, fill='both', expand=True)
         except Exception as e:
             messagebox.showerror("Error", f"Error al generar informe: {str(e)}")
-        finally:
-            conn.close()
 
     def generar_informe_gastos_categoria(self, fecha_desde, fecha_hasta):
         """Genera un informe de gastos por categoría"""
-        conn = sqlite3.connect('erp_autobuses.db')
-        cursor = conn.cursor()
-        try:
+        def consultar(conn):
+            cursor = conn.cursor()
             # Obtener gastos por categoría
-            cursor.execute('''
-                SELECT tipo_producto, SUM(total) as total
-                FROM compras
-                WHERE fecha BETWEEN ? AND ?
-                GROUP BY tipo_producto
-                ORDER BY total DESC
-            ''', (fecha_desde, fecha_hasta))
-            resultados = cursor.fetchall()
+            cursor.execute(CONSULTA_INFORME_GASTOS_CATEGORIA, (fecha_desde, fecha_hasta))
+            return cursor.fetchall()
+
+        self.consultas.ejecutar(lambda conn: self.cache_reportes.consultar(
+                                    conn, "gastos_categoria", (fecha_desde, fecha_hasta),
+                                    ("compras_diarias_categoria",), consultar),
+                                lambda resultados: self.mostrar_informe_gastos_categoria(resultados, fecha_desde, fecha_hasta),
+                                "Error al generar informe", clave="informe")
+
+    def mostrar_informe_gastos_categoria(self, resultados, fecha_desde, fecha_hasta):
+        try:
         
             # Calcular el total general
             total_general = sum(row[1] for row in resultados) if resultados else 0
         
             # Limpiar frame de resultados
-            for widget in self.resultado_frame.winfo_children():
-                widget.destroy()
+            self.graficos.limpiar(self.resultado_frame)
             
             if not resultados:
                 tk.Label(self.resultado_frame, text="No hay gastos registrados en este período",
@@ -2341,69 +5283,97 @@ class SistemaERP:
                     font=("Arial", 12, "bold"), bg='white', fg='#003366').grid(
                     row=len(resultados)+1, column=1, padx=10, pady=5)
         
-            # Crear gráfico
-            figure = plt.Figure(figsize=(6, 4), dpi=100, facecolor='white')
-            ax = figure.add_subplot(111)
-            ax.set_facecolor('white')
-            
-            # Configurar colores del gráfico
-            ax.spines['bottom'].set_color('#003366')
-            ax.spines['top'].set_color('#003366') 
-            ax.spines['right'].set_color('#003366')
-            ax.spines['left'].set_color('#003366')
-            ax.tick_params(axis='x', colors='#003366')
-            ax.tick_params(axis='y', colors='#003366')
-            ax.yaxis.label.set_color('#003366')
-            ax.xaxis.label.set_color('#003366')
-            ax.title.set_color('#003366')
-        
             categorias = [row[0] for row in resultados]
             montos = [row[1] for row in resultados]
         
-            # Crear gráfico de barras con colores personalizados
-            colors = ['#F44336', '#2196F3', '#4CAF50', '#FFC107', '#9C27B0', '#607D8B']
-            bars = ax.bar(categorias, montos, color=colors[:len(categorias)])
+            # Crear gráfico (la figura se reutiliza entre ejecuciones)
+            grafico = self.graficos.espacio("gastos_categoria", self.resultado_frame)
             
-            #ax.set_title('Gastos por Categoría', color='#003366', pad=20)
-            ax.set_ylabel('Monto ($)', color='#003366', labelpad=10)
-            ax.grid(True, color='#e6ecf0', linestyle='--', alpha=0.7)
-            
-            # Solución al error de set_ticklabels - usar set_xticks primero
-            ax.set_xticks(range(len(categorias)))
-            ax.set_xticklabels(categorias, color='#003366')
-            
-            # Ajustar márgenes para evitar que las etiquetas se corten
-            figure.tight_layout()
-            
-            # Agregar etiquetas con valores en las barras (sin recuadro negro)
-            for bar in bars:
-                height = bar.get_height()
-                ax.text(bar.get_x() + bar.get_width()/2., height,
-                        f'${height:,.0f}',
-                        ha='center', va='bottom', color='#003366', fontsize=9,
-                        bbox=dict(facecolor='white', edgecolor='none', pad=1))  # Fondo blanco sin borde
-        
-            # Crear canvas para el gráfico
-            canvas = FigureCanvasTkAgg(figure, self.resultado_frame)
-            canvas.draw()
-            canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-        
+            def dibujar(ax):
+                ax.set_facecolor('white')
+                
+                # Configurar colores del gráfico
+                ax.spines['bottom'].set_color('#003366')
+                ax.spines['top'].set_color('#003366') 
+                ax.spines['right'].set_color('#003366')
+                ax.spines['left'].set_color('#003366')
+                ax.tick_params(axis='x', colors='#003366')
+                ax.tick_params(axis='y', colors='#003366')
+                ax.yaxis.label.set_color('#003366')
+                ax.xaxis.label.set_color('#003366')
+                ax.title.set_color('#003366')
+            
+                # Crear gráfico de barras con colores personalizados
+                colors = ['#F44336', '#2196F3', '#4CAF50', '#FFC107', '#9C27B0', '#607D8B']
+                bars = ax.bar(categorias, montos, color=colors[:len(categorias)])
+                
+                #ax.set_title('Gastos por Categoría', color='#003366', pad=20)
+                ax.set_ylabel('Monto ($)', color='#003366', labelpad=10)
+                ax.grid(True, color='#e6ecf0', linestyle='--', alpha=0.7)
+                
+                # Solución al error de set_ticklabels - usar set_xticks primero
+                ax.set_xticks(range(len(categorias)))
+                ax.set_xticklabels(categorias, color='#003366')
+                
+                # Ajustar márgenes para evitar que las etiquetas se corten
+                grafico.figura.tight_layout()
+                
+                # Agregar etiquetas con valores en las barras (sin recuadro negro)
+                etiquetas = []
+                for bar in bars:
+                    height = bar.get_height()
+                    etiquetas.append(ax.text(bar.get_x() + bar.get_width()/2., height,
+                            f'${height:,.0f}',
+                            ha='center', va='bottom', color='#003366', fontsize=9,
+                            bbox=dict(facecolor='white', edgecolor='none', pad=1)))  # Fondo blanco sin borde
+                return {'barras': bars, 'etiquetas': etiquetas}
+        
+            grafico.graficar(categorias, dibujar,
+                             lambda ax, artistas: actualizar_valores(ax, artistas, montos, "${:,.0f}"))
+            grafico.mostrar(fill=tk.BOTH, expand=True, padx=10, pady=10)
         except Exception as e:
             messagebox.showerror("Error", f"Error al generar informe: {str(e)}")
-        finally:
-            conn.close()
 
     def limpiar_ventana(self):
-        """Elimina todos los widgets de la ventana principal"""
+        """Elimina todos los widgets de la ventana principal, cancela las consultas en curso
+        y libera las figuras de los gráficos"""
+        self.consultas.cancelar()
+        self.graficos.liberar()
         for widget in self.root.winfo_children():
             widget.destroy()
 
+    def mostrar_indicador_carga(self, ocupado):
+        """Muestra "Cargando..." en la esquina de la ventana mientras hay consultas pendientes"""
+        indicador = getattr(self, 'indicador_carga', None)
+        if ocupado:
+            if indicador is None or not indicador.winfo_exists():
+                indicador = tk.Label(self.root, text="Cargando...", bg='#003366', fg='white',
+                                     font=('Arial', 9, 'bold'), padx=8, pady=2)
+                self.indicador_carga = indicador
+            indicador.place(relx=1.0, rely=1.0, anchor='se')
+            indicador.lift()
+            self.root.config(cursor="watch")
+        else:
+            if indicador is not None and indicador.winfo_exists():
+                indicador.place_forget()
+            self.root.config(cursor="")
+
+    def tabla_virtual(self, tree, formatear=None, clave_item=None, segundo_plano=False,
+                      mensaje_error="Error al cargar datos", paginas_en_memoria=3):
+        """TablaVirtual asociada a un Treeview (se crea la primera vez que se usa)"""
+        tabla = getattr(tree, 'tabla_virtual', None)
+        if tabla is None:
+            tabla = TablaVirtual(tree, formatear, clave_item, paginas_en_memoria,
+                                 ejecutor=self.consultas if segundo_plano else None,
+                                 mensaje_error=mensaje_error)
+            tree.tabla_virtual = tabla
+        return tabla
+
 # ==================== MÓDULO DE INVENTARIO ====================
     
     def mostrar_modulo_inventario(self):
         # Limpiar ventana
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        self.limpiar_ventana()
         
         # Configurar fondo general
         self.root.configure(bg='#e6ecf0')
@@ -2461,7 +5431,7 @@ class SistemaERP:
         tab_style.map("Treeview", background=[("selected", "#003366")], foreground=[("selected", "#FFFFFF")])
         
         # Al iniciar, asegurarse de que la tabla de inventario esté creada y poblada
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         try:
             cursor = conn.cursor()
             
@@ -2526,14 +5496,14 @@ class SistemaERP:
         
         # Filtro por fecha
         tk.Label(filtros_frame, text="Desde:", **label_style).pack(side=tk.LEFT, padx=5)
-        self.fecha_salida_desde = DateEntry(filtros_frame, width=12, 
+        self.fecha_salida_desde = selector_fecha(filtros_frame, width=12, 
                                         background='#003366', foreground='white', 
                                         borderwidth=1, font=("Helvetica", 11))
         self.fecha_salida_desde.pack(side=tk.LEFT, padx=5)
         self.fecha_salida_desde.set_date(datetime.datetime.now() - datetime.timedelta(days=30))
         
         tk.Label(filtros_frame, text="Hasta:", **label_style).pack(side=tk.LEFT, padx=5)
-        self.fecha_salida_hasta = DateEntry(filtros_frame, width=12, 
+        self.fecha_salida_hasta = selector_fecha(filtros_frame, width=12, 
                                         background='#003366', foreground='white', 
                                         borderwidth=1, font=("Helvetica", 11))
         self.fecha_salida_hasta.pack(side=tk.LEFT, padx=5)
@@ -2714,7 +5684,7 @@ class SistemaERP:
 
     def cargar_tipos_para_salidas(self):
         """Carga los tipos de producto para el filtro en salidas"""
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         try:
             cursor = conn.cursor()
             
@@ -2738,40 +5708,7 @@ class SistemaERP:
 
     def cargar_salidas(self):
         """Carga el historial de salidas de inventario"""
-        for item in self.tree_salidas.get_children():
-            self.tree_salidas.delete(item)
-        
-        conn = sqlite3.connect('erp_autobuses.db')
-        try:
-            cursor = conn.cursor()
-            
-            # Verificar si existe la tabla de salidas_inventario
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='salidas_inventario'")
-            existe_tabla = cursor.fetchone() is not None
-            
-            if existe_tabla:
-                # Cargar salidas
-                cursor.execute("""
-                    SELECT 
-                        id,
-                        fecha,
-                        tipo_producto,
-                        descripcion,
-                        cantidad,
-                        destino,
-                        responsable,
-                        notas
-                    FROM salidas_inventario
-                    ORDER BY fecha DESC
-                """)
-                
-                for row in cursor.fetchall():
-                    self.tree_salidas.insert("", tk.END, values=row)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al cargar salidas: {str(e)}")
-        finally:
-            conn.close()
+        self.mostrar_salidas(*consulta_salidas())
 
     def filtrar_salidas(self):
         """Filtra las salidas por tipo y fecha"""
@@ -2779,50 +5716,15 @@ class SistemaERP:
         desde = self.fecha_salida_desde.get_date().strftime("%Y-%m-%d")
         hasta = self.fecha_salida_hasta.get_date().strftime("%Y-%m-%d")
         
-        for item in self.tree_salidas.get_children():
-            self.tree_salidas.delete(item)
-        
-        conn = sqlite3.connect('erp_autobuses.db')
-        try:
-            cursor = conn.cursor()
-            
-            # Verificar si existe la tabla de salidas_inventario
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='salidas_inventario'")
-            existe_tabla = cursor.fetchone() is not None
-            
-            if existe_tabla:
-                # Consultar salidas con filtros
-                query = """
-                    SELECT 
-                        id,
-                        fecha,
-                        tipo_producto,
-                        descripcion,
-                        cantidad,
-                        destino,
-                        responsable,
-                        notas
-                    FROM salidas_inventario
-                    WHERE fecha BETWEEN ? AND ?
-                """
-                
-                params = [desde, hasta + " 23:59:59"]
-                
-                if tipo_producto != "Todos":
-                    query += " AND tipo_producto = ?"
-                    params.append(tipo_producto)
-                
-                query += " ORDER BY fecha DESC"
-                
-                cursor.execute(query, params)
-                
-                for row in cursor.fetchall():
-                    self.tree_salidas.insert("", tk.END, values=row)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al filtrar salidas: {str(e)}")
-        finally:
-            conn.close()
+        # Consultar salidas con filtros
+        self.mostrar_salidas(*consulta_salidas(desde, hasta + " 23:59:59",
+                                               None if tipo_producto == "Todos" else tipo_producto))
+
+    def mostrar_salidas(self, query, params):
+        """Muestra las salidas (más recientes primero) cargando por páginas"""
+        tabla = self.tabla_virtual(self.tree_salidas, clave_item=lambda row: row[0],
+                                   mensaje_error="Error al cargar salidas")
+        tabla.cargar(CursorKeyset(self.db, query, ("fecha", "id"), params, descendente=True))
 
    # ------ Inventario General ------
     def setup_tab_inventario(self, parent):
@@ -2949,7 +5851,7 @@ class SistemaERP:
 
     def cargar_tipos_y_proveedores(self):
         """Carga los tipos de productos y proveedores para los filtros"""
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         try:
             cursor = conn.cursor()
             
@@ -2976,7 +5878,7 @@ class SistemaERP:
         
         if tipo_seleccionado == "Todos":
             # Mostrar todos los proveedores
-            conn = sqlite3.connect('erp_autobuses.db')
+            conn = self.db.conectar()
             try:
                 cursor = conn.cursor()
                 cursor.execute("SELECT DISTINCT nombre FROM proveedores ORDER BY nombre")
@@ -2989,7 +5891,7 @@ class SistemaERP:
                 conn.close()
         else:
             # Mostrar solo proveedores que suministran ese tipo de producto
-            conn = sqlite3.connect('erp_autobuses.db')
+            conn = self.db.conectar()
             try:
                 cursor = conn.cursor()
                 cursor.execute("""
@@ -3011,10 +5913,8 @@ class SistemaERP:
 
     def cargar_inventario(self):
         """Carga el inventario considerando tanto compras como salidas"""
-        for item in self.tree_inventario.get_children():
-            self.tree_inventario.delete(item)
-        
-        conn = sqlite3.connect('erp_autobuses.db')
+
+        conn = self.db.conectar()
         try:
             cursor = conn.cursor()
             
@@ -3040,56 +5940,21 @@ class SistemaERP:
                 """)
                 conn.commit()
             
-            # Calcular el inventario real (compras - salidas)
-            query = """
-            WITH total_compras AS (
-                SELECT 
-                    MIN(c.id) as id,
-                    c.tipo_producto,
-                    c.descripcion,
-                    SUM(c.cantidad) as cantidad_comprada,
-                    AVG(c.precio_unitario) as precio_promedio,
-                    MAX(c.fecha) as ultimo_movimiento,
-                    p.nombre as proveedor,
-                    p.id as proveedor_id
-                FROM compras c
-                JOIN proveedores p ON c.proveedor_id = p.id
-                GROUP BY c.tipo_producto, c.descripcion
-            ),
-            total_salidas AS (
-                SELECT 
-                    s.tipo_producto,
-                    s.descripcion,
-                    SUM(s.cantidad) as cantidad_salida
-                FROM salidas_inventario s
-                GROUP BY s.tipo_producto, s.descripcion
-            )
-            SELECT 
-                c.id,
-                c.tipo_producto,
-                c.descripcion,
-                c.cantidad_comprada - COALESCE(s.cantidad_salida, 0) as cantidad_disponible,
-                c.precio_promedio,
-                c.ultimo_movimiento,
-                c.proveedor,
-                c.proveedor_id
-            FROM total_compras c
-            LEFT JOIN total_salidas s ON c.tipo_producto = s.tipo_producto AND c.descripcion = s.descripcion
-            WHERE c.cantidad_comprada - COALESCE(s.cantidad_salida, 0) > 0
-            ORDER BY c.tipo_producto, c.descripcion
-            """
-            
-            cursor.execute(query)
+            # Inventario real (compras - salidas) desde las existencias materializadas
+            query, params = consulta_inventario()
+            
+            cursor.execute(query, params)
             
             total_productos = 0
             total_cantidad = 0
             total_valor = 0.0
+            filas = []
             
             for row in cursor.fetchall():
                 id_producto, tipo, descripcion, cantidad, precio_unitario, fecha, proveedor, _ = row
                 valor_total = cantidad * precio_unitario
                 
-                self.tree_inventario.insert("", tk.END, values=(
+                filas.append((id_producto, (
                     id_producto,
                     tipo,
                     descripcion,
@@ -3098,12 +5963,15 @@ class SistemaERP:
                     f"${valor_total:.2f}",
                     fecha,
                     proveedor
-                ))
+                ), ()))
                 
                 total_productos += 1
                 total_cantidad += cantidad
                 total_valor += valor_total
             
+            # Solo se aplican los productos que cambiaron
+            actualizar_filas(self.tree_inventario, filas)
+            
             # Actualizar resumen
             self.label_resumen.config(text=f"Total de productos: {total_productos} | Cantidad total: {total_cantidad} | Valor total: ${total_valor:.2f}")
             
@@ -3117,77 +5985,26 @@ class SistemaERP:
         tipo_filtro = self.filtro_tipo.get()
         proveedor_filtro = self.filtro_proveedor.get()
         
-        for item in self.tree_inventario.get_children():
-            self.tree_inventario.delete(item)
-        
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         try:
             cursor = conn.cursor()
             
-            # Calcular el inventario considerando compras y salidas con filtros
-            query = """
-            WITH total_compras AS (
-                SELECT 
-                    MIN(c.id) as id,
-                    c.tipo_producto,
-                    c.descripcion,
-                    SUM(c.cantidad) as cantidad_comprada,
-                    AVG(c.precio_unitario) as precio_promedio,
-                    MAX(c.fecha) as ultimo_movimiento,
-                    p.nombre as proveedor,
-                    p.id as proveedor_id
-                FROM compras c
-                JOIN proveedores p ON c.proveedor_id = p.id
-                WHERE 1=1
-            """
-            
-            params = []
-            
-            if tipo_filtro != "Todos":
-                query += " AND c.tipo_producto = ?"
-                params.append(tipo_filtro)
-            
-            if proveedor_filtro != "Todos":
-                query += " AND p.nombre = ?"
-                params.append(proveedor_filtro)
-            
-            query += """
-                GROUP BY c.tipo_producto, c.descripcion
-            ),
-            total_salidas AS (
-                SELECT 
-                    s.tipo_producto,
-                    s.descripcion,
-                    SUM(s.cantidad) as cantidad_salida
-                FROM salidas_inventario s
-                GROUP BY s.tipo_producto, s.descripcion
-            )
-            SELECT 
-                c.id,
-                c.tipo_producto,
-                c.descripcion,
-                c.cantidad_comprada - COALESCE(s.cantidad_salida, 0) as cantidad_disponible,
-                c.precio_promedio,
-                c.ultimo_movimiento,
-                c.proveedor,
-                c.proveedor_id
-            FROM total_compras c
-            LEFT JOIN total_salidas s ON c.tipo_producto = s.tipo_producto AND c.descripcion = s.descripcion
-            WHERE c.cantidad_comprada - COALESCE(s.cantidad_salida, 0) > 0
-            ORDER BY c.tipo_producto, c.descripcion
-            """
+            # Inventario desde las existencias materializadas con filtros
+            query, params = consulta_inventario(None if tipo_filtro == "Todos" else tipo_filtro,
+                                                None if proveedor_filtro == "Todos" else proveedor_filtro)
             
             cursor.execute(query, params)
             
             total_productos = 0
             total_cantidad = 0
             total_valor = 0.0
+            filas = []
             
             for row in cursor.fetchall():
                 id_producto, tipo, descripcion, cantidad, precio_unitario, fecha, proveedor, _ = row
                 valor_total = cantidad * precio_unitario
                 
-                self.tree_inventario.insert("", tk.END, values=(
+                filas.append((id_producto, (
                     id_producto,
                     tipo,
                     descripcion,
@@ -3196,12 +6013,15 @@ class SistemaERP:
                     f"${valor_total:.2f}",
                     fecha,
                     proveedor
-                ))
+                ), ()))
                 
                 total_productos += 1
                 total_cantidad += cantidad
                 total_valor += valor_total
             
+            # Solo se aplican los productos que cambiaron
+            actualizar_filas(self.tree_inventario, filas)
+            
             # Actualizar resumen
             self.label_resumen.config(text=f"Total de productos: {total_productos} | Cantidad total: {total_cantidad} | Valor total: ${total_valor:.2f}")
             
@@ -3432,31 +6252,15 @@ class SistemaERP:
 
     def registrar_salida_inventario(self, id_producto, tipo_producto, descripcion, cantidad, destino, responsable, notas, cantidad_disponible, popup):
         """Registra una salida de inventario en la base de datos"""
-        # Validaciones mejoradas
-        if not cantidad.strip():
-            messagebox.showwarning("Advertencia", "El campo Cantidad es obligatorio")
-            return
-            
-        if not destino.strip():
-            messagebox.showwarning("Advertencia", "El campo Destino es obligatorio")
-            return
-            
-        if not responsable:
-            messagebox.showwarning("Advertencia", "El campo Responsable es obligatorio")
-            return
-        
         try:
-            cantidad_int = int(cantidad)
-            if cantidad_int <= 0:
-                messagebox.showwarning("Advertencia", "La cantidad debe ser mayor a cero")
-                return
+            cantidad_int = self.inventario.validar_salida(cantidad, destino, responsable)
+        except DatosInvalidos as e:
+            messagebox.showwarning("Advertencia", str(e))
+            return
             
-            if cantidad_int > cantidad_disponible:
-                messagebox.showwarning("Advertencia", "No hay suficiente cantidad disponible.\n" +
-                                    f"Disponible: {cantidad_disponible}, Solicitado: {cantidad_int}")
-                return
-        except ValueError:
-            messagebox.showerror("Error", "La cantidad debe ser un número entero")
+        if cantidad_int > cantidad_disponible:
+            messagebox.showwarning("Advertencia", "No hay suficiente cantidad disponible.\n" +
+                                f"Disponible: {cantidad_disponible}, Solicitado: {cantidad_int}")
             return
         
         # Mostrar confirmación antes de proceder
@@ -3465,49 +6269,24 @@ class SistemaERP:
         if not confirmar:
             return
         
-        conn = sqlite3.connect('erp_autobuses.db')
         try:
-            cursor = conn.cursor()
-            
-            # Verificar si existe la tabla de salidas, si no, crearla
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS salidas_inventario (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    producto_id INTEGER,
-                    fecha TEXT,
-                    tipo_producto TEXT,
-                    descripcion TEXT,
-                    cantidad INTEGER,
-                    destino TEXT,
-                    responsable TEXT,
-                    notas TEXT,
-                    FOREIGN KEY(producto_id) REFERENCES compras(id)
-                )
-            """)
-            
-            # Registrar la salida con fecha y hora actual
-            fecha = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            cursor.execute("""
-                INSERT INTO salidas_inventario (producto_id, fecha, tipo_producto, descripcion, cantidad, destino, responsable, notas)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (id_producto, fecha, tipo_producto, descripcion, cantidad_int, destino, responsable, notas))
-            
-            # Actualizar inventario (en caso de tener una tabla separada para control de stock)
-            # Aquí se implementaría si fuera necesario
-            
-            conn.commit()
-            messagebox.showinfo("Éxito", f"Salida de {cantidad_int} unidades registrada correctamente")
-            popup.destroy()
-            
-            # Actualizar todas las vistas afectadas
+            self.inventario.registrar_salida(id_producto, tipo_producto, descripcion, cantidad_int,
+                                             destino, responsable, notas)
+        except ExistenciaInsuficiente:
+            messagebox.showwarning("Advertencia", "No hay suficiente cantidad disponible.\n" +
+                                "Otra terminal registró una salida de este producto.")
             self.cargar_inventario()
-            self.cargar_salidas()
-            
+            return
         except Exception as e:
-            conn.rollback()
             messagebox.showerror("Error", f"Error al registrar salida: {str(e)}")
-        finally:
-            conn.close()
+            return
+        
+        messagebox.showinfo("Éxito", f"Salida de {cantidad_int} unidades registrada correctamente")
+        popup.destroy()
+        
+        # Actualizar todas las vistas afectadas
+        self.cargar_inventario()
+        self.cargar_salidas()
 
     # ------ Movimientos de Inventario ------
     def setup_tab_movimientos(self, parent):
@@ -3532,12 +6311,12 @@ class SistemaERP:
         
         # Filtro por fecha
         tk.Label(filtros_frame, text="Desde:").pack(side=tk.LEFT, padx=5)
-        self.fecha_desde = DateEntry(filtros_frame, width=12, background='darkblue', foreground='white', borderwidth=2)
+        self.fecha_desde = selector_fecha(filtros_frame, width=12, background='darkblue', foreground='white', borderwidth=2)
         self.fecha_desde.pack(side=tk.LEFT, padx=5)
         self.fecha_desde.set_date(datetime.datetime.now() - datetime.timedelta(days=30))
         
         tk.Label(filtros_frame, text="Hasta:").pack(side=tk.LEFT, padx=5)
-        self.fecha_hasta = DateEntry(filtros_frame, width=12, background='darkblue', foreground='white', borderwidth=2)
+        self.fecha_hasta = selector_fecha(filtros_frame, width=12, background='darkblue', foreground='white', borderwidth=2)
         self.fecha_hasta.pack(side=tk.LEFT, padx=5)
         self.fecha_hasta.set_date(datetime.datetime.now())
         
@@ -3567,7 +6346,7 @@ class SistemaERP:
 
     def cargar_tipos_para_movimientos(self):
         """Carga los tipos de producto para el filtro en movimientos"""
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         try:
             cursor = conn.cursor()
             
@@ -3592,67 +6371,7 @@ class SistemaERP:
 
     def cargar_movimientos(self):
         """Carga todos los movimientos de inventario (entradas y salidas)"""
-        for item in self.tree_movimientos.get_children():
-            self.tree_movimientos.delete(item)
-        
-        conn = sqlite3.connect('erp_autobuses.db')
-        try:
-            cursor = conn.cursor()
-            
-            # Cargar entradas (compras)
-            cursor.execute("""
-                SELECT 
-                    c.id, 
-                    c.fecha, 
-                    'Entrada' as tipo, 
-                    c.tipo_producto, 
-                    c.descripcion, 
-                    c.cantidad, 
-                    p.nombre,
-                    '' as responsable,
-                    '' as notas
-                FROM compras c
-                JOIN proveedores p ON c.proveedor_id = p.id
-                ORDER BY c.fecha DESC
-            """)
-            
-            entradas = cursor.fetchall()
-            
-            # Verificar si existe la tabla de salidas_inventario
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='salidas_inventario'")
-            existe_tabla = cursor.fetchone() is not None
-            
-            salidas = []
-            if existe_tabla:
-                # Cargar salidas solo si la tabla existe
-                cursor.execute("""
-                    SELECT 
-                        s.id,
-                        s.fecha,
-                        'Salida' as tipo,
-                        s.tipo_producto,
-                        s.descripcion,
-                        s.cantidad,
-                        s.destino,
-                        s.responsable,
-                        s.notas
-                    FROM salidas_inventario s
-                    ORDER BY s.fecha DESC
-                """)
-                
-                salidas = cursor.fetchall()
-            
-            # Combinar y ordenar por fecha
-            todos_movimientos = entradas + salidas
-            todos_movimientos.sort(key=lambda x: x[1], reverse=True)
-            
-            for row in todos_movimientos:
-                self.tree_movimientos.insert("", tk.END, values=row)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al cargar movimientos: {str(e)}")
-        finally:
-            conn.close()
+        self.mostrar_movimientos(CONSULTA_ENTRADAS_INVENTARIO, [], CONSULTA_SALIDAS_INVENTARIO, [])
 
     def filtrar_movimientos(self):
         """Filtra los movimientos por tipo, fecha y tipo de producto"""
@@ -3661,92 +6380,43 @@ class SistemaERP:
         desde = self.fecha_desde.get_date().strftime("%Y-%m-%d")
         hasta = self.fecha_hasta.get_date().strftime("%Y-%m-%d")
         
-        for item in self.tree_movimientos.get_children():
-            self.tree_movimientos.delete(item)
+        query_entradas = query_salidas = None
+        params_entradas, params_salidas = [], []
         
-        conn = sqlite3.connect('erp_autobuses.db')
-        try:
-            cursor = conn.cursor()
-            
-            movimientos_filtrados = []
-            
-            # Consultar entradas si corresponde
-            if tipo_movimiento in ["Todos", "Entradas"]:
-                query_entradas = """
-                    SELECT 
-                        c.id, 
-                        c.fecha, 
-                        'Entrada' as tipo, 
-                        c.tipo_producto, 
-                        c.descripcion, 
-                        c.cantidad, 
-                        p.nombre,
-                        '' as responsable,
-                        '' as notas
-                    FROM compras c
-                    JOIN proveedores p ON c.proveedor_id = p.id
-                    WHERE c.fecha BETWEEN ? AND ?
-                """
-                
-                params = [desde, hasta + " 23:59:59"]
-                
-                if tipo_producto != "Todos":
-                    query_entradas += " AND c.tipo_producto = ?"
-                    params.append(tipo_producto)
-                
-                query_entradas += " ORDER BY c.fecha DESC"
-                
-                cursor.execute(query_entradas, params)
-                movimientos_filtrados.extend(cursor.fetchall())
-            
-            # Verificar si existe la tabla de salidas_inventario
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='salidas_inventario'")
-            existe_tabla = cursor.fetchone() is not None
-            
-            # Consultar salidas si corresponde y si la tabla existe
-            if tipo_movimiento in ["Todos", "Salidas"] and existe_tabla:
-                query_salidas = """
-                    SELECT 
-                        s.id,
-                        s.fecha,
-                        'Salida' as tipo,
-                        s.tipo_producto,
-                        s.descripcion,
-                        s.cantidad,
-                        s.destino,
-                        s.responsable,
-                        s.notas
-                    FROM salidas_inventario s
-                    WHERE s.fecha BETWEEN ? AND ?
-                """
-                
-                params = [desde, hasta + " 23:59:59"]
-                
-                if tipo_producto != "Todos":
-                    query_salidas += " AND s.tipo_producto = ?"
-                    params.append(tipo_producto)
-                
-                query_salidas += " ORDER BY s.fecha DESC"
-                
-                cursor.execute(query_salidas, params)
-                movimientos_filtrados.extend(cursor.fetchall())
+        # Consultar entradas si corresponde
+        if tipo_movimiento in ["Todos", "Entradas"]:
+            query_entradas = CONSULTA_ENTRADAS_INVENTARIO + " WHERE c.fecha BETWEEN ? AND ?"
+            params_entradas = [desde, hasta + " 23:59:59"]
             
-            # Ordenar por fecha
-            movimientos_filtrados.sort(key=lambda x: x[1], reverse=True)
-            
-            for row in movimientos_filtrados:
-                self.tree_movimientos.insert("", tk.END, values=row)
+            if tipo_producto != "Todos":
+                query_entradas += " AND c.tipo_producto = ?"
+                params_entradas.append(tipo_producto)
+        
+        # Consultar salidas si corresponde
+        if tipo_movimiento in ["Todos", "Salidas"]:
+            query_salidas = CONSULTA_SALIDAS_INVENTARIO + " WHERE s.fecha BETWEEN ? AND ?"
+            params_salidas = [desde, hasta + " 23:59:59"]
             
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al filtrar movimientos: {str(e)}")
-        finally:
-            conn.close()
+            if tipo_producto != "Todos":
+                query_salidas += " AND s.tipo_producto = ?"
+                params_salidas.append(tipo_producto)
+        
+        self.mostrar_movimientos(query_entradas, params_entradas, query_salidas, params_salidas)
+
+    def mostrar_movimientos(self, query_entradas, params_entradas, query_salidas, params_salidas):
+        """Muestra entradas y salidas combinadas por fecha, cargando por páginas"""
+        partes = [q for q in (query_entradas, query_salidas) if q]
+        query = " UNION ALL ".join(partes)
+        params = (params_entradas if query_entradas else []) + (params_salidas if query_salidas else [])
+        tabla = self.tabla_virtual(self.tree_movimientos, clave_item=lambda row: f"{row[2]}-{row[0]}",
+                                   segundo_plano=True,
+                                   mensaje_error="Error al cargar movimientos")
+        tabla.cargar(CursorKeyset(self.db, query, ("fecha", "tipo", "id"), params, descendente=True))
 
 # =================== MÓDULO DE COMPRAS ================================
     def mostrar_modulo_compras(self):
         # Limpiar ventana
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        self.limpiar_ventana()
         
         # Configurar fondo general
         self.root.configure(bg='#e6ecf0')
@@ -3884,7 +6554,7 @@ class SistemaERP:
         proveedor_id = int(seleccion.split("-")[0].strip())
         
         # Consultar los tipos de producto que ofrece este proveedor
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         cursor = conn.cursor()
         try:
             cursor.execute("""
@@ -3920,7 +6590,7 @@ class SistemaERP:
             messagebox.showerror("Error", "Cantidad y precio deben ser números válidos")
 
     def cargar_proveedores_combobox(self):
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         cursor = conn.cursor()
     
         try:
@@ -3933,90 +6603,34 @@ class SistemaERP:
             conn.close()
 
     def registrar_compra(self):
-    # Validar datos
+    # Datos del formulario
         proveedor = self.proveedor_combobox.get()
-        tipo_producto = self.tipo_producto_combobox.get()
-        descripcion = self.descripcion_compra_entry.get()  # Asegúrate que este Entry se llama así
-        cantidad_str = self.cantidad_compra_entry.get()
-        precio_str = self.precio_unitario_entry.get()
-    
-        if not all([proveedor, tipo_producto, descripcion, cantidad_str, precio_str]):
-            messagebox.showwarning("Advertencia", "Todos los campos son obligatorios")
-            return
-    
-        try:
-            proveedor_id = int(proveedor.split("-")[0].strip())
-            cantidad = int(cantidad_str)
-            precio_unitario = float(precio_str)
-            total = cantidad * precio_unitario
-        except ValueError:
-            messagebox.showerror("Error", "Cantidad y precio deben ser números válidos")
-            return
-
-    # Insertar en la base de datos
-        conn = sqlite3.connect('erp_autobuses.db')
-        cursor = conn.cursor()
-        try:
-            fecha = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-            # CORRECCIÓN AQUÍ: usar descripcion en lugar de description
-            cursor.execute("""
-                INSERT INTO compras (fecha, proveedor_id, tipo_producto, descripcion, cantidad, precio_unitario, total)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (fecha, proveedor_id, tipo_producto, descripcion, cantidad, precio_unitario, total))
-        
-        # Resto del código para registrar en finanzas...
-        
-            # Registrar en finanzas (egreso)
-            cursor.execute("SELECT saldo_actual FROM finanzas ORDER BY id DESC LIMIT 1")
-            saldo_actual = cursor.fetchone()[0]
-        
-            concepto = f"Compra de {tipo_producto}: {descripcion}"
-        
-            cursor.execute("""
-                INSERT INTO finanzas (fecha, concepto, ingreso, egreso, saldo_actual)
-                VALUES (?, ?, ?, ?, ?)
-            """, (fecha, concepto, 0, total, saldo_actual - total))
-        
-            # Si es autobús o computadora, agregar al inventario
-            if tipo_producto == "Autobús":
-                # Extraer marca y modelo de la descripción (esto es un ejemplo simplificado)
-                partes = descripcion.split()
-                marca = partes[0] if len(partes) > 0 else "Desconocida"
-                modelo = partes[1] if len(partes) > 1 else "Desconocido"
-            
-                cursor.execute("""
-                    INSERT INTO autobuses (marca, modelo, año, capacidad, estado)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (marca, modelo, datetime.datetime.now().year, 24, "Nuevo"))
-        
-            elif tipo_producto == "Computadora":
-                # Extraer marca y modelo de la descripción
-                partes = descripcion.split()
-                marca = partes[0] if len(partes) > 0 else "Desconocida"
-                modelo = partes[1] if len(partes) > 1 else "Desconocido"
-            
-                cursor.execute("""
-                    INSERT INTO computadoras (marca, modelo, asignado_a, departamento, estado)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (marca, modelo, "", "", "Nuevo"))
-        
-            conn.commit()
-            messagebox.showinfo("Éxito", "Compra registrada correctamente")
-        
-            # Limpiar formulario
-            self.proveedor_combobox.set("")
-            self.tipo_producto_combobox.set("")
-            self.descripcion_compra_entry.delete(0, tk.END)
-            self.cantidad_compra_entry.delete(0, tk.END)
-            self.precio_unitario_entry.delete(0, tk.END)
-            self.total_compra_label.config(text="$0.00")
-        
+        tipo_producto = self.tipo_producto_combobox.get()
+        descripcion = self.descripcion_compra_entry.get()  # Asegúrate que este Entry se llama así
+        cantidad_str = self.cantidad_compra_entry.get()
+        precio_str = self.precio_unitario_entry.get()
+    
+        proveedor_id = proveedor.split("-")[0].strip()
+    
+    # Registrar la compra, sus existencias y el egreso en finanzas
+        try:
+            self.inventario.registrar_compra(proveedor_id, tipo_producto, descripcion, cantidad_str, precio_str)
+        except DatosInvalidos as e:
+            messagebox.showwarning("Advertencia", str(e))
+            return
         except Exception as e:
             messagebox.showerror("Error", f"Error al registrar compra: {str(e)}")
-            conn.rollback()
-        finally:
-            conn.close()
+            return
+        
+        messagebox.showinfo("Éxito", "Compra registrada correctamente")
+    
+        # Limpiar formulario
+        self.proveedor_combobox.set("")
+        self.tipo_producto_combobox.set("")
+        self.descripcion_compra_entry.delete(0, tk.END)
+        self.cantidad_compra_entry.delete(0, tk.END)
+        self.precio_unitario_entry.delete(0, tk.END)
+        self.total_compra_label.config(text="$0.00")
 
     def setup_tab_historial_compras(self, parent):
         # Frame principal
@@ -4096,47 +6710,27 @@ class SistemaERP:
         tipo = self.filtro_tipo.get()
         
         # Construir la consulta SQL
-        query = """
-            SELECT c.id, c.fecha, p.nombre, c.tipo_producto, c.descripcion, 
-                   c.cantidad, c.precio_unitario, c.total 
-            FROM compras c 
-            JOIN proveedores p ON c.proveedor_id = p.id 
-        """
-        
-        # Aplicar filtro si no es "Todos"
-        if tipo != "Todos":
-            query += " WHERE c.tipo_producto = ?"
-            params = [tipo]
-        else:
-            params = []
-        
-        query += " ORDER BY c.fecha DESC LIMIT 100"
-        
-        # Limpiar treeview
-        for item in self.tree_compras.get_children():
-            self.tree_compras.delete(item)
-        
-        # Ejecutar consulta
-        conn = sqlite3.connect('erp_autobuses.db')
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute(query, params)
-            for row in cursor.fetchall():
-                self.tree_compras.insert("", tk.END, values=(
-                    row[0], 
-                    row[1], 
-                    row[2], 
-                    row[3], 
-                    row[4], 
-                    row[5], 
-                    f"${row[6]:.2f}", 
-                    f"${row[7]:.2f}"
-                ))
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al cargar historial: {str(e)}")
-        finally:
-            conn.close()
+        query, params = consulta_historial_compras(None if tipo == "Todos" else tipo)
+        
+        # Páginas de 100 por (fecha, id) descendente; las anteriores se cargan al bajar
+        tabla = self.tabla_virtual(self.tree_compras, self.formatear_compra,
+                                   clave_item=lambda row: row[0],
+                                   mensaje_error="Error al cargar historial",
+                                   paginas_en_memoria=None)
+        tabla.cargar(CursorKeyset(self.db, query, ("fecha", "id"), params,
+                                  descendente=True, tam_pagina=100))
+
+    def formatear_compra(self, row):
+        return (
+            row[0], 
+            row[1], 
+            row[2], 
+            row[3], 
+            row[4], 
+            row[5], 
+            f"${row[6]:.2f}", 
+            f"${row[7]:.2f}"
+        ), ()
 
     def limpiar_filtro(self):
         """Restablece el filtro a su valor por defecto"""
@@ -4146,8 +6740,7 @@ class SistemaERP:
 # =================== MÓDULO DE PROVEEDORES ============================
     def mostrar_modulo_proveedores(self):
         # Limpiar ventana
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        self.limpiar_ventana()
         
         # Configurar fondo general
         self.root.configure(bg='#e6ecf0')
@@ -4413,7 +7006,7 @@ class SistemaERP:
             return
         
         # Insertar en la base de datos
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         cursor = conn.cursor()
         
         try:
@@ -4439,7 +7032,7 @@ class SistemaERP:
             self.tree_proveedores.delete(item)
         
         # Cargar proveedores de la base de datos
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         cursor = conn.cursor()
         
         try:
@@ -4478,7 +7071,7 @@ class SistemaERP:
         
         if confirmacion:
             # Eliminar de la base de datos
-            conn = sqlite3.connect('erp_autobuses.db')
+            conn = self.db.conectar()
             cursor = conn.cursor()
             
             try:
@@ -4495,8 +7088,7 @@ class SistemaERP:
 # =================== MÓDULO DE VENTAS =================================
     def mostrar_modulo_ventas(self):
             # Limpiar ventana
-            for widget in self.root.winfo_children():
-                widget.destroy()
+            self.limpiar_ventana()
             
             # Configurar fondo general
             self.root.configure(bg='#e6ecf0')
@@ -4547,9 +7139,7 @@ class SistemaERP:
 
             # Logo debajo del título
             try:
-                logo_img = Image.open("logo.png")  # Asegúrate que la ruta es correcta
-                logo_img = logo_img.resize((150, 150), Image.LANCZOS)
-                self.logo_tk = ImageTk.PhotoImage(logo_img)  # Mantener en self para evitar garbage collection
+                self.logo_tk = self.imagenes.foto("logo.png", (150, 150))  # Mantener en self para evitar garbage collection
                 logo_label = tk.Label(form_container, image=self.logo_tk, bg='#FFFFFF')
                 logo_label.pack(pady=(0, 10))
             except Exception as e:
@@ -4575,7 +7165,7 @@ class SistemaERP:
             # Nuevo campo de fecha movido aquí
             tk.Label(form_frame, text="Fecha de Viaje:", 
                     bg='white', fg='#003366', font=('Arial', 11)).grid(row=2, column=0, sticky="w", pady=5, padx=5)
-            self.fecha_viaje_entry = DateEntry(form_frame, width=12, 
+            self.fecha_viaje_entry = selector_fecha(form_frame, width=12, 
                                             background='darkblue', foreground='white', 
                                             borderwidth=2, font=('Arial', 11))
             self.fecha_viaje_entry.grid(row=2, column=1, pady=5, padx=5, sticky="w")
@@ -4656,7 +7246,7 @@ class SistemaERP:
             self.cargar_rutas_combobox()
 
     def cargar_rutas_combobox(self):
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         try:
             cursor = conn.cursor()
             cursor.execute("""
@@ -4685,7 +7275,7 @@ class SistemaERP:
 
         ruta_id = int(seleccion.split("-")[0].strip())
 
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         cursor = conn.cursor()
 
         try:
@@ -4722,36 +7312,18 @@ class SistemaERP:
             horario_id = int(seleccion.split("-")[0].strip())
             fecha_viaje = self.fecha_viaje_entry.get_date().strftime("%Y-%m-%d")
         
-            conn = sqlite3.connect('erp_autobuses.db')
-            cursor = conn.cursor()
-        
-            cursor.execute("""
-                SELECT numero_asiento 
-                FROM boletos 
-                WHERE horario_id = ? AND fecha_viaje = ?
-                ORDER BY numero_asiento
-            """, (horario_id, fecha_viaje))
-            asientos_ocupados = [row[0] for row in cursor.fetchall()]
-        
-            cursor.execute("""
-                SELECT a.capacidad 
-                FROM horarios h
-                JOIN autobuses a ON h.autobus_id = a.id
-                WHERE h.id = ?
-            """, (horario_id,))
-            capacidad = cursor.fetchone()[0]
+            precio = self.ventas.precio_boleto(horario_id)
         
-            cursor.execute("""
-                SELECT r.precio_boleto 
-                FROM horarios h
-                JOIN rutas r ON h.ruta_id = r.id
-                WHERE h.id = ?
-            """, (horario_id,))
-            precio = cursor.fetchone()[0]
+            # Al cambiar de viaje se sueltan los asientos apartados en el anterior
+            viaje_anterior = getattr(self, 'viaje_retenido', None)
+            if viaje_anterior and viaje_anterior != (horario_id, fecha_viaje):
+                self.retenciones.soltar(*viaje_anterior)
+            self.viaje_retenido = (horario_id, fecha_viaje)
         
+            retenidos = self.retenciones.retenidos_por_otros(horario_id, fecha_viaje)
             asientos_disponibles = [
-                str(i) for i in range(1, capacidad + 1) 
-                if i not in asientos_ocupados
+                str(i) for i in self.asientos.libres(horario_id, fecha_viaje)
+                if i not in retenidos
             ]
         
             self.asientos_listbox.delete(0, tk.END)
@@ -4767,8 +7339,6 @@ class SistemaERP:
         
         except Exception as e:
             messagebox.showerror("Error", f"Error al cargar asientos: {str(e)}")
-        finally:
-            conn.close()
 
     def actualizar_cantidad_desde_asientos(self, event=None):
         seleccionados = self.asientos_listbox.curselection()
@@ -4778,6 +7348,7 @@ class SistemaERP:
             self.cantidad_spinbox.delete(0, tk.END)
             self.cantidad_spinbox.insert(0, str(cantidad))
         
+        self.retener_asientos_seleccionados()
         self.actualizar_precio_total()
 
     def actualizar_asientos_desde_cantidad(self, event=None):
@@ -4792,7 +7363,9 @@ class SistemaERP:
                     self.cantidad_spinbox.delete(0, tk.END)
                     self.cantidad_spinbox.insert(0, str(cantidad_deseada))
                 
-                nuevos_seleccionados = list(range(min(cantidad_deseada, total_asientos)))
+                nuevos_seleccionados = self.indices_asientos_contiguos(cantidad_deseada)
+                if nuevos_seleccionados is None:
+                    nuevos_seleccionados = list(range(min(cantidad_deseada, total_asientos)))
                 self.asientos_listbox.selection_clear(0, tk.END)
                 for i in nuevos_seleccionados:
                     self.asientos_listbox.selection_set(i)
@@ -4803,10 +7376,47 @@ class SistemaERP:
                 for i in nuevos_seleccionados:
                     self.asientos_listbox.selection_set(i)
             
+            self.retener_asientos_seleccionados()
             self.actualizar_precio_total()
         except ValueError:
             pass
 
+    def retener_asientos_seleccionados(self):
+        """Aparta los asientos marcados mientras se confirma la venta"""
+        seleccion = self.horario_combobox.get()
+        if not seleccion:
+            return
+        horario_id = int(seleccion.split("-")[0].strip())
+        fecha_viaje = self.fecha_viaje_entry.get_date().strftime("%Y-%m-%d")
+        indices = {int(self.asientos_listbox.get(i)): i for i in self.asientos_listbox.curselection()}
+        try:
+            ajenos = self.retenciones.retener(horario_id, fecha_viaje, indices)
+        except (sqlite3.Error, OSError, RuntimeError):
+            # La retención es una ayuda; la venta se valida de todos modos al confirmar
+            self.errores_retencion += 1
+            return
+        self.viaje_retenido = (horario_id, fecha_viaje)
+        if ajenos:
+            for numero in ajenos:
+                self.asientos_listbox.selection_clear(indices[numero])
+            messagebox.showwarning("Disponibilidad",
+                f"Los asientos {', '.join(str(a) for a in ajenos)} están apartados por otra terminal")
+
+    def indices_asientos_contiguos(self, cantidad):
+        """Posiciones en la lista del primer bloque de asientos juntos, o None"""
+        seleccion = self.horario_combobox.get()
+        if not seleccion:
+            return None
+        horario_id = int(seleccion.split("-")[0].strip())
+        fecha_viaje = self.fecha_viaje_entry.get_date().strftime("%Y-%m-%d")
+        bloque = self.asientos.contiguos(horario_id, fecha_viaje, cantidad)
+        if not bloque:
+            return None
+        posiciones = {self.asientos_listbox.get(i): i for i in range(self.asientos_listbox.size())}
+        if not all(str(numero) in posiciones for numero in bloque):
+            return None
+        return [posiciones[str(numero)] for numero in bloque]
+
     def actualizar_precio_total(self, event=None):
         try:
             precio_texto = self.precio_unitario_label.cget("text")
@@ -4834,81 +7444,45 @@ class SistemaERP:
             messagebox.showwarning("Advertencia", "Todos los campos son obligatorios")
             return
 
-        try:
-            horario_id = int(horario.split("-")[0].strip())
-            cantidad = len(asientos_seleccionados)
-            
-            precio_texto = self.precio_unitario_label.cget("text")
-            precio_unitario = float(precio_texto.replace("$", ""))
-            precio_total = precio_unitario * cantidad
+        horario_id = horario.split("-")[0].strip()
+        asientos_numeros = [self.asientos_listbox.get(index) for index in asientos_seleccionados]
 
-            conn = sqlite3.connect('erp_autobuses.db')
-            cursor = conn.cursor()
-            
-            try:
-                asientos_numeros = []
-                for index in asientos_seleccionados:
-                    numero_asiento = int(self.asientos_listbox.get(index))
-                    asientos_numeros.append(numero_asiento)
-                    
-                    cursor.execute("""
-                        SELECT 1 FROM boletos 
-                        WHERE horario_id = ? AND fecha_viaje = ? AND numero_asiento = ?
-                    """, (horario_id, fecha_viaje, numero_asiento))
-            
-                    if cursor.fetchone():
-                        messagebox.showerror("Error", 
-                            f"El asiento {numero_asiento} ya está ocupado. Por favor seleccione otros asientos.")
-                        return
+        try:
+            # El servicio cobra el precio vigente de la ruta
+            venta = self.ventas.vender_boletos(nombre, apellidos, horario_id, fecha_viaje, asientos_numeros)
+        except DatosInvalidos as e:
+            messagebox.showerror("Error", str(e))
+            return
+        except AsientosOcupados as e:
+            # Vendidos desde otra terminal: el servicio ya descartó el mapa desactualizado
+            ocupados = ", ".join(str(a) for a in e.asientos)
+            messagebox.showerror("Error", 
+                f"Los asientos {ocupados} ya están ocupados. Por favor seleccione otros asientos.")
+            self.actualizar_asientos_disponibles()
+            return
+        except Exception as e:
+            messagebox.showerror("Error", f"Error al vender boletos: {str(e)}")
+            return
 
-                fecha_compra = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        messagebox.showinfo("Éxito", f"{len(venta.asientos)} boletos vendidos exitosamente")
 
-                for numero_asiento in asientos_numeros:
-                    cursor.execute("""
-                        INSERT INTO boletos (nombre_pasajero, apellidos_pasajero, horario_id, 
-                                            numero_asiento, fecha_viaje, fecha_compra, precio)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """, (nombre, apellidos, horario_id, numero_asiento, fecha_viaje, fecha_compra, precio_unitario))
+        self.nombre_pasajero_entry.delete(0, tk.END)
+        self.apellidos_pasajero_entry.delete(0, tk.END)
+        self.ruta_combobox.set("")
+        self.horario_combobox.set("")
+        self.fecha_viaje_entry.set_date(datetime.datetime.now())
+        self.asientos_listbox.delete(0, tk.END)
+        self.cantidad_spinbox.delete(0, tk.END)
+        self.cantidad_spinbox.insert(0, "1")
+        self.precio_unitario_label.config(text="$0.00")
+        self.precio_total_label.config(text="$0.00")
 
-                cursor.execute("SELECT saldo_actual FROM finanzas ORDER BY id DESC LIMIT 1")
-                saldo_actual = cursor.fetchone()[0]
-                concepto = f"Venta de {cantidad} boletos a {nombre} {apellidos}"
+        if ruta:
+            self.actualizar_horarios_disponibles()
         
-                cursor.execute("""
-                    INSERT INTO finanzas (fecha, concepto, ingreso, egreso, saldo_actual)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (fecha_compra, concepto, precio_total, 0, saldo_actual + precio_total))
-
-                conn.commit()
-                messagebox.showinfo("Éxito", f"{cantidad} boletos vendidos exitosamente")
-
-                self.nombre_pasajero_entry.delete(0, tk.END)
-                self.apellidos_pasajero_entry.delete(0, tk.END)
-                self.ruta_combobox.set("")
-                self.horario_combobox.set("")
-                self.fecha_viaje_entry.set_date(datetime.datetime.now())
-                self.asientos_listbox.delete(0, tk.END)
-                self.cantidad_spinbox.delete(0, tk.END)
-                self.cantidad_spinbox.insert(0, "1")
-                self.precio_unitario_label.config(text="$0.00")
-                self.precio_total_label.config(text="$0.00")
-
-                if ruta:
-                    self.actualizar_horarios_disponibles()
-                
-                    if horario:
-                        self.root.after(100, lambda: self.horario_combobox.set(horario))
-                        self.root.after(150, lambda: self.actualizar_asientos_disponibles())
-
-            except Exception as e:
-                messagebox.showerror("Error", f"Error al vender boletos: {str(e)}")
-                conn.rollback()
-            finally:
-                conn.close()
-
-        except ValueError:
-            messagebox.showerror("Error", "Debe seleccionar al menos un asiento")
-            return
+            if horario:
+                self.root.after(100, lambda: self.horario_combobox.set(horario))
+                self.root.after(150, lambda: self.actualizar_asientos_disponibles())
 
     def mostrar_clientes(self):
         clientes_window = tk.Toplevel(self.root)
@@ -4930,6 +7504,7 @@ class SistemaERP:
         
         self.busqueda_cliente_entry = tk.Entry(search_frame, width=40, font=('Arial', 11), bd=1, relief='solid')
         self.busqueda_cliente_entry.pack(side=tk.LEFT, padx=5)
+        self.busqueda_cliente_entry.bind("<KeyRelease>", self.programar_busqueda_clientes)
         
         # Botón de búsqueda (ESTILO EXACTO como lo pediste)
         search_btn = tk.Button(search_frame, 
@@ -4993,82 +7568,66 @@ class SistemaERP:
         self.cargar_todos_clientes()
 
     def cargar_todos_clientes(self):
-        conn = sqlite3.connect('erp_autobuses.db')
-        try:
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT 
-                    MIN(b.id) as sample_id,
-                    b.nombre_pasajero,
-                    b.apellidos_pasajero,
-                    COUNT(*) as boletos_comprados,
-                    MAX(b.fecha_compra) as ultima_compra,
-                    SUM(b.precio) as total_gastado
-                FROM boletos b
-                GROUP BY b.nombre_pasajero, b.apellidos_pasajero
-                ORDER BY ultima_compra DESC
-            """)
-            
-            for item in self.clientes_tree.get_children():
-                self.clientes_tree.delete(item)
-                
-            for row in cursor.fetchall():
-                self.clientes_tree.insert("", tk.END, values=(
-                    row[0],  # sample_id
-                    row[1],  # nombre
-                    row[2],  # apellidos
-                    row[3],  # boletos comprados
-                    row[4],  # última compra
-                    f"${row[5]:.2f}"  # total gastado
-                ))
-                
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al cargar clientes: {str(e)}")
-        finally:
-            conn.close()
+        if self.api is not None:
+            return self.mostrar_clientes_api("")
+        self.mostrar_clientes_filtrados("", [])
 
     def buscar_clientes(self):
         busqueda = self.busqueda_cliente_entry.get().strip()
         
-        conn = sqlite3.connect('erp_autobuses.db')
-        try:
-            cursor = conn.cursor()
-            
-            if busqueda:
-                cursor.execute("""
-                    SELECT 
-                        MIN(b.id) as sample_id,
-                        b.nombre_pasajero,
-                        b.apellidos_pasajero,
-                        COUNT(*) as boletos_comprados,
-                        MAX(b.fecha_compra) as ultima_compra,
-                        SUM(b.precio) as total_gastado
-                    FROM boletos b
-                    WHERE b.nombre_pasajero LIKE ? OR b.apellidos_pasajero LIKE ?
-                    GROUP BY b.nombre_pasajero, b.apellidos_pasajero
-                    ORDER BY ultima_compra DESC
-                """, (f"%{busqueda}%", f"%{busqueda}%"))
-            else:
-                return self.cargar_todos_clientes()
-            
-            for item in self.clientes_tree.get_children():
-                self.clientes_tree.delete(item)
-                
-            for row in cursor.fetchall():
-                self.clientes_tree.insert("", tk.END, values=(
-                    row[0],  # sample_id
-                    row[1],  # nombre
-                    row[2],  # apellidos
-                    row[3],  # boletos comprados
-                    row[4],  # última compra
-                    f"${row[5]:.2f}"  # total gastado
-                ))
-                
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al buscar clientes: {str(e)}")
-        finally:
-            conn.close()
+        if self.api is not None:
+            return self.mostrar_clientes_api(busqueda)
+        if not busqueda:
+            return self.cargar_todos_clientes()
+        
+        # La expresión FTS5 (con las alternativas por errores de dedo) y el ranking
+        # de las coincidencias se calculan una vez, fuera del hilo de Tk
+        self.consultas.ejecutar(lambda conn: buscar_pasajeros(conn, busqueda),
+                                self.mostrar_clientes_encontrados,
+                                "Error al buscar clientes", clave="busqueda_clientes")
+
+    def programar_busqueda_clientes(self, event=None):
+        """Busca mientras se escribe, cuando el usuario deja de teclear un momento"""
+        pendiente = getattr(self, 'busqueda_pendiente', None)
+        if pendiente is not None:
+            self.root.after_cancel(pendiente)
+        self.busqueda_pendiente = self.root.after(250, self.ejecutar_busqueda_programada)
+
+    def ejecutar_busqueda_programada(self):
+        self.busqueda_pendiente = None
+        if self.busqueda_cliente_entry.winfo_exists():
+            self.buscar_clientes()
+
+    def mostrar_clientes_encontrados(self, filas):
+        """Clientes que coinciden con la búsqueda, del más relevante al menos relevante"""
+        if filas is None:
+            return self.cargar_todos_clientes()
+        tabla = self.tabla_virtual(self.clientes_tree, self.formatear_cliente, segundo_plano=True,
+                                   mensaje_error="Error al cargar clientes")
+        tabla.cargar(CursorLista(lambda: filas))
+
+    def mostrar_clientes_api(self, busqueda):
+        """Clientes buscados por el servidor de ventas (más recientes primero si no hay texto)"""
+        tabla = self.tabla_virtual(self.clientes_tree, self.formatear_cliente, segundo_plano=True,
+                                   mensaje_error="Error al cargar clientes")
+        tabla.cargar(self.api.cursor_clientes(busqueda))
+
+    def formatear_cliente(self, row):
+        return (
+            row[0],  # id del pasajero
+            row[1],  # nombre
+            row[2],  # apellidos
+            row[3],  # boletos comprados
+            row[4],  # última compra
+            f"${row[5]:.2f}"  # total gastado
+        ), ()
+
+    def mostrar_clientes_filtrados(self, filtros, params):
+        """Clientes con sus totales, más recientes primero, cargando por páginas"""
+        tabla = self.tabla_virtual(self.clientes_tree, self.formatear_cliente, segundo_plano=True,
+                                   mensaje_error="Error al cargar clientes")
+        tabla.cargar(CursorKeyset(self.db, CONSULTA_CLIENTES + filtros, ("ultima_compra", "id"), params,
+                                  descendente=True))
 
     def mostrar_detalle_cliente(self):
         selected_item = self.clientes_tree.selection()
@@ -5077,6 +7636,7 @@ class SistemaERP:
             return
             
         item_data = self.clientes_tree.item(selected_item[0], 'values')
+        pasajero_id = item_data[0]
         nombre = item_data[1]
         apellidos = item_data[2]
         
@@ -5139,25 +7699,11 @@ class SistemaERP:
         boletos_tree.pack(fill=tk.BOTH, expand=True, pady=10)
         
         # Cargar los boletos del cliente
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         try:
             cursor = conn.cursor()
             
-            cursor.execute("""
-                SELECT 
-                    b.id,
-                    r.origen || ' a ' || r.destino as ruta,
-                    b.fecha_viaje,
-                    h.hora_salida || ' a ' || h.hora_llegada as horario,
-                    b.numero_asiento,
-                    b.precio,
-                    b.fecha_compra
-                FROM boletos b
-                JOIN horarios h ON b.horario_id = h.id
-                JOIN rutas r ON h.ruta_id = r.id
-                WHERE b.nombre_pasajero = ? AND b.apellidos_pasajero = ?
-                ORDER BY b.fecha_compra DESC
-            """, (nombre, apellidos))
+            cursor.execute(CONSULTA_BOLETOS_CLIENTE, (pasajero_id,))
             
             for row in cursor.fetchall():
                 boletos_tree.insert("", tk.END, values=(
@@ -5178,8 +7724,7 @@ class SistemaERP:
 # =================== MÓDULO DE LOGÍSTICA ==============================
     def mostrar_modulo_logistica(self):
         # Limpiar ventana
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        self.limpiar_ventana()
         
         # Configurar fondo general
         self.root.configure(bg='#e6ecf0')
@@ -5303,7 +7848,7 @@ class SistemaERP:
         if not messagebox.askyesno("Confirmar", "¿Está seguro de eliminar esta ruta?\nEsta acción no se puede deshacer."):
             return
 
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         try:
             cursor = conn.cursor()
         
@@ -5315,6 +7860,7 @@ class SistemaERP:
         
             # Eliminar la ruta
             cursor.execute("DELETE FROM rutas WHERE id = ?", (ruta_id,))
+            incrementar_version(cursor, "rutas")
             conn.commit()
             messagebox.showinfo("Éxito", "Ruta eliminada correctamente")
             self.cargar_rutas(self.tree_rutas)
@@ -5499,13 +8045,14 @@ class SistemaERP:
             messagebox.showerror("Error", "Distancia y precio deben ser números válidos mayores a 0")
             return
 
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         try:
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT INTO rutas (origen, destino, distancia, tiempo_estimado, precio_boleto)
                 VALUES (?, ?, ?, ?, ?)
             """, (origen.strip(), destino.strip(), distancia_float, tiempo.strip(), precio_float))
+            incrementar_version(cursor, "rutas")
         
             conn.commit()
             messagebox.showinfo("Éxito", "Ruta agregada correctamente")
@@ -5523,7 +8070,7 @@ class SistemaERP:
             tree.delete(item)
 
         # Cargar rutas de la base de datos
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         cursor = conn.cursor()
         try:
             cursor.execute("""
@@ -5623,7 +8170,7 @@ class SistemaERP:
                                 "Esta acción también eliminará todos los boletos asociados."):
             return
 
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         try:
             cursor = conn.cursor()
         
@@ -5638,11 +8185,15 @@ class SistemaERP:
                                         "¿Desea continuar con la eliminación?"):
                     return
         
-            # Eliminar en cascada (primero boletos, luego el horario)
+            # Eliminar en cascada (primero boletos y asientos apartados, luego el horario)
+            descontar_boletos_horario(cursor, horario_id)
+            descontar_ventas_horario(cursor, horario_id)
             cursor.execute("DELETE FROM boletos WHERE horario_id = ?", (horario_id,))
+            cursor.execute("DELETE FROM retenciones_asientos WHERE horario_id = ?", (horario_id,))
             cursor.execute("DELETE FROM horarios WHERE id = ?", (horario_id,))
         
             conn.commit()
+            self.asientos.invalidar(horario_id)
             messagebox.showinfo("Éxito", "Horario eliminado correctamente")
             self.cargar_horarios(self.tree_horarios)
         
@@ -5846,7 +8397,7 @@ class SistemaERP:
         ruta_combobox.focus_set()
 
     def cargar_rutas_autobuses_combobox(self, ruta_combobox, autobus_combobox):
-        conn = sqlite3.connect('erp_autobuses.db')
+        conn = self.db.conectar()
         cursor = conn.cursor()
 
         try:
@@ -5885,78 +8436,43 @@ class SistemaERP:
             conn.close()
 
     def guardar_horario(self, ruta, autobus, hora_salida, hora_llegada, dias, popup):
-        # Validación mejorada
-        if not all([ruta, autobus, hora_salida, hora_llegada, dias]):
-            messagebox.showwarning("Advertencia", "Todos los campos son obligatorios")
-            return
-
-        # Validar formato de horas (HH:MM)
-        if not (re.match(r'^[0-2][0-9]:[0-5][0-9]$', hora_salida) and 
-                re.match(r'^[0-2][0-9]:[0-5][0-9]$', hora_llegada)):
-            messagebox.showerror("Error", "Formato de hora debe ser HH:MM (24 horas)")
-            return
-
+        # Validación y alta en el servicio de logística
         try:
-            ruta_id = int(ruta.split("-")[0].strip())
-            autobus_id = int(autobus.split("-")[0].strip())
-        except (ValueError, AttributeError):
-            messagebox.showerror("Error", "Selección de ruta o autobús no válida")
+            ruta_id = (ruta or "").split("-")[0].strip()
+            autobus_id = (autobus or "").split("-")[0].strip()
+            self.logistica.guardar_horario(ruta_id, autobus_id, hora_salida, hora_llegada, dias)
+        except DatosInvalidos as e:
+            messagebox.showwarning("Advertencia", str(e))
             return
-
-        conn = sqlite3.connect('erp_autobuses.db')
-        try:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO horarios (ruta_id, autobus_id, hora_salida, hora_llegada, dias_semana)
-                VALUES (?, ?, ?, ?, ?)
-            """, (ruta_id, autobus_id, hora_salida, hora_llegada, dias))
-        
-            conn.commit()
-            messagebox.showinfo("Éxito", "Horario agregado correctamente")
-            popup.destroy()
-            self.cargar_horarios(self.tree_horarios)  # Actualizar la lista
         except Exception as e:
             messagebox.showerror("Error", f"Error al guardar horario: {str(e)}")
-            conn.rollback()
-        finally:
-            conn.close()
+            return
+        
+        messagebox.showinfo("Éxito", "Horario agregado correctamente")
+        popup.destroy()
+        self.cargar_horarios(self.tree_horarios)  # Actualizar la lista
 
     def cargar_horarios(self, tree):
-        # Limpiar treeview
-        for item in tree.get_children():
-            tree.delete(item)
-
-        # Cargar horarios de la base de datos
-        conn = sqlite3.connect('erp_autobuses.db')
-        cursor = conn.cursor()
-        try:
-            cursor.execute("""
-                SELECT h.id, 
-                    r.origen || ' - ' || r.destino as ruta,
-                    a.marca || ' ' || a.modelo as autobus,
-                    h.hora_salida,
-                    h.hora_llegada,
-                    h.dias_semana
-                FROM horarios h
-                JOIN rutas r ON h.ruta_id = r.id
-                JOIN autobuses a ON h.autobus_id = a.id
-                ORDER BY h.hora_salida
-            """)
-        
-            for row in cursor.fetchall():
-                tree.insert("", tk.END, values=row)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al cargar horarios: {str(e)}")
-        finally:
-            conn.close()
+        # Cargar horarios de la base de datos por páginas
+        query = """
+            SELECT h.id, 
+                r.origen || ' - ' || r.destino as ruta,
+                a.marca || ' ' || a.modelo as autobus,
+                h.hora_salida,
+                h.hora_llegada,
+                h.dias_semana
+            FROM horarios h
+            JOIN rutas r ON h.ruta_id = r.id
+            JOIN autobuses a ON h.autobus_id = a.id
+        """
+        tabla = self.tabla_virtual(tree, clave_item=lambda row: row[0], mensaje_error="Error al cargar horarios")
+        tabla.cargar(CursorKeyset(self.db, query, ("hora_salida", "id")))
 
 
 # =================== MÓDULO DE REPORTES GENERALES =====================
     def mostrar_reportes_generales(self):
         # Limpiar ventana
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        self.limpiar_ventana()
 
         # Configurar fondo general
         self.root.configure(bg='#e6ecf0')
@@ -6048,8 +8564,7 @@ class SistemaERP:
 
     def generar_reporte_general(self):
         # Limpiar frame de resultados
-        for widget in self.resultado_reporte_frame.winfo_children():
-            widget.destroy()
+        self.graficos.limpiar(self.resultado_reporte_frame)
 
         tipo_reporte = self.tipo_reporte.get()
 
@@ -6065,10 +8580,8 @@ class SistemaERP:
             self.generar_reporte_gastos_totales()
 
     def generar_reporte_empleados_departamento(self):
-        conn = sqlite3.connect('erp_autobuses.db')
-        cursor = conn.cursor()
-
-        try:
+        def consultar(conn):
+            cursor = conn.cursor()
             # Obtener empleados por departamento
             cursor.execute("""
                 SELECT 
@@ -6084,8 +8597,14 @@ class SistemaERP:
                 GROUP BY departamento
                 ORDER BY cantidad DESC
             """)
-        
-            resultados = cursor.fetchall()
+            return cursor.fetchall()
+
+        self.consultas.ejecutar(consultar,
+                                lambda resultados: self.mostrar_reporte_empleados_departamento(resultados),
+                                "Error al generar reporte", clave="reporte")
+
+    def mostrar_reporte_empleados_departamento(self, resultados):
+        try:
         
             if not resultados:
                 tk.Label(self.resultado_reporte_frame, 
@@ -6129,58 +8648,62 @@ class SistemaERP:
         
             tree.pack(fill=tk.BOTH, expand=True)
         
-            # Crear gráfico
-            figure = plt.Figure(figsize=(6, 4), dpi=100)
-            ax = figure.add_subplot(111)
-            figure.patch.set_facecolor('#FFFFFF')
-            ax.set_facecolor('#FFFFFF')
-        
             departamentos = [row[0] for row in resultados]
             cantidades = [row[1] for row in resultados]
         
-            bars = ax.bar(departamentos, cantidades, color='#003366')
-            ax.set_title('Empleados Por Departamento', color='#003366')
-            ax.set_ylabel('Cantidad de Empleados', color='#333333')
-            ax.tick_params(colors='#333333')
-            plt.setp(ax.get_xticklabels(), rotation=0)
-            
-            # Ajustar el espacio superior para las etiquetas
-            max_value = max(cantidades)
-            ax.set_ylim(0, max_value * 1.15)  # Añade 15% más espacio arriba
+            # Crear gráfico (la figura se reutiliza entre ejecuciones)
+            grafico = self.graficos.espacio("empleados_departamento", self.resultado_reporte_frame)
             
-            # Agregar valores en las barras con mejor formato
-            for bar in bars:
-                height = bar.get_height()
-                ax.text(bar.get_x() + bar.get_width()/2., height,
-                        f'{height}',
-                        ha='center', va='bottom',
-                        color='#333333', fontweight='bold')
-        
-            canvas = FigureCanvasTkAgg(figure, self.resultado_reporte_frame)
-            canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, pady=10)
-        
+            def dibujar(ax):
+                ax.set_facecolor('#FFFFFF')
+                bars = ax.bar(departamentos, cantidades, color='#003366')
+                ax.set_title('Empleados Por Departamento', color='#003366')
+                ax.set_ylabel('Cantidad de Empleados', color='#333333')
+                ax.tick_params(colors='#333333')
+                ax.tick_params(axis='x', labelrotation=0)
+                
+                # Ajustar el espacio superior para las etiquetas
+                max_value = max(cantidades)
+                ax.set_ylim(0, max_value * 1.15)  # Añade 15% más espacio arriba
+                
+                # Agregar valores en las barras con mejor formato
+                etiquetas = []
+                for bar in bars:
+                    height = bar.get_height()
+                    etiquetas.append(ax.text(bar.get_x() + bar.get_width()/2., height,
+                            f'{height}',
+                            ha='center', va='bottom',
+                            color='#333333', fontweight='bold'))
+                return {'barras': bars, 'etiquetas': etiquetas}
+        
+            grafico.graficar(departamentos, dibujar, lambda ax, artistas: actualizar_valores(
+                ax, artistas, cantidades, "{}", limites_y=lambda valores: (0, max(valores) * 1.15)))
+            grafico.mostrar(fill=tk.BOTH, expand=True, pady=10)
         except Exception as e:
             messagebox.showerror("Error", f"Error al generar reporte: {str(e)}")
-        finally:
-            conn.close()
 
     def generar_reporte_ventas_totales(self):
-        conn = sqlite3.connect('erp_autobuses.db')
-        cursor = conn.cursor()
-
-        try:
+        def consultar(conn):
+            cursor = conn.cursor()
             # Obtener ventas totales por mes
             cursor.execute("""
                 SELECT 
-                    strftime('%Y-%m', fecha_compra) as mes,
-                    COUNT(*) as boletos,
-                    SUM(precio) as total
-                FROM boletos
+                    substr(dia, 1, 7) as mes,
+                    SUM(boletos) as boletos,
+                    SUM(total) as total
+                FROM ventas_diarias_ruta
                 GROUP BY mes
                 ORDER BY mes
             """)
-        
-            resultados = cursor.fetchall()
+            return cursor.fetchall()
+
+        self.consultas.ejecutar(lambda conn: self.cache_reportes.consultar(
+                                    conn, "ventas_totales", (), ("ventas_diarias_ruta",), consultar),
+                                lambda resultados: self.mostrar_reporte_ventas_totales(resultados),
+                                "Error al generar reporte", clave="reporte")
+
+    def mostrar_reporte_ventas_totales(self, resultados):
+        try:
         
             if not resultados:
                 tk.Label(self.resultado_reporte_frame, 
@@ -6224,61 +8747,66 @@ class SistemaERP:
         
             tree.pack(fill=tk.BOTH, expand=True)
         
-            # Crear gráfico de líneas
-            figure = plt.Figure(figsize=(6, 4), dpi=100)
-            ax = figure.add_subplot(111)
-            figure.patch.set_facecolor('#FFFFFF')
-            ax.set_facecolor('#FFFFFF')
-        
             meses = [row[0] for row in resultados]
             totales = [row[2] for row in resultados]
         
-            line = ax.plot(meses, totales, 'o-', color='#003366', linewidth=2, markersize=8)
-            ax.set_title('Ventas Totales por Mes', color='#003366')
-            ax.set_ylabel('Ventas ($)', color='#333333')
-            ax.set_xlabel('Mes', color='#333333')
-            ax.tick_params(colors='#333333')
-            plt.setp(ax.get_xticklabels(), rotation=0)
-            
-            # Ajustar los límites del eje Y para mejor visualización
-            max_value = max(totales)
-            min_value = min(totales)
-            ax.set_ylim(min_value * 0.9, max_value * 1.15)  # Margen del 10% abajo y 15% arriba
-            
-            # Agregar etiquetas con valores mejoradas
-            for i, (mes, v) in enumerate(zip(meses, totales)):
-                ax.text(i, v + (max_value * 0.05),  # 5% del valor máximo como offset
-                    f"${v:,.0f}",
-                    ha='center', 
-                    va='bottom',
-                    color='#003366',
-                    fontweight='bold',
-                    bbox=dict(facecolor='white', edgecolor='#003366', boxstyle='round,pad=0.2'))
-        
-            canvas = FigureCanvasTkAgg(figure, self.resultado_reporte_frame)
-            canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, pady=10)
+            # Crear gráfico de líneas (la figura se reutiliza entre ejecuciones)
+            grafico = self.graficos.espacio("ventas_totales", self.resultado_reporte_frame)
+            
+            def dibujar(ax):
+                ax.set_facecolor('#FFFFFF')
+                line, = ax.plot(meses, totales, 'o-', color='#003366', linewidth=2, markersize=8)
+                ax.set_title('Ventas Totales por Mes', color='#003366')
+                ax.set_ylabel('Ventas ($)', color='#333333')
+                ax.set_xlabel('Mes', color='#333333')
+                ax.tick_params(colors='#333333')
+                ax.tick_params(axis='x', labelrotation=0)
+                
+                # Ajustar los límites del eje Y para mejor visualización
+                max_value = max(totales)
+                min_value = min(totales)
+                ax.set_ylim(min_value * 0.9, max_value * 1.15)  # Margen del 10% abajo y 15% arriba
+                
+                # Agregar etiquetas con valores mejoradas
+                etiquetas = []
+                for i, (mes, v) in enumerate(zip(meses, totales)):
+                    etiquetas.append(ax.text(i, v + (max_value * 0.05),  # 5% del valor máximo como offset
+                        f"${v:,.0f}",
+                        ha='center', 
+                        va='bottom',
+                        color='#003366',
+                        fontweight='bold',
+                        bbox=dict(facecolor='white', edgecolor='#003366', boxstyle='round,pad=0.2')))
+                return {'linea': line, 'etiquetas': etiquetas}
         
+            grafico.graficar(meses, dibujar, lambda ax, artistas: actualizar_valores(
+                ax, artistas, totales, "${:,.0f}", desfase=0.05,
+                limites_y=lambda valores: (min(valores) * 0.9, max(valores) * 1.15)))
+            grafico.mostrar(fill=tk.BOTH, expand=True, pady=10)
         except Exception as e:
             messagebox.showerror("Error", f"Error al generar reporte: {str(e)}")
-        finally:
-            conn.close()
 
     def generar_reporte_gastos_totales(self):
-        conn = sqlite3.connect('erp_autobuses.db')
-        cursor = conn.cursor()
-
-        try:
+        def consultar(conn):
+            cursor = conn.cursor()
             # Obtener gastos totales por mes
             cursor.execute("""
                 SELECT 
-                    strftime('%Y-%m', fecha) as mes,
-                    SUM(egreso) as total
-                FROM finanzas
+                    substr(dia, 1, 7) as mes,
+                    SUM(egresos) as total
+                FROM movimientos_diarios
                 GROUP BY mes
                 ORDER BY mes
             """)
-        
-            resultados = cursor.fetchall()
+            return cursor.fetchall()
+
+        self.consultas.ejecutar(lambda conn: self.cache_reportes.consultar(
+                                    conn, "gastos_totales", (), ("movimientos_diarios",), consultar),
+                                lambda resultados: self.mostrar_reporte_gastos_totales(resultados),
+                                "Error al generar reporte", clave="reporte")
+
+    def mostrar_reporte_gastos_totales(self, resultados):
+        try:
         
             if not resultados:
                 tk.Label(self.resultado_reporte_frame, 
@@ -6320,45 +8848,220 @@ class SistemaERP:
         
             tree.pack(fill=tk.BOTH, expand=True)
         
-            # Crear gráfico de barras
-            figure = plt.Figure(figsize=(6, 4), dpi=100)
-            ax = figure.add_subplot(111)
-            figure.patch.set_facecolor('#FFFFFF')
-            ax.set_facecolor('#FFFFFF')
-        
             meses = [row[0] for row in resultados]
             totales = [row[1] for row in resultados]
         
-            bars = ax.bar(meses, totales, color='#990000')
-            ax.set_title('Gastos Totales por Mes', color='#003366')
-            ax.set_ylabel('Gastos ($)', color='#333333')
-            ax.set_xlabel('Mes', color='#333333')
-            ax.tick_params(colors='#333333')
-            plt.setp(ax.get_xticklabels(), rotation=0)
-            
-            # Ajustar el espacio superior para las etiquetas
-            max_value = max(totales)
-            ax.set_ylim(0, max_value * 1.15)  # Añade 15% más espacio arriba
-            
-            # Agregar etiquetas con valores
-            for bar in bars:
-                height = bar.get_height()
-                ax.text(bar.get_x() + bar.get_width()/2., height,
-                        f'${height:,.0f}',
-                        ha='center', va='bottom', color='#333333')
-        
-            canvas = FigureCanvasTkAgg(figure, self.resultado_reporte_frame)
-            canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, pady=10)
-        
+            # Crear gráfico de barras (la figura se reutiliza entre ejecuciones)
+            grafico = self.graficos.espacio("gastos_totales", self.resultado_reporte_frame)
+            
+            def dibujar(ax):
+                ax.set_facecolor('#FFFFFF')
+                bars = ax.bar(meses, totales, color='#990000')
+                ax.set_title('Gastos Totales por Mes', color='#003366')
+                ax.set_ylabel('Gastos ($)', color='#333333')
+                ax.set_xlabel('Mes', color='#333333')
+                ax.tick_params(colors='#333333')
+                ax.tick_params(axis='x', labelrotation=0)
+                
+                # Ajustar el espacio superior para las etiquetas
+                max_value = max(totales)
+                ax.set_ylim(0, max_value * 1.15)  # Añade 15% más espacio arriba
+                
+                # Agregar etiquetas con valores
+                etiquetas = []
+                for bar in bars:
+                    height = bar.get_height()
+                    etiquetas.append(ax.text(bar.get_x() + bar.get_width()/2., height,
+                            f'${height:,.0f}',
+                            ha='center', va='bottom', color='#333333'))
+                return {'barras': bars, 'etiquetas': etiquetas}
+        
+            grafico.graficar(meses, dibujar, lambda ax, artistas: actualizar_valores(
+                ax, artistas, totales, "${:,.0f}", limites_y=lambda valores: (0, max(valores) * 1.15)))
+            grafico.mostrar(fill=tk.BOTH, expand=True, pady=10)
         except Exception as e:
             messagebox.showerror("Error", f"Error al generar reporte: {str(e)}")
-        finally:
-            conn.close()
+
+# =================== MÓDULO DE CONSULTAS SQL ==========================
+    def mostrar_consultas_sql(self):
+        """Pantalla del administrador con las latencias por sentencia y el registro de lentas"""
+        self.limpiar_ventana()
+        self.root.configure(bg='#e6ecf0')
+        
+        main_frame = tk.Frame(self.root, bg='#e6ecf0')
+        main_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+
+        # Barra superior
+        top_frame = tk.Frame(main_frame, bg='white', bd=2, relief='ridge')
+        top_frame.pack(fill=tk.X, padx=10, pady=5)
+        tk.Button(top_frame, 
+                 text="Volver al Menú", 
+                 command=self.mostrar_menu_principal,
+                 bg='#003366', 
+                 fg='white',
+                 font=('Arial', 10, 'bold'),
+                 relief='flat', 
+                 activebackground='#002244',
+                 activeforeground='white',
+                 cursor='hand2').pack(side=tk.RIGHT, padx=10, pady=5)
+        tk.Label(top_frame, 
+                text="Consultas SQL", 
+                font=("Arial", 16, "bold"), 
+                fg='#003366', 
+                bg='white').pack(side=tk.LEFT, padx=10)
+
+        content_frame = tk.Frame(main_frame, bg='white', bd=2, relief='ridge')
+        content_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        if self.estadisticas_sql is None:
+            tk.Label(content_frame,
+                    text="La medición de consultas está desactivada (se activa con ERP_INSTRUMENTAR_SQL=1)",
+                    font=('Arial', 12),
+                    bg='white').pack(pady=40)
+            return
+
+        # Controles: umbral del registro de lentas, actualizar, reiniciar y exportar
+        options_frame = tk.Frame(content_frame, bg='white')
+        options_frame.pack(fill=tk.X, pady=10, padx=10)
+        tk.Label(options_frame, text="Lenta desde (ms):", font=('Arial', 11), bg='white').pack(side=tk.LEFT, padx=5)
+        self.umbral_sql_entry = tk.Entry(options_frame, width=8, font=('Arial', 11), bd=1, relief='solid')
+        self.umbral_sql_entry.insert(0, f"{self.estadisticas_sql.umbral_lenta_ms:g}")
+        self.umbral_sql_entry.pack(side=tk.LEFT, padx=5)
+        estilo_boton = dict(bg='#003366', fg='white', font=('Arial', 10, 'bold'), relief='flat',
+                            activebackground='#002244', activeforeground='white', cursor='hand2')
+        for texto, comando in (("Aplicar", self.aplicar_umbral_sql),
+                               ("Actualizar", self.actualizar_consultas_sql),
+                               ("Reiniciar", self.reiniciar_consultas_sql),
+                               ("Exportar JSON", self.exportar_consultas_sql)):
+            tk.Button(options_frame, text=texto, command=comando, **estilo_boton).pack(side=tk.LEFT, padx=5)
+
+        # Formas de sentencia, de la que más tiempo acumula a la que menos
+        tk.Label(content_frame, text="Sentencias por forma", font=('Arial', 12, 'bold'),
+                fg='#003366', bg='white').pack(anchor='w', padx=10)
+        columnas = ("Forma", "Llamadas", "Filas", "Total ms", "Prom. ms", "p50 ms", "p95 ms", "Máx. ms", "Origen")
+        anchos = (380, 70, 70, 80, 70, 60, 60, 70, 200)
+        formas_frame = tk.Frame(content_frame, bg='white')
+        formas_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        self.tree_formas_sql = ttk.Treeview(formas_frame, columns=columnas, show="headings", height=8)
+        for columna, ancho in zip(columnas, anchos):
+            self.tree_formas_sql.heading(columna, text=columna)
+            self.tree_formas_sql.column(columna, width=ancho, anchor=tk.W if columna in ("Forma", "Origen") else tk.E)
+        scroll = ttk.Scrollbar(formas_frame, orient=tk.VERTICAL, command=self.tree_formas_sql.yview)
+        self.tree_formas_sql.configure(yscrollcommand=scroll.set)
+        self.tree_formas_sql.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree_formas_sql.bind("<<TreeviewSelect>>", self.mostrar_detalle_forma_sql)
+
+        # Registro de sentencias lentas, la más reciente primero
+        tk.Label(content_frame, text="Sentencias lentas", font=('Arial', 12, 'bold'),
+                fg='#003366', bg='white').pack(anchor='w', padx=10)
+        columnas = ("Fecha", "ms", "Filas", "Origen", "Sentencia")
+        anchos = (140, 80, 70, 200, 560)
+        lentas_frame = tk.Frame(content_frame, bg='white')
+        lentas_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        self.tree_lentas_sql = ttk.Treeview(lentas_frame, columns=columnas, show="headings", height=6)
+        for columna, ancho in zip(columnas, anchos):
+            self.tree_lentas_sql.heading(columna, text=columna)
+            self.tree_lentas_sql.column(columna, width=ancho, anchor=tk.E if columna in ("ms", "Filas") else tk.W)
+        scroll = ttk.Scrollbar(lentas_frame, orient=tk.VERTICAL, command=self.tree_lentas_sql.yview)
+        self.tree_lentas_sql.configure(yscrollcommand=scroll.set)
+        self.tree_lentas_sql.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree_lentas_sql.bind("<<TreeviewSelect>>", self.mostrar_detalle_lenta_sql)
+
+        # Detalle de la fila seleccionada: SQL completo, histograma u EXPLAIN QUERY PLAN
+        self.detalle_sql = tk.Text(content_frame, height=9, font=('Courier', 10), bd=1, relief='solid')
+        self.detalle_sql.pack(fill=tk.X, padx=10, pady=(5, 10))
+
+        self.actualizar_consultas_sql()
+
+    def actualizar_consultas_sql(self):
+        self.formas_sql = {}
+        filas = []
+        for n, forma in enumerate(self.estadisticas_sql.resumen()):
+            iid = f"f{n}"
+            self.formas_sql[iid] = forma
+            origen = next(iter(forma['origenes']), "")
+            filas.append((iid, (forma['forma'], forma['llamadas'], forma['filas'],
+                                f"{forma['total_ms']:,.1f}", f"{forma['promedio_ms']:.2f}",
+                                f"{forma['p50_ms']:.2f}", f"{forma['p95_ms']:.2f}",
+                                f"{forma['max_ms']:.1f}", origen), ()))
+        # Las posiciones cambian con cada resumen: se vuelve a llenar la tabla completa
+        self.tree_formas_sql.filas_mostradas = None
+        actualizar_filas(self.tree_formas_sql, filas)
+
+        self.lentas_sql = {}
+        filas = []
+        for n, lenta in enumerate(reversed(self.estadisticas_sql.volcado()['lentas'])):
+            iid = f"l{n}"
+            self.lentas_sql[iid] = lenta
+            filas.append((iid, (lenta['fecha'], f"{lenta['ms']:,.1f}", lenta['filas'], lenta['origen'],
+                                " ".join(lenta['sentencia'].split())), ()))
+        self.tree_lentas_sql.filas_mostradas = None
+        actualizar_filas(self.tree_lentas_sql, filas)
+
+    def _mostrar_detalle_sql(self, texto):
+        self.detalle_sql.delete("1.0", tk.END)
+        self.detalle_sql.insert("1.0", texto)
+
+    def mostrar_detalle_forma_sql(self, event=None):
+        seleccion = self.tree_formas_sql.selection()
+        if not seleccion:
+            return
+        forma = self.formas_sql[seleccion[0]]
+        limites = [f"≤{limite:g} ms" for limite in LIMITES_HISTOGRAMA_MS] + [f">{LIMITES_HISTOGRAMA_MS[-1]:g} ms"]
+        histograma = "  ".join(f"{limite}: {cuenta}"
+                               for limite, cuenta in zip(limites, forma['histograma']) if cuenta)
+        origenes = "\n".join(f"  {cuenta:>8}  {origen}" for origen, cuenta in forma['origenes'].items())
+        self._mostrar_detalle_sql(f"{forma['forma']}\n\nHistograma: {histograma}\n\nLlamada desde:\n{origenes}")
+
+    def mostrar_detalle_lenta_sql(self, event=None):
+        seleccion = self.tree_lentas_sql.selection()
+        if not seleccion:
+            return
+        lenta = self.lentas_sql[seleccion[0]]
+        plan = "\n".join(f"  {linea}" for linea in lenta['plan']) or "  (sin plan)"
+        self._mostrar_detalle_sql(f"{lenta['sentencia']}\n\n{lenta['ms']:,.1f} ms, {lenta['filas']} filas, "
+                                  f"desde {lenta['origen']}\n\nEXPLAIN QUERY PLAN:\n{plan}")
+
+    def aplicar_umbral_sql(self):
+        try:
+            umbral = float(self.umbral_sql_entry.get())
+            if umbral < 0:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Error", "El umbral debe ser un número de milisegundos mayor o igual a 0")
+            return
+        self.estadisticas_sql.umbral_lenta_ms = umbral
+        messagebox.showinfo("Éxito", f"Se registrarán las sentencias de {umbral:g} ms o más")
+
+    def reiniciar_consultas_sql(self):
+        if not messagebox.askyesno("Confirmar", "¿Borrar todas las mediciones de consultas SQL?"):
+            return
+        self.estadisticas_sql.reiniciar()
+        self._mostrar_detalle_sql("")
+        self.actualizar_consultas_sql()
+
+    def exportar_consultas_sql(self):
+        ruta = VOLCADO_SQL or ARCHIVO_ESTADISTICAS_SQL
+        try:
+            self.estadisticas_sql.volcar(ruta)
+        except OSError as e:
+            messagebox.showerror("Error", f"No se pudo guardar el archivo: {str(e)}")
+            return
+        messagebox.showinfo("Éxito", f"Estadísticas guardadas en {os.path.abspath(ruta)}")
+
 # =================== FUNCIÓN PRINCIPAL ================================
 def main():
     root = tk.Tk()
     app = SistemaERP(root)
     root.mainloop()
+    app.consultas.detener()
+    app.retenciones.detener()
+    app.libro.detener()
+    app.db.cerrar_todas()
+    if VOLCADO_SQL and app.estadisticas_sql is not None:
+        app.estadisticas_sql.volcar(VOLCADO_SQL)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
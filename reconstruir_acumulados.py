@@ -0,0 +1,48 @@
+# Verificación y reconstrucción de los acumulados diarios de los reportes
+# Compara ventas_diarias_ruta, movimientos_diarios y compras_diarias_categoria
+# (mantenidos por reservar_asientos, registrar_movimiento y registrar_compra)
+# con el recálculo desde boletos, finanzas y compras. Con --reparar reemplaza
+# las tablas por el recálculo (backfill).
+# Termina con código 1 si encontró diferencias y no se pidió reparar.
+#
+# Uso:
+#   python reconstruir_acumulados.py [--bd erp_autobuses.db] [--reparar]
+
+import argparse
+import sys
+
+from prueba import (ACUMULADOS_REPORTES, DB_PATH, GestorConexiones, incrementar_version, migrar_esquema,
+                    reconstruir_acumulados, verificar_acumulados)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica los acumulados de reportes contra el historial")
+    parser.add_argument('--bd', default=DB_PATH, help="Ruta de la base de datos")
+    parser.add_argument('--reparar', action='store_true',
+                        help="Reconstruir las tablas de acumulados desde el historial")
+    args = parser.parse_args()
+
+    db = GestorConexiones(args.bd)
+    conn = db.obtener()
+    migrar_esquema(conn)
+
+    diferencias = verificar_acumulados(conn)
+    for tabla, llave, guardado, recalculado in diferencias:
+        print(f"[FALLA] {tabla} {llave}: acumulado={guardado} historial={recalculado}")
+    if not diferencias:
+        print("Acumulados correctos: coinciden con el historial")
+
+    if args.reparar:
+        with db.transaccion(inmediata=True) as conn:
+            cursor = conn.cursor()
+            reconstruir_acumulados(cursor)
+            # Los reportes en caché de las terminales abiertas dejan de ser válidos
+            for tabla, _, _ in ACUMULADOS_REPORTES:
+                incrementar_version(cursor, tabla)
+        print("Acumulados reconstruidos")
+    db.cerrar_todas()
+    sys.exit(1 if diferencias and not args.reparar else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# Verificación y reconstrucción de las existencias de inventario
+# Compara la tabla existencias (mantenida por registrar_compra y
+# registrar_salida_inventario) con el recálculo desde el historial completo de
+# compras y salidas_inventario. Con --reparar reemplaza la tabla por el recálculo.
+# Termina con código 1 si encontró diferencias y no se pidió reparar.
+#
+# Uso:
+#   python reconstruir_existencias.py [--bd erp_autobuses.db] [--reparar]
+
+import argparse
+import sys
+
+from prueba import DB_PATH, GestorConexiones, migrar_esquema, reconstruir_existencias, verificar_existencias
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica las existencias contra el historial de compras y salidas")
+    parser.add_argument('--bd', default=DB_PATH, help="Ruta de la base de datos")
+    parser.add_argument('--reparar', action='store_true',
+                        help="Reconstruir la tabla existencias desde el historial")
+    args = parser.parse_args()
+
+    db = GestorConexiones(args.bd)
+    conn = db.obtener()
+    migrar_esquema(conn)
+
+    diferencias = verificar_existencias(conn)
+    for tipo, descripcion, materializado, recalculado in diferencias:
+        print(f"[FALLA] {tipo} - {descripcion}: existencias={materializado} historial={recalculado}")
+    if not diferencias:
+        print("Existencias correctas: coinciden con el historial")
+
+    if args.reparar:
+        with db.transaccion(inmediata=True) as conn:
+            productos = reconstruir_existencias(conn.cursor())
+        print(f"Existencias reconstruidas: {productos} productos")
+    db.cerrar_todas()
+    sys.exit(1 if diferencias and not args.reparar else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# Verificación y reconstrucción de los totales por pasajero
+# Compara boletos_comprados, ultima_compra y total_gastado de la tabla pasajeros
+# (mantenidos por reservar_asientos y descontar_boletos_horario) con el recálculo
+# desde boletos. Con --reparar vuelve a ligar cada boleto con su pasajero,
+# recalcula los totales y regenera el índice de búsqueda.
+# Termina con código 1 si encontró diferencias y no se pidió reparar.
+#
+# Uso:
+#   python reconstruir_pasajeros.py [--bd erp_autobuses.db] [--reparar]
+
+import argparse
+import sys
+
+from prueba import (DB_PATH, GestorConexiones, migrar_esquema, reconstruir_pasajeros,
+                    reconstruir_totales_pasajeros, verificar_totales_pasajeros)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica los totales de cada pasajero contra sus boletos")
+    parser.add_argument('--bd', default=DB_PATH, help="Ruta de la base de datos")
+    parser.add_argument('--reparar', action='store_true',
+                        help="Recalcular los totales y el índice de búsqueda desde boletos")
+    args = parser.parse_args()
+
+    db = GestorConexiones(args.bd)
+    conn = db.obtener()
+    migrar_esquema(conn)
+
+    diferencias = verificar_totales_pasajeros(conn)
+    for pasajero_id, guardado, recalculado in diferencias:
+        print(f"[FALLA] pasajero {pasajero_id}: guardado={guardado} boletos={recalculado}")
+    if not diferencias:
+        print("Totales correctos: coinciden con los boletos")
+
+    if args.reparar:
+        with db.transaccion(inmediata=True) as conn:
+            cursor = conn.cursor()
+            reconstruir_pasajeros(cursor)
+            reconstruir_totales_pasajeros(cursor)
+        print("Totales de pasajeros reconstruidos")
+    db.cerrar_todas()
+    sys.exit(1 if diferencias and not args.reparar else 0)
+
+
+if __name__ == "__main__":
+    main()
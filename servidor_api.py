@@ -0,0 +1,369 @@
+# Servidor HTTP/JSON local para vender boletos desde varias taquillas
+# Un solo proceso es dueño de erp_autobuses.db: las taquillas (prueba.py con
+# ERP_API_URL=http://host:puerto) consultan asientos y venden a través de él,
+# así que ya no compiten por el bloqueo del archivo.
+# - Las consultas a SQLite corren en un grupo fijo de hilos (--trabajadores).
+# - Las ventas y sus movimientos de finanzas los escribe un solo EscritorLibro.
+# - Las consultas de disponibilidad que llegan juntas (--ventana-ms) se
+#   resuelven con una sola lectura de la base (MotorAsientos.cargar_varios).
+#
+# Rutas:
+#   GET  /asientos?horario_id=1&fecha_viaje=2025-01-31  -> capacidad y asientos libres
+#   POST /asientos/invalidar {[horario_id], [fecha_viaje]} -> descarta mapas tras editar horarios
+#   GET  /precio?horario_id=1                             -> precio del boleto del horario
+#   GET  /retenciones?horario_id=1&fecha_viaje=...&terminal=t -> asientos apartados por otras taquillas
+#   POST /retenciones {horario_id, fecha_viaje, asientos, terminal} -> aparta; devuelve los ajenos
+#   DELETE /retenciones?terminal=t                        -> suelta lo apartado por una taquilla
+#   POST /boletos  {nombre, apellidos, horario_id, fecha_viaje, asientos, [terminal]}
+#                  (el precio sale de la ruta del horario y la fecha de compra la pone el servidor)
+#   GET  /clientes?q=texto&limite=50                      -> búsqueda de pasajeros
+#   GET  /saldo                                           -> saldo de la empresa
+#   GET  /sql                                             -> latencias por sentencia y lentas
+#                                                            (solo con --sql-lenta-ms)
+#
+# Uso:
+#   python servidor_api.py [--host 127.0.0.1] [--puerto 8765] [--bd erp_autobuses.db]
+#                          [--trabajadores 4] [--ventana-ms 2] [--perfil rendimiento]
+#                          [--sql-lenta-ms 50]
+
+import argparse
+import asyncio
+import json
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from prueba import (SistemaERP, GestorConexiones, EscritorLibro, MotorAsientos, RetencionesAsientos,
+                    VentasService, FinanzasService, DatosInvalidos, RegistroNoEncontrado,
+                    AsientosOcupados, SaldoInsuficiente, ExistenciaInsuficiente,
+                    CONSULTA_CLIENTES, CONSULTA_BUSQUEDA_PASAJEROS, DB_PATH, EstadisticasSQL,
+                    PERFILES_ALMACENAMIENTO, expresion_busqueda_pasajeros, perfil_almacenamiento, _entero)
+
+# Excepción -> estado HTTP; el cuerpo lleva {"error": mensaje, "tipo": nombre de la excepción}.
+# Cualquier otra excepción es un 500. VentasService solo lanza antes de confirmar
+# la venta, así que un error en POST /boletos significa que no se cobró nada.
+ESTADOS_ERROR = {
+    DatosInvalidos: 400,
+    RegistroNoEncontrado: 404,
+    AsientosOcupados: 409,
+    SaldoInsuficiente: 409,
+    ExistenciaInsuficiente: 409,
+}
+
+RAZONES = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+           500: "Internal Server Error"}
+
+TAMAÑO_MAXIMO_CUERPO = 64 * 1024
+
+
+def _viaje_y_terminal(datos):
+    """(horario_id, fecha_viaje, terminal) de una petición de retenciones"""
+    horario_id = _entero(datos.get('horario_id'), "Se requieren horario_id y fecha_viaje")
+    fecha_viaje, terminal = datos.get('fecha_viaje'), datos.get('terminal')
+    if not fecha_viaje or not terminal:
+        raise DatosInvalidos("Se requieren fecha_viaje y terminal")
+    return horario_id, fecha_viaje, terminal
+
+
+class ErrorHTTP(Exception):
+    def __init__(self, estado, mensaje):
+        self.estado = estado
+        super().__init__(mensaje)
+
+
+class LoteDisponibilidad:
+    """Agrupa las consultas de disponibilidad que llegan dentro de `ventana` segundos.
+
+    Las peticiones del mismo viaje comparten el resultado y todos los viajes
+    pendientes se leen con una sola llamada a MotorAsientos.cargar_varios en
+    un hilo del grupo de SQLite.
+    """
+
+    def __init__(self, asientos, ejecutar, ventana=0.002):
+        self.asientos = asientos
+        self.ejecutar = ejecutar
+        self.ventana = ventana
+        self.lotes = 0
+        self._pendientes = {}  # (horario_id, fecha_viaje) -> asyncio.Future
+
+    async def consultar(self, horario_id, fecha_viaje):
+        clave = (horario_id, fecha_viaje)
+        futuro = self._pendientes.get(clave)
+        if futuro is None:
+            loop = asyncio.get_running_loop()
+            if not self._pendientes:
+                loop.call_later(self.ventana, self._despachar)
+            futuro = self._pendientes[clave] = loop.create_future()
+        # shield: si un cliente se desconecta no se cancela la respuesta de los demás
+        mapa = await asyncio.shield(futuro)
+        if mapa is None:
+            raise RegistroNoEncontrado(f"No existe el horario {horario_id}")
+        return mapa
+
+    def _despachar(self):
+        pendientes, self._pendientes = self._pendientes, {}
+        self.lotes += 1
+        asyncio.ensure_future(self._resolver(pendientes))
+
+    async def _resolver(self, pendientes):
+        try:
+            mapas = await self.ejecutar(self.asientos.cargar_varios, list(pendientes))
+        except Exception as e:
+            for futuro in pendientes.values():
+                futuro.set_exception(e)
+            return
+        for clave, futuro in pendientes.items():
+            futuro.set_result(mapas.get(clave))
+
+
+class ServidorVentas:
+    """Atiende la API con las mismas clases de negocio que la aplicación de escritorio"""
+
+    def __init__(self, db, trabajadores=4, ventana_lote=0.002):
+        self.db = db
+        self.libro = EscritorLibro(db)
+        self.asientos = MotorAsientos(db)
+        self.retenciones = RetencionesAsientos(db)
+        self.ventas = VentasService(db, self.libro, self.asientos, self.retenciones)
+        self.finanzas = FinanzasService(db, self.libro)
+        self.grupo = ThreadPoolExecutor(max_workers=trabajadores, thread_name_prefix="sqlite")
+        self.disponibilidad = LoteDisponibilidad(self.asientos, self.ejecutar, ventana_lote)
+        self.rutas = {
+            ('GET', '/asientos'): self.consultar_asientos,
+            ('POST', '/asientos/invalidar'): self.invalidar_asientos,
+            ('GET', '/precio'): self.consultar_precio,
+            ('GET', '/retenciones'): self.consultar_retenciones,
+            ('POST', '/retenciones'): self.retener_asientos,
+            ('DELETE', '/retenciones'): self.soltar_retenciones,
+            ('POST', '/boletos'): self.vender_boletos,
+            ('GET', '/clientes'): self.buscar_clientes,
+            ('GET', '/saldo'): self.consultar_saldo,
+            ('GET', '/sql'): self.consultar_sql,
+        }
+
+    async def ejecutar(self, funcion, *args):
+        """Corre una operación de SQLite en el grupo de hilos sin bloquear el bucle"""
+        return await asyncio.get_running_loop().run_in_executor(self.grupo, funcion, *args)
+
+    def cerrar(self):
+        self.grupo.shutdown(wait=True)
+        self.retenciones.detener()
+        self.libro.detener()
+        self.db.cerrar_todas()
+
+    # ---- Rutas -------------------------------------------------------------
+    async def consultar_asientos(self, parametros, datos):
+        try:
+            horario_id = int(parametros['horario_id'])
+            fecha_viaje = parametros['fecha_viaje']
+        except (KeyError, ValueError):
+            raise DatosInvalidos("Se requieren horario_id y fecha_viaje") from None
+        mapa = await self.disponibilidad.consultar(horario_id, fecha_viaje)
+        return 200, {'horario_id': horario_id, 'fecha_viaje': fecha_viaje,
+                     'capacidad': mapa.capacidad, 'libres': mapa.libres(),
+                     'ocupacion': mapa.ocupacion()}
+
+    async def invalidar_asientos(self, parametros, datos):
+        datos = datos if isinstance(datos, dict) else {}
+        horario_id = datos.get('horario_id')
+        if horario_id is not None:
+            horario_id = _entero(horario_id, "horario_id debe ser un número entero")
+        self.asientos.invalidar(horario_id, datos.get('fecha_viaje'))
+        return 200, {}
+
+    async def consultar_precio(self, parametros, datos):
+        horario_id = _entero(parametros.get('horario_id'), "Se requiere horario_id")
+        return 200, {'horario_id': horario_id,
+                     'precio': await self.ejecutar(self.ventas.precio_boleto, horario_id)}
+
+    async def consultar_retenciones(self, parametros, datos):
+        horario_id, fecha_viaje, terminal = _viaje_y_terminal(parametros)
+        retenidos = await self.ejecutar(self.retenciones.retenidos_por_otros, horario_id, fecha_viaje, terminal)
+        return 200, {'retenidos': sorted(retenidos)}
+
+    async def retener_asientos(self, parametros, datos):
+        if not isinstance(datos, dict) or not isinstance(datos.get('asientos'), list):
+            raise DatosInvalidos("Se esperaba un objeto JSON con la lista de asientos")
+        horario_id, fecha_viaje, terminal = _viaje_y_terminal(datos)
+        asientos = [_entero(a, "Número de asiento no válido") for a in datos['asientos']]
+        ajenos = await self.ejecutar(self.retenciones.retener, horario_id, fecha_viaje, asientos, terminal)
+        return 200, {'ajenos': ajenos}
+
+    async def soltar_retenciones(self, parametros, datos):
+        terminal = parametros.get('terminal')
+        if not terminal:
+            raise DatosInvalidos("Se requiere terminal")
+        await self.ejecutar(self.retenciones.soltar_terminal, terminal)
+        return 200, {}
+
+    async def vender_boletos(self, parametros, datos):
+        # Precio y fecha de compra no se aceptan del cliente: los fija el servidor
+        campos = ('nombre', 'apellidos', 'horario_id', 'fecha_viaje', 'asientos', 'terminal')
+        if not isinstance(datos, dict):
+            raise DatosInvalidos("Se esperaba un objeto JSON")
+        argumentos = {campo: datos.get(campo) for campo in campos}
+        venta = await self.ejecutar(lambda: self.ventas.vender_boletos(**argumentos))
+        return 201, venta._asdict()
+
+    async def buscar_clientes(self, parametros, datos):
+        busqueda = parametros.get('q', '').strip()
+        try:
+            limite = min(int(parametros.get('limite', 50)), 500)
+        except ValueError:
+            raise DatosInvalidos("limite debe ser un número entero") from None
+
+        def consultar():
+            conn = self.db.conectar()
+            try:
+                expresion = expresion_busqueda_pasajeros(conn, busqueda) if busqueda else None
+                if expresion is None:
+                    cursor = conn.execute(CONSULTA_CLIENTES + " ORDER BY ultima_compra DESC, id DESC LIMIT ?",
+                                          (limite,))
+                else:
+                    cursor = conn.execute("SELECT * FROM (" + CONSULTA_BUSQUEDA_PASAJEROS + ") ORDER BY rango, id LIMIT ?",
+                                          (expresion, limite))
+                columnas = [c[0] for c in cursor.description]
+                return [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+            finally:
+                conn.close()
+
+        return 200, {'clientes': await self.ejecutar(consultar)}
+
+    async def consultar_saldo(self, parametros, datos):
+        return 200, {'saldo': await self.ejecutar(self.finanzas.saldo)}
+
+    async def consultar_sql(self, parametros, datos):
+        if self.db.estadisticas is None:
+            raise RegistroNoEncontrado("La medición de SQL no está activa (use --sql-lenta-ms)")
+        return 200, self.db.estadisticas.volcado()
+
+    # ---- HTTP ----------------------------------------------------------------
+    async def atender(self, reader, writer):
+        """Atiende las peticiones de una conexión (HTTP/1.1 con keep-alive)"""
+        try:
+            while True:
+                peticion = await self._leer_peticion(reader)
+                if peticion is None:
+                    break
+                metodo, ruta, parametros, datos, mantener = peticion
+                estado, cuerpo = await self._despachar(metodo, ruta, parametros, datos)
+                self._escribir_respuesta(writer, estado, cuerpo, mantener)
+                await writer.drain()
+                if not mantener:
+                    break
+        except ErrorHTTP as e:
+            self._escribir_respuesta(writer, e.estado, {'error': str(e), 'tipo': 'ErrorHTTP'}, False)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass  # Cliente desconectado o servidor cerrándose
+        finally:
+            writer.close()
+
+    async def _leer_peticion(self, reader):
+        linea = await reader.readline()
+        if not linea:
+            return None
+        try:
+            metodo, objetivo, version = linea.decode('latin-1').split()
+        except ValueError:
+            raise ErrorHTTP(400, "Línea de petición no válida") from None
+        encabezados = {}
+        while True:
+            linea = await reader.readline()
+            if linea in (b'\r\n', b'\n', b''):
+                break
+            nombre, _, valor = linea.decode('latin-1').partition(':')
+            encabezados[nombre.strip().lower()] = valor.strip()
+
+        try:
+            longitud = int(encabezados.get('content-length') or 0)
+        except ValueError:
+            raise ErrorHTTP(400, "Content-Length no válido") from None
+        if longitud > TAMAÑO_MAXIMO_CUERPO:
+            raise ErrorHTTP(413, "Cuerpo demasiado grande")
+        datos = None
+        if longitud:
+            try:
+                datos = json.loads(await reader.readexactly(longitud))
+            except ValueError:
+                raise ErrorHTTP(400, "JSON no válido") from None
+
+        url = urllib.parse.urlsplit(objetivo)
+        parametros = dict(urllib.parse.parse_qsl(url.query))
+        conexion = encabezados.get('connection', '').lower()
+        mantener = conexion != 'close' if version == 'HTTP/1.1' else conexion == 'keep-alive'
+        return metodo.upper(), url.path, parametros, datos, mantener
+
+    async def _despachar(self, metodo, ruta, parametros, datos):
+        manejador = self.rutas.get((metodo, ruta))
+        if manejador is None:
+            if any(r == ruta for _, r in self.rutas):
+                return 405, {'error': f"Método {metodo} no permitido en {ruta}", 'tipo': 'ErrorHTTP'}
+            return 404, {'error': f"Ruta desconocida: {ruta}", 'tipo': 'ErrorHTTP'}
+        try:
+            return await manejador(parametros, datos)
+        except Exception as e:
+            estado = next((codigo for tipo, codigo in ESTADOS_ERROR.items() if isinstance(e, tipo)), 500)
+            cuerpo = {'error': str(e), 'tipo': type(e).__name__}
+            if isinstance(e, AsientosOcupados):
+                cuerpo['asientos'] = e.asientos
+            return estado, cuerpo
+
+    def _escribir_respuesta(self, writer, estado, cuerpo, mantener):
+        datos = json.dumps(cuerpo, ensure_ascii=False).encode('utf-8')
+        encabezados = (
+            f"HTTP/1.1 {estado} {RAZONES.get(estado, '')}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(datos)}\r\n"
+            f"Connection: {'keep-alive' if mantener else 'close'}\r\n\r\n"
+        )
+        writer.write(encabezados.encode('latin-1') + datos)
+
+
+def preparar_bd(ruta, perfil=None, estadisticas=None):
+    """Abre la base con el perfil indicado y aplica el esquema y sus migraciones"""
+    db = GestorConexiones(ruta, perfil_almacenamiento(perfil), estadisticas=estadisticas)
+    erp = SistemaERP.__new__(SistemaERP)  # Sin ventana Tk: solo se usa el esquema
+    erp.db = db
+    erp.crear_base_datos()
+    erp.crear_usuarios_predefinidos()  # Las taquillas con API no crean el esquema ni los usuarios
+    return db
+
+
+async def servir(servidor, host, puerto, listo=None):
+    """Atiende hasta que se cancele la tarea; `listo` recibe el puerto real (útil con puerto 0)"""
+    tcp = await asyncio.start_server(servidor.atender, host, puerto)
+    puerto_real = tcp.sockets[0].getsockname()[1]
+    if listo is not None:
+        listo(puerto_real)
+    async with tcp:
+        await tcp.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor HTTP/JSON de venta de boletos")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8765)
+    parser.add_argument('--bd', default=DB_PATH, help="Base de datos de la que el servidor es dueño")
+    parser.add_argument('--trabajadores', type=int, default=4, help="Hilos para las consultas a SQLite")
+    parser.add_argument('--ventana-ms', type=float, default=2.0,
+                        help="Espera para agrupar consultas de disponibilidad")
+    parser.add_argument('--perfil', choices=list(PERFILES_ALMACENAMIENTO), default=None)
+    parser.add_argument('--sql-lenta-ms', type=float, default=None,
+                        help="Medir las sentencias SQL (GET /sql) y registrar las que tarden más de esto")
+    args = parser.parse_args()
+
+    estadisticas = EstadisticasSQL(args.sql_lenta_ms) if args.sql_lenta_ms is not None else None
+    servidor = ServidorVentas(preparar_bd(args.bd, args.perfil, estadisticas),
+                              args.trabajadores, args.ventana_ms / 1000)
+    try:
+        asyncio.run(servir(servidor, args.host, args.puerto,
+                           lambda puerto: print(f"Servidor de ventas en http://{args.host}:{puerto}")))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.cerrar()
+
+
+if __name__ == "__main__":
+    main()
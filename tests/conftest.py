@@ -0,0 +1,43 @@
+# Fixtures compartidas: una base temporal con el esquema de prueba.py y un viaje de ejemplo
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prueba import SistemaERP, GestorConexiones  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    """GestorConexiones sobre una base nueva con dos horarios de una ruta"""
+    gestor = GestorConexiones(str(tmp_path / "erp.db"))
+    erp = SistemaERP.__new__(SistemaERP)  # Sin ventana Tk: solo el esquema
+    erp.db = gestor
+    erp.crear_base_datos()
+    with gestor.transaccion() as conn:
+        ruta_id = conn.execute("""
+            INSERT INTO rutas (origen, destino, distancia, tiempo_estimado, precio_boleto)
+            VALUES ('Origen', 'Destino', 100, '2h', 250)
+        """).lastrowid
+        for hora in ("08:00", "12:00"):
+            autobus_id = conn.execute("""
+                INSERT INTO autobuses (marca, modelo, año, capacidad, estado)
+                VALUES ('Marca', 'Modelo', 2024, 24, 'Nuevo')
+            """).lastrowid
+            conn.execute("""
+                INSERT INTO horarios (ruta_id, autobus_id, hora_salida, hora_llegada, dias_semana)
+                VALUES (?, ?, ?, '18:00', 'L-D')
+            """, (ruta_id, autobus_id, hora))
+    yield gestor
+    gestor.cerrar_todas()
+
+
+@pytest.fixture
+def horarios(db):
+    conn = db.conectar()
+    try:
+        return [fila[0] for fila in conn.execute("SELECT id FROM horarios ORDER BY id")]
+    finally:
+        conn.close()
@@ -0,0 +1,58 @@
+import sqlite3
+
+import pytest
+
+from prueba import (AsientosOcupados, EscritorLibro, GestorConexiones, MotorAsientos, VentasService,
+                    reservar_asientos)
+
+
+@pytest.fixture
+def ventas(db):
+    libro = EscritorLibro(db)
+    servicio = VentasService(db, libro, MotorAsientos(db))
+    yield servicio
+    libro.detener()
+
+
+def test_venta_propia_conserva_los_mapas_de_otros_viajes(ventas, horarios):
+    motor = ventas.asientos
+    vendido, otro = (horarios[0], '2030-01-01'), (horarios[1], '2030-01-01')
+    mapa_vendido = motor.mapa(*vendido)
+    mapa_otro = motor.mapa(*otro)
+
+    ventas.vender_boletos("Ana", "Pérez", vendido[0], vendido[1], [3, 4])
+
+    # El commit del escritor del libro no cuenta como cambio ajeno
+    assert motor.mapa(*otro) is mapa_otro
+    assert motor.mapa(*vendido) is mapa_vendido
+    assert 3 not in motor.libres(*vendido) and 4 not in motor.libres(*vendido)
+
+
+def test_venta_de_otra_conexion_descarta_los_mapas(db, ventas, horarios):
+    motor = ventas.asientos
+    viaje = (horarios[0], '2030-01-01')
+    motor.mapa(*viaje)
+
+    otra = GestorConexiones(db.ruta)
+    libro = EscritorLibro(otra)
+    try:
+        VentasService(otra, libro).vender_boletos("Luis", "Gómez", viaje[0], viaje[1], [7])
+    finally:
+        libro.detener()
+        otra.cerrar_todas()
+
+    assert 7 not in motor.libres(*viaje)
+
+
+def test_reserva_reporta_los_asientos_ocupados(db, horarios):
+    with db.transaccion() as conn:
+        reservar_asientos(conn.cursor(), horarios[0], '2030-01-01', [5], "Ana", "Pérez", '2030-01-01', 250)
+    with pytest.raises(AsientosOcupados) as error, db.transaccion() as conn:
+        reservar_asientos(conn.cursor(), horarios[0], '2030-01-01', [4, 5], "Luis", "Gómez", '2030-01-01', 250)
+    assert error.value.asientos == [5]
+
+
+def test_reserva_propaga_otras_violaciones_de_integridad(db, horarios):
+    # precio NULL viola NOT NULL sin que ningún asiento esté ocupado
+    with pytest.raises(sqlite3.IntegrityError), db.transaccion() as conn:
+        reservar_asientos(conn.cursor(), horarios[0], '2030-01-01', [4], "Luis", "Gómez", '2030-01-01', None)
@@ -0,0 +1,27 @@
+from prueba import a_una_edicion, expresion_busqueda_pasajeros
+
+
+def _agregar_pasajeros(db, apellidos):
+    with db.transaccion() as conn:
+        conn.executemany("""
+            INSERT INTO pasajeros (nombre, apellidos, boletos_comprados, ultima_compra, total_gastado)
+            VALUES (?, ?, 1, '2030-01-01', 250)
+        """, [(f"Cliente {i}", apellido) for i, apellido in enumerate(apellidos)])
+        conn.execute("INSERT INTO pasajeros_fts (pasajeros_fts) VALUES ('rebuild')")
+
+
+def test_a_una_edicion():
+    assert a_una_edicion("gonzalez", "gonzales")     # cambiada
+    assert a_una_edicion("hernandez", "hernadez")    # borrada
+    assert a_una_edicion("perez", "pereez")          # agregada
+    assert a_una_edicion("garcia", "garica")         # vecinas intercambiadas
+    assert not a_una_edicion("garcia", "garcia")
+    assert not a_una_edicion("garcia", "gracai")
+
+
+def test_variantes_mas_frecuentes_primero(db):
+    _agregar_pasajeros(db, ["Gonzales"] * 5 + ["Gonzalex"] * 2 + ["Bonzalez"] + ["Ramírez"])
+    expresion = expresion_busqueda_pasajeros(db.obtener(), "González", max_alternativas=2)
+    assert expresion == '("gonzalez"* OR "gonzales"* OR "gonzalex"*)'
+    assert "bonzalez" in expresion_busqueda_pasajeros(db.obtener(), "gonzalez")
+    assert expresion_busqueda_pasajeros(db.obtener(), " ¿? ") is None
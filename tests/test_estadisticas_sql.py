@@ -0,0 +1,19 @@
+from prueba import EstadisticasSQL, GestorConexiones
+
+
+def test_cursor_descartado_se_registra_en_la_siguiente_sentencia(tmp_path, monkeypatch):
+    estadisticas = EstadisticasSQL(umbral_lenta_ms=0)
+    db = GestorConexiones(str(tmp_path / "erp.db"), estadisticas=estadisticas)
+    conn = db.obtener()
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(5)])
+    explicadas = []
+    monkeypatch.setattr("prueba.plan_de_consulta", lambda *args: explicadas.append(args[1]) or [])
+
+    conn.execute("SELECT x FROM t WHERE x > ?", (1,)).fetchone()  # El cursor se descarta sin agotarse
+    assert explicadas == []  # Ni EXPLAIN ni registro dentro de __del__
+    assert "SELECT x FROM t WHERE x > ?" not in {f['forma'] for f in estadisticas.resumen()}
+
+    conn.execute("SELECT 1").fetchall()
+    assert explicadas[0] == "SELECT x FROM t WHERE x > ?"
+    assert "SELECT x FROM t WHERE x > ?" in {f['forma'] for f in estadisticas.resumen()}
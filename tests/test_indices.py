@@ -0,0 +1,12 @@
+import pytest
+
+from prueba import plan_de_consulta
+from verificar_indices import CONSULTAS_CRITICAS
+
+
+@pytest.mark.parametrize("consulta, parametros, indice",
+                         [(sentencia[0], sentencia[1], indice) for _, sentencia, indice in CONSULTAS_CRITICAS],
+                         ids=[descripcion for descripcion, _, _ in CONSULTAS_CRITICAS])
+def test_consulta_usa_su_indice(db, consulta, parametros, indice):
+    plan = plan_de_consulta(db.obtener(), consulta, parametros)
+    assert any(indice in linea for linea in plan), plan
@@ -0,0 +1,24 @@
+import asyncio
+
+from servidor_api import ServidorVentas
+
+
+def test_boletos_ignora_precio_y_fecha_del_cliente(db, horarios):
+    servidor = ServidorVentas(db, trabajadores=1)
+    try:
+        estado, venta = asyncio.run(servidor.vender_boletos({}, {
+            'nombre': 'Ana', 'apellidos': 'Pérez', 'horario_id': horarios[0],
+            'fecha_viaje': '2030-01-01', 'asientos': [1, 2],
+            'precio_unitario': -5000000, 'fecha_compra': '2001-01-01 00:00:00',
+        }))
+    finally:
+        servidor.cerrar()
+    assert estado == 201
+    assert venta['total'] == 500.0  # 2 boletos a 250, el precio de la ruta
+    conn = db.conectar()
+    try:
+        precio, fecha_compra = conn.execute("SELECT precio, fecha_compra FROM boletos").fetchone()
+    finally:
+        conn.close()
+    assert precio == 250.0
+    assert not fecha_compra.startswith('2001')
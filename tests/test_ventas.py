@@ -0,0 +1,30 @@
+import pytest
+
+from prueba import (DatosInvalidos, EscritorLibro, FinanzasService, MotorAsientos, VentasService)
+
+
+@pytest.fixture
+def ventas(db):
+    libro = EscritorLibro(db)
+    servicio = VentasService(db, libro, MotorAsientos(db))
+    yield servicio
+    libro.detener()
+
+
+@pytest.mark.parametrize("asientos", [[999], [-1], [0], [3, 3]])
+def test_rechaza_asientos_fuera_del_autobus_o_repetidos(ventas, horarios, asientos):
+    saldo = FinanzasService(ventas.db, ventas.libro).saldo()
+    with pytest.raises(DatosInvalidos):
+        ventas.vender_boletos("Ana", "Pérez", horarios[0], '2030-01-01', asientos)
+    assert FinanzasService(ventas.db, ventas.libro).saldo() == saldo
+
+
+@pytest.mark.parametrize("precio", [-5000000, 0, "nan", "inf", "abc"])
+def test_rechaza_precios_no_validos(ventas, horarios, precio):
+    with pytest.raises(DatosInvalidos):
+        ventas.vender_boletos("Ana", "Pérez", horarios[0], '2030-01-01', [1], precio)
+
+
+def test_cobra_el_precio_de_la_ruta(ventas, horarios):
+    venta = ventas.vender_boletos("Ana", "Pérez", horarios[0], '2030-01-01', [1, 2], 1.0)
+    assert venta.total == 500.0
@@ -0,0 +1,102 @@
+# Verificación de planes de consulta (EXPLAIN QUERY PLAN) para las rutas críticas
+# Crea el esquema de prueba.py en una base temporal y comprueba que cada consulta
+# frecuente, tomada de las mismas constantes que usa la aplicación, use el índice
+# esperado en lugar de recorrer la tabla completa. tests/test_indices.py corre
+# la misma verificación con pytest.
+# Termina con código 1 si alguna consulta dejó de usar su índice.
+#
+# Uso:
+#   python verificar_indices.py
+
+import os
+import sys
+import tempfile
+
+from prueba import (
+    SistemaERP, GestorConexiones, CursorKeyset, plan_de_consulta,
+    CONSULTA_ASIENTOS_VENDIDOS, CONSULTA_ASIENTOS_EN_CONFLICTO, CONSULTA_CLIENTES,
+    CONSULTA_BOLETOS_CLIENTE, CONSULTA_INFORME_VENTAS_RUTA, CONSULTA_INFORME_INGRESOS_EGRESOS,
+    CONSULTA_INFORME_GASTOS_CATEGORIA, CONSULTA_DESCONTAR_VENTAS_HORARIO,
+    CONSULTA_EXISTENCIAS_HISTORIAL, CONSULTA_TRANSACCIONES, FILTROS_TRANSACCIONES,
+    consulta_inventario, consulta_historial_compras, consulta_salidas,
+)
+
+
+def pagina(sentencia, orden, clave, descendente=True, tam_pagina=100):
+    """(consulta, parámetros) de la página que sigue a `clave`, tal como la arma CursorKeyset"""
+    consulta, parametros = sentencia
+    return CursorKeyset(None, consulta, orden, parametros, descendente, tam_pagina).sentencia_siguiente(clave)
+
+
+RANGO = ('2025-01-01', '2025-01-31 23:59:59')
+
+# (descripción, (consulta, parámetros), índice que debe aparecer en el plan).
+# Las consultas son las mismas constantes y funciones que usa prueba.py
+CONSULTAS_CRITICAS = [
+    ("Asientos vendidos de un viaje (MotorAsientos)",
+     (CONSULTA_ASIENTOS_VENDIDOS, (1, '2025-01-01')), 'ux_boletos_asiento'),
+    ("Asientos en conflicto (reservar_asientos)",
+     (CONSULTA_ASIENTOS_EN_CONFLICTO.format("?,?"), (1, '2025-01-01', 1, 2)), 'ux_boletos_asiento'),
+    ("Página de clientes por última compra (cargar_todos_clientes)",
+     pagina((CONSULTA_CLIENTES, ()), ("ultima_compra", "id"), ('2025-01-01', 500)),
+     'idx_pasajeros_ultima_compra'),
+    ("Boletos de un cliente (mostrar_detalle_cliente)",
+     (CONSULTA_BOLETOS_CLIENTE, (1,)), 'idx_boletos_pasajero_id'),
+    ("Ventas por ruta desde acumulados (generar_informe_ventas_ruta)",
+     (CONSULTA_INFORME_VENTAS_RUTA, RANGO), 'sqlite_autoindex_ventas_diarias_ruta_1'),
+    ("Finanzas desde acumulados (generar_informe_ingresos_egresos)",
+     (CONSULTA_INFORME_INGRESOS_EGRESOS, RANGO), 'sqlite_autoindex_movimientos_diarios_1'),
+    ("Compras por categoría desde acumulados (generar_informe_gastos_categoria)",
+     (CONSULTA_INFORME_GASTOS_CATEGORIA, RANGO), 'sqlite_autoindex_compras_diarias_categoria_1'),
+    ("Boletos de un horario por día (descontar_ventas_horario)",
+     (CONSULTA_DESCONTAR_VENTAS_HORARIO, (1, 1)), 'ux_boletos_asiento'),
+    ("Compras agrupadas por producto (reconstruir_existencias)",
+     (CONSULTA_EXISTENCIAS_HISTORIAL, ()), 'idx_compras_producto'),
+    ("Salidas agrupadas por producto (reconstruir_existencias)",
+     (CONSULTA_EXISTENCIAS_HISTORIAL, ()), 'idx_salidas_producto'),
+    ("Inventario por tipo de producto (filtrar_inventario)",
+     consulta_inventario('Autobús'), 'sqlite_autoindex_existencias_1'),
+    ("Página de transacciones anteriores (cargar_transacciones)",
+     pagina((CONSULTA_TRANSACCIONES + FILTROS_TRANSACCIONES["Ingresos"], ()), ("id",), (500,),
+            tam_pagina=200), 'INTEGER PRIMARY KEY'),
+    ("Página del historial de compras (actualizar_historial)",
+     pagina(consulta_historial_compras(), ("fecha", "id"), ('2025-01-01', 500)), 'idx_compras_fecha'),
+    ("Página del historial de compras por tipo (actualizar_historial)",
+     pagina(consulta_historial_compras('Autobús'), ("fecha", "id"), ('2025-01-01', 500)),
+     'idx_compras_tipo_fecha'),
+    ("Página de salidas por rango de fechas (filtrar_salidas)",
+     pagina(consulta_salidas(*RANGO), ("fecha", "id"), ('2025-01-01', 500)), 'idx_salidas_fecha'),
+]
+
+
+def verificar(conn):
+    """Devuelve la lista de (descripción, plan) de las consultas que no usan su índice"""
+    fallas = []
+    for descripcion, (consulta, parametros), indice in CONSULTAS_CRITICAS:
+        plan = plan_de_consulta(conn, consulta, parametros)
+        if not any(indice in linea for linea in plan):
+            fallas.append((descripcion, indice, plan))
+    return fallas
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directorio:
+        db = GestorConexiones(os.path.join(directorio, 'planes.db'))
+        erp = SistemaERP.__new__(SistemaERP)  # Sin ventana Tk: solo se usa el esquema
+        erp.db = db
+        erp.crear_base_datos()
+        fallas = verificar(db.obtener())
+        db.cerrar_todas()
+
+    for descripcion, _, indice in CONSULTAS_CRITICAS:
+        estado = "FALLA" if any(f[0] == descripcion for f in fallas) else "ok"
+        print(f"[{estado:>5}] {descripcion} -> {indice}")
+    for descripcion, indice, plan in fallas:
+        print(f"\n{descripcion}: se esperaba {indice}")
+        for linea in plan:
+            print(f"    {linea}")
+    sys.exit(1 if fallas else 0)
+
+
+if __name__ == "__main__":
+    main()